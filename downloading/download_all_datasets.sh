@@ -3,6 +3,6 @@
 file="$1"
 while read -r doi
 do
-	sbatch ./download_dataset.sh $doi $2
+	sbatch ./download_dataset.sh $doi $2 $3
 	sleep 2 
 done < "$file"
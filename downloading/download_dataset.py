@@ -1,47 +1,41 @@
 from __future__ import print_function
 
-import requests
-import json
 import os
 import sys
-import pickle
 
-# make a new directory to store the dataset
-# (if one doesn't exist)
-storage_path = "/n/regal/seltzer_lab/cscn/dataverse_data"
-
-if not os.path.exists(storage_path):   
-	os.makedirs(storage_path)
-
-# get DOI from command-line arguments
-doi = sys.argv[len(sys.argv) - 2]
-dataverse_key = sys.argv[len(sys.argv) - 1] # example: "3b0777ab-4af9-4b3a-971e-5c84ac75926b"
-
-# query the dataverse API for all the files in a dataverse
-files = requests.get("https://dataverse.harvard.edu/api/datasets/:persistentId",
-					 params= {"persistentId": doi, "key": dataverse_key})\
-					 .json()['data']['latestVersion']['files']
-
-# convert DOI into a friendly directory name by replacing slashes and colons
-doi_direct = storage_path + '/' + doi.replace("/", "-").replace(":", "--")
+# the download engine lives with the rest of the helpers in odyssey_scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+								'..', 'odyssey_scripts'))
+from helpers import download_datasets, doi_to_directory, snapshot_datasets
 
-# make a new directory to store the dataset
-if not os.path.exists(doi_direct):   
-	os.makedirs(doi_direct)
-
-# for each file result
-for file in files:
-	# parse the filename and fileid 
-	filename = file['dataFile']['filename']
-	fileid = file['dataFile']['id']
-
-	# query the API for the file contents
-	response = requests.get("https://dataverse.harvard.edu/api/access/datafile/" + str(fileid),
-							params={"key": dataverse_key})
-
-	# write the response to correctly-named file in the dataset directory
-	with open(doi_direct + "/" + filename, 'w') as handle:
-		handle.write(response.content)
-
-# print out the dataset directory name for the shell script
-print(doi_direct, end='')
\ No newline at end of file
+# directory to store the datasets in
+storage_path = "/n/regal/seltzer_lab/cscn/dataverse_data"
+# directory to keep the pristine snapshots of the datasets in (on the same filesystem)
+snapshot_path = "/n/regal/seltzer_lab/cscn/dataverse_snapshots"
+
+# with "--sync", only fetch files that are new or changed since the last download
+sync = "--sync" in sys.argv
+# with "--snapshot", record a pristine snapshot of each downloaded dataset, which
+# reset_datasets.py can reset it to
+snapshot = "--snapshot" in sys.argv
+args = [arg for arg in sys.argv[1:] if arg not in ["--sync", "--snapshot"]]
+
+# get DOIs from command-line arguments (any number of them can precede the key)
+dois = args[:-1]
+dataverse_key = args[len(args) - 1] # example: "3b0777ab-4af9-4b3a-971e-5c84ac75926b"
+
+# download the files of all the datasets concurrently
+results = download_datasets(dois, storage_path, dataverse_key, sync=sync)
+
+# snapshot the datasets that downloaded, replacing any snapshot of an older version
+if snapshot:
+	snapshot_datasets(storage_path, snapshot_path, overwrite=True,
+					  doi_directs=[doi_to_directory(doi) for doi in dois if results[doi]])
+
+# report failed datasets to stderr
+for doi in dois:
+	if not results[doi]:
+		print("Failed to download " + doi, file=sys.stderr)
+
+# print out the dataset directory names for the shell script
+print(' '.join(storage_path + '/' + doi_to_directory(doi) for doi in dois), end='')
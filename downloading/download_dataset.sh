@@ -9,4 +9,4 @@
 
 # echo "Downloading dataset corresponding to DOI: $1..."
 echo $1 >&2
-doi_direct=$(python download_dataset.py $1 $2)
\ No newline at end of file
+doi_direct=$(python download_dataset.py $3 $1 $2)
\ No newline at end of file
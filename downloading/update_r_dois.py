@@ -0,0 +1,20 @@
+from __future__ import print_function
+
+import os
+import sys
+
+# the discovery helpers live with the rest of the helpers in odyssey_scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+								'..', 'odyssey_scripts'))
+from helpers import update_r_dois
+
+# get API key and (optionally) the doi file from command-line arguments
+dataverse_key = sys.argv[1]
+doi_path = sys.argv[2] if len(sys.argv) > 2 else 'r_dois.txt'
+
+# add dois published since the last crawl to the doi file
+new_dois = update_r_dois(dataverse_key, doi_path)
+
+# print out the new dois, one-per-line, e.g. for download_all_datasets.sh
+for doi in new_dois:
+	print(doi, end='')
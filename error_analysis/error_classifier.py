@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pd
+
+from run_log import distinct_values, compact_run_log, unique_names
+
+# rules labelling the errors of the run log, checked in order:
+# (label, regular expression, labels of earlier rules that rule this one out)
+ERROR_RULES = [
+	('is_library_error', r"library\s*\(", []),
+	('is_wd_error', r"setwd\s*\(", []),
+	('is_mirror_error', r"without setting a mirror", []),
+	('is_file_error', r"file\s*\(|cannot open the connection|No such file",
+	 ['is_library_error', 'is_wd_error']),
+]
+# details to pull out of the errors: (column, regular expression with one group)
+ERROR_EXTRACTIONS = [
+	('missing_package', r"there is no package called .([\w.]+)."),
+]
+# category of the runs that didn't error
+SUCCESS_CATEGORY = 'success'
+# category of the errors that no rule matches
+OTHER_CATEGORY = 'other'
+
+
+def classify_distinct_errors(errors, rules=ERROR_RULES, extractions=ERROR_EXTRACTIONS):
+	"""Label a set of distinct error strings with the rules
+	Parameters
+	----------
+	errors : pandas.Index
+			 distinct error strings
+	rules : list of (string, string, list of string)
+			(label, regular expression, labels that rule it out) for each rule, in order
+	extractions : list of (string, string)
+				  (column, regular expression with one group) for each detail to extract
+	Returns
+	-------
+	labels_df : pandas.DataFrame
+				one row per error, with a boolean column per rule, a column per extraction
+				and an "error_category" column naming the first rule that matched
+				(without the "is_" prefix and "_error" suffix)
+	"""
+	errors = pd.Series(errors, dtype=object)
+	labels_df = pd.DataFrame(index=errors.index)
+	for label, pattern, excluded_by in rules:
+		matches = errors.str.contains(pattern, regex=True, na=False)
+		for exclusion in excluded_by:
+			matches &= ~labels_df[exclusion]
+		labels_df[label] = matches.astype(bool)
+	for column, pattern in extractions:
+		labels_df[column] = errors.str.extract(pattern, expand=False)
+
+	# the category is the first rule that matched, if any
+	categories = np.array([label.replace('is_', '', 1).replace('_error', '') for label, _, _ in rules] +
+						  [OTHER_CATEGORY], dtype=object)
+	matched = labels_df[[label for label, _, _ in rules]].values
+	first_match = np.where(matched.any(axis=1), matched.argmax(axis=1), len(rules)) \
+		if len(rules) else np.zeros(len(errors), dtype=int)
+	error_category = categories[first_match]
+	error_category[(errors == SUCCESS_CATEGORY).values] = SUCCESS_CATEGORY
+	labels_df['error_category'] = error_category
+	return labels_df
+
+def classify_errors(errors, rules=ERROR_RULES, extractions=ERROR_EXTRACTIONS):
+	"""Label every error of the run log with the rules, classifying each distinct error once
+	Parameters
+	----------
+	errors : pandas.Series
+			 the error column of the run log, categorical or not
+	rules : list of (string, string, list of string)
+			(label, regular expression, labels that rule it out) for each rule, in order
+	extractions : list of (string, string)
+				  (column, regular expression with one group) for each detail to extract
+	Returns
+	-------
+	labels_df : pandas.DataFrame
+				the labels of every row (see classify_distinct_errors), with the same index
+				as errors; missing errors match no rule
+	"""
+	codes, uniques = distinct_values(errors)
+	labels_df = classify_distinct_errors(uniques, rules, extractions)
+	# add a row of labels for missing errors, which the codes point at with -1
+	missing = {label: False for label, _, _ in rules}
+	missing.update({column: np.nan for column, _ in extractions})
+	missing['error_category'] = OTHER_CATEGORY
+	labels_df = pd.concat([labels_df, pd.DataFrame([missing])], ignore_index=True)
+	codes = np.where(codes >= 0, codes, len(uniques))
+
+	rows_df = pd.DataFrame(index=errors.index)
+	for column in labels_df.columns:
+		values = labels_df[column]
+		if values.dtype == bool:
+			rows_df[column] = values.values[codes]
+		else:
+			# share the distinct strings between rows rather than copying them out
+			column_codes, column_uniques = pd.factorize(values)
+			rows_df[column] = pd.Categorical.from_codes(column_codes[codes], column_uniques)
+	return rows_df
+
+def annotate_run_log(run_log_df, rules=ERROR_RULES, extractions=ERROR_EXTRACTIONS):
+	"""Add the columns the error analysis works from to a run log: is_error, is_preproc,
+	   unique_name, the error labels, and the doi without its path
+	Parameters
+	----------
+	run_log_df : pandas.DataFrame
+				 run log, as loaded by run_log.load_run_log
+	rules : list of (string, string, list of string)
+			rules to label the errors with (see classify_errors)
+	extractions : list of (string, string)
+				  details to extract from the errors (see classify_errors)
+	Returns
+	-------
+	run_log_df : pandas.DataFrame
+				 a compact copy of the run log (see run_log.compact_run_log) with the
+				 columns added
+	"""
+	# the unique names are built before the paths are stripped from the dois
+	unique_name = unique_names(run_log_df)
+	run_log_df = compact_run_log(run_log_df)
+	run_log_df['unique_name'] = unique_name
+	labels_df = classify_errors(run_log_df['error'], rules, extractions)
+	for column in labels_df.columns:
+		run_log_df[column] = labels_df[column]
+	return run_log_df
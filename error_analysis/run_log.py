@@ -0,0 +1,181 @@
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+# columns of the master run log written by aggregate_run_data.py
+RUN_LOG_COLUMNS = ['doi', 'filename', 'run_type', 'error']
+# columns with few distinct values, loaded as pandas categoricals. The same as
+# odyssey_scripts/helpers.py's, so that run logs have the same dtypes whichever side built
+# or loaded them
+RUN_LOG_CATEGORICALS = ['doi', 'filename', 'run_type', 'error']
+
+
+def load_run_log(path, columns=None):
+	"""Load a master run log written by aggregate_run_data.py, as csv, parquet or feather
+	   (chosen by the file extension). The columnar formats only read the columns asked for.
+	Parameters
+	----------
+	path : string
+		   path to master_run_log.csv, master_run_log.parquet or master_run_log.feather
+	columns : list of string
+			  columns to load (default: all of them)
+	Returns
+	-------
+	run_log_df : pandas.DataFrame
+				 the run log, with the doi, filename, run_type and error columns
+				 as categoricals
+	"""
+	extension = os.path.splitext(path)[1]
+	if extension == '.parquet':
+		run_log_df = pd.read_parquet(path, columns=columns)
+	elif extension == '.feather':
+		run_log_df = pd.read_feather(path, columns=columns)
+	else:
+		run_log_df = pd.read_csv(path, usecols=columns, dtype=str)
+	# make sure the columns are categoricals whatever format they were stored in
+	for column in RUN_LOG_CATEGORICALS:
+		if column in run_log_df and not isinstance(run_log_df[column].dtype, pd.CategoricalDtype):
+			run_log_df[column] = run_log_df[column].astype('category')
+	return run_log_df
+
+def distinct_values(column):
+	"""Split a column into its distinct values and, for each row, the position of its value
+	Parameters
+	----------
+	column : pandas.Series
+			 column to split, categorical or not
+	Returns
+	-------
+	(codes, uniques) : tuple of (numpy.ndarray, pandas.Index)
+					   position in uniques of each row's value (-1 for missing values),
+					   and the distinct values
+	"""
+	if isinstance(column.dtype, pd.CategoricalDtype):
+		return column.cat.codes.values, column.cat.categories
+	return pd.factorize(column)
+
+def map_distinct(column, function):
+	"""Apply a function to each distinct value of a column, rather than to every row
+	Parameters
+	----------
+	column : pandas.Series
+			 column to map
+	function : function
+			   maps a value of the column to its result
+	Returns
+	-------
+	pandas.Series
+	the result for every row, as a categorical with the same index as column
+	"""
+	codes, uniques = distinct_values(column)
+	results = pd.Index([function(value) for value in np.asarray(uniques, dtype=object)], dtype=object)
+	# the codes index into the results just as they did into the distinct values, but
+	# different values can map to the same result
+	result_codes, result_uniques = pd.factorize(results)
+	codes = np.where(codes >= 0, result_codes[codes], -1)
+	return pd.Series(pd.Categorical.from_codes(codes, result_uniques), index=column.index)
+
+def extract_doi(doi_path):
+	"""Get the dataset directory name from the path R was given to it"""
+	return doi_path.split("/")[-1]
+
+def extract_filename(file_string):
+	"""Get the original name of a script, without its extension or "__preproc__" suffix"""
+	return re.sub('__preproc__', '', '.'.join(file_string.split('.')[:-1]))
+
+def unique_names(run_log_df):
+	"""Name each script as "<dataset directory>/<original script name>", so that a script
+	   and its preprocessed version share a name
+	Parameters
+	----------
+	run_log_df : pandas.DataFrame
+				 run log, with doi and filename columns
+	Returns
+	-------
+	pandas.Series
+	the unique name of every row's script, as a categorical
+	"""
+	dois = map_distinct(run_log_df['doi'], extract_doi)
+	filenames = map_distinct(run_log_df['filename'], extract_filename)
+	# combine the distinct (doi, filename) pairs, not every row, by packing each row's
+	# pair of codes into one integer
+	doi_codes = dois.cat.codes.values.astype(np.int64)
+	filename_codes = filenames.cat.codes.values.astype(np.int64)
+	num_filenames = len(filenames.cat.categories) + 1
+	codes, pair_keys = pd.factorize((doi_codes + 1) * num_filenames + filename_codes + 1)
+	pair_dois, pair_filenames = np.divmod(pair_keys, num_filenames)
+	# a missing doi or filename leaves the name missing
+	present = (pair_dois > 0) & (pair_filenames > 0)
+	names = np.full(len(pair_keys), None, dtype=object)
+	names[present] = (np.asarray(dois.cat.categories, dtype=object)[pair_dois[present] - 1] + '/' +
+					  np.asarray(filenames.cat.categories, dtype=object)[pair_filenames[present] - 1])
+	name_codes, name_uniques = pd.factorize(pd.Index(names, dtype=object))
+	return pd.Series(pd.Categorical.from_codes(name_codes[codes], name_uniques),
+					 index=run_log_df.index)
+
+def compact_run_log(run_log_df, strip_paths=True):
+	"""Store a run log compactly: its strings are interned as categoricals (integer codes
+	   into a lookup table of the distinct values) and its flags as booleans
+	Parameters
+	----------
+	run_log_df : pandas.DataFrame
+				 run log, as loaded by load_run_log
+	strip_paths : bool
+				  whether to reduce the doi column to the dataset directory names
+	Returns
+	-------
+	run_log_df : pandas.DataFrame
+				 a copy of the run log with categorical doi, filename, run_type and error
+				 columns, and boolean is_error and is_preproc columns
+	"""
+	run_log_df = run_log_df.copy()
+	for column in RUN_LOG_CATEGORICALS:
+		if column in run_log_df and not isinstance(run_log_df[column].dtype, pd.CategoricalDtype):
+			run_log_df[column] = run_log_df[column].astype('category')
+	if strip_paths and 'doi' in run_log_df:
+		run_log_df['doi'] = map_distinct(run_log_df['doi'], extract_doi)
+	if 'error' in run_log_df:
+		run_log_df['is_error'] = ~(run_log_df['error'] == 'success').values
+	if 'filename' in run_log_df:
+		codes, filenames = distinct_values(run_log_df['filename'])
+		is_preproc = np.asarray(filenames.str.contains("__preproc__", regex=False), dtype=bool)
+		run_log_df['is_preproc'] = np.where(codes >= 0, is_preproc[codes], False)
+	return run_log_df
+
+def load_compact_run_log(path, columns=None, strip_paths=True):
+	"""Load a master run log compactly (see load_run_log and compact_run_log)
+	Parameters
+	----------
+	path : string
+		   path to master_run_log.csv, master_run_log.parquet or master_run_log.feather
+	columns : list of string
+			  columns to load (default: all of them)
+	strip_paths : bool
+				  whether to reduce the doi column to the dataset directory names
+	Returns
+	-------
+	pandas.DataFrame
+	"""
+	return compact_run_log(load_run_log(path, columns), strip_paths)
+
+def interned_codes(run_log_df):
+	"""Split the categorical columns of a run log into integer codes and lookup tables
+	Parameters
+	----------
+	run_log_df : pandas.DataFrame
+				 run log with categorical columns (see compact_run_log)
+	Returns
+	-------
+	(codes_df, lookup_tables) : tuple of (pandas.DataFrame, dict of string to pandas.Index)
+								the codes of each categorical column (-1 for missing
+								values), and the distinct values the codes index into
+	"""
+	codes_df = pd.DataFrame(index=run_log_df.index)
+	lookup_tables = {}
+	for column in run_log_df.columns:
+		if isinstance(run_log_df[column].dtype, pd.CategoricalDtype):
+			codes_df[column] = run_log_df[column].cat.codes
+			lookup_tables[column] = run_log_df[column].cat.categories
+	return codes_df, lookup_tables
@@ -0,0 +1,188 @@
+import numpy as np
+import pandas as pd
+
+from error_classifier import ERROR_RULES
+from run_log import distinct_values, map_distinct
+
+# the ways each script was run: (is_preproc, run_type)
+VANILLA = (False, 'source')
+PREPROC = (True, 'source')
+# columns identifying one way of running one script
+RUN_KEYS = ['unique_name', 'is_preproc', 'run_type']
+
+
+def add_create_years(run_log_df, doi_to_create_date):
+	"""Add the create date and year of each run's dataset to an annotated run log
+	Parameters
+	----------
+	run_log_df : pandas.DataFrame
+				 run log, as annotated by error_classifier.annotate_run_log
+	doi_to_create_date : dict of string to string
+						 maps each dataset directory name to its create date
+	Returns
+	-------
+	run_log_df : pandas.DataFrame
+				 a copy of the run log with create_date and create_year columns
+	"""
+	run_log_df = run_log_df.copy()
+	# look up the date of each dataset once, not once per run
+	dates = map_distinct(run_log_df['doi'], lambda doi: doi_to_create_date.get(doi, np.nan))
+	run_log_df['create_date'] = pd.to_datetime(dates.astype(object))
+	run_log_df['create_year'] = run_log_df['create_date'].dt.year.astype('Int16')
+	return run_log_df
+
+def add_subjects(run_log_df, doi_to_subject):
+	"""Add a boolean column per subject to a run log, keeping only the runs of datasets
+	   with subject data (as an inner join on doi would)
+	Parameters
+	----------
+	run_log_df : pandas.DataFrame
+				 run log with a categorical doi column of dataset directory names
+				 (see run_log.compact_run_log)
+	doi_to_subject : dict of string to list of string
+					 maps each dataset directory name to its subjects
+	Returns
+	-------
+	run_log_df : pandas.DataFrame
+				 a copy of the run log, with the runs of datasets with subject data
+	"""
+	codes, dois = distinct_values(run_log_df['doi'])
+	subjects = sorted(set(subject for doi_subjects in doi_to_subject.values()
+						  for subject in doi_subjects))
+	subject_codes = {subject: i for i, subject in enumerate(subjects)}
+	# one row of flags per distinct doi, plus one for missing dois
+	has_subject = np.zeros((len(dois) + 1, len(subjects)), dtype=bool)
+	has_data = np.zeros(len(dois) + 1, dtype=bool)
+	for i, doi in enumerate(np.asarray(dois, dtype=object)):
+		if doi in doi_to_subject:
+			has_data[i] = True
+			for subject in doi_to_subject[doi]:
+				has_subject[i, subject_codes[subject]] = True
+	codes = np.where(codes >= 0, codes, len(dois))
+	keep = has_data[codes]
+	run_log_df = run_log_df[keep].copy()
+	for subject in subjects:
+		run_log_df[subject] = has_subject[codes[keep], subject_codes[subject]]
+	return run_log_df
+
+def latest_runs(run_log_df, variant=None):
+	"""Keep only the last run of each script in each way it was run, as the analysis counts them
+	Parameters
+	----------
+	run_log_df : pandas.DataFrame
+				 run log, as annotated by error_classifier.annotate_run_log
+	variant : (bool, string)
+			  only keep the runs of one variant, e.g. VANILLA or PREPROC (default: keep all)
+	Returns
+	-------
+	pandas.DataFrame
+	"""
+	if variant is not None:
+		run_log_df = run_log_df[(run_log_df['is_preproc'] == variant[0]).values &
+								(run_log_df['run_type'] == variant[1]).values]
+	return run_log_df.drop_duplicates(RUN_KEYS, keep="last")
+
+def summarize_runs(run_log_df, by, rules=ERROR_RULES):
+	"""Success and error category rates of the latest runs, grouped by by and by the way the
+	   scripts were run (vanilla or __preproc__, source or provR)
+	Parameters
+	----------
+	run_log_df : pandas.DataFrame
+				 run log, as annotated by error_classifier.annotate_run_log
+	by : string or list of string
+		 columns to group by besides is_preproc and run_type, e.g. "doi", "unique_name"
+		 or "create_year"
+	rules : list of (string, string, list of string)
+			the rules the run log was annotated with, whose labels are summarized
+	Returns
+	-------
+	summary_df : pandas.DataFrame
+				 per group, the number of scripts, errors and successes, the error rate, the
+				 number and share of errors of each category, and whether every script
+				 ran successfully
+	"""
+	by = [by] if isinstance(by, str) else list(by)
+	runs_df = latest_runs(run_log_df)
+	labels = [label for label, _, _ in rules]
+	columns = {'num_scripts': ('unique_name', 'nunique'), 'num_errors': ('is_error', 'sum')}
+	columns.update({label.replace('is_', 'num_', 1): (label, 'sum') for label in labels})
+	summary_df = runs_df.groupby(by + ['is_preproc', 'run_type'], observed=True, sort=True) \
+		.agg(**columns)
+	summary_df['num_successes'] = summary_df['num_scripts'] - summary_df['num_errors']
+	summary_df['error_rate'] = summary_df['num_errors'] / summary_df['num_scripts']
+	for label in labels:
+		count = label.replace('is_', 'num_', 1)
+		# share of the group's errors that fall in the category
+		summary_df[label.replace('is_', '', 1) + '_rate'] = \
+			(summary_df[count] / summary_df['num_errors']).where(summary_df['num_errors'] > 0, 0.0)
+	summary_df['is_perfect'] = summary_df['num_errors'] == 0
+	return summary_df.reset_index()
+
+def perfect_dois(run_log_df, variant=VANILLA):
+	"""Get the datasets in which every script ran successfully
+	Parameters
+	----------
+	run_log_df : pandas.DataFrame
+				 run log, as annotated by error_classifier.annotate_run_log
+	variant : (bool, string)
+			  way of running the scripts to check (default: VANILLA)
+	Returns
+	-------
+	list of string
+	"""
+	runs_df = latest_runs(run_log_df, variant)
+	num_errors = runs_df.groupby('doi', observed=True)['is_error'].sum()
+	return list(num_errors.index[num_errors == 0])
+
+def year_counts(run_log_df, variant=VANILLA):
+	"""Number of scripts and failing scripts by the year their dataset was created
+	Parameters
+	----------
+	run_log_df : pandas.DataFrame
+				 run log, with create_year (see add_create_years)
+	variant : (bool, string)
+			  way of running the scripts to count (default: VANILLA)
+	Returns
+	-------
+	(years_df, grouped_years_df) : tuple of (pandas.DataFrame, pandas.DataFrame)
+								   per year, the number of scripts ("unique_name"), of
+								   failing scripts ("error_count") and the error rate,
+								   followed by the same counts in long form, for plotting
+								   ("create_year", "number", "Count Type")
+	"""
+	runs_df = latest_runs(run_log_df, variant)
+	years_df = runs_df.groupby('create_year')['unique_name'].nunique().to_frame()
+	years_df['error_count'] = runs_df[runs_df['is_error'].values].groupby('create_year')['unique_name'].nunique()
+	years_df['error_count'] = years_df['error_count'].fillna(0).astype(int)
+	years_df = years_df.reset_index()
+	years_df['create_year'] = years_df['create_year'].astype(int)
+	years_df['error_rate'] = years_df['error_count'] / years_df['unique_name']
+
+	grouped_years_df = years_df.melt(id_vars=['create_year'], value_vars=['error_count', 'unique_name'],
+									 var_name='Count Type', value_name='number')
+	grouped_years_df['Count Type'] = grouped_years_df['Count Type'].map(
+		{'error_count': 'Number of Errors', 'unique_name': 'Number of Scripts'})
+	# interleave the two counts of each year, as the plots expect
+	grouped_years_df = grouped_years_df.sort_values(['create_year', 'Count Type'], kind='stable') \
+		.reset_index(drop=True)[['create_year', 'number', 'Count Type']]
+	return years_df, grouped_years_df
+
+def write_summary(summary_df, path, file_format='csv'):
+	"""Write a summary as <path>.<file_format>
+	Parameters
+	----------
+	summary_df : pandas.DataFrame
+				 summary to write
+	path : string
+		   path to write the summary to, without an extension
+	file_format : string
+				  "csv", "parquet" or "feather" (the columnar formats need pyarrow, but
+				  write large summaries many times faster)
+	"""
+	path = path + '.' + file_format
+	if file_format == 'parquet':
+		summary_df.to_parquet(path, index=False)
+	elif file_format == 'feather':
+		summary_df.reset_index(drop=True).to_feather(path)
+	else:
+		summary_df.to_csv(path, index=False)
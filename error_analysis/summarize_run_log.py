@@ -0,0 +1,53 @@
+import os
+import pickle
+import sys
+import time
+
+from helpers import doi_to_directory
+from run_log import load_run_log
+from error_classifier import annotate_run_log
+from summaries import add_create_years, summarize_runs, perfect_dois, year_counts, latest_runs, \
+	write_summary, VANILLA
+
+# accept commandline arguments for the master run log (csv, parquet or feather), the
+# output directory for the summaries and, optionally, the pickle of create dates
+run_log_path = sys.argv[1]
+output_direct = sys.argv[2]
+create_date_path = sys.argv[3] if len(sys.argv) > 3 else None
+# write the summaries in the same format as the run log
+file_format = os.path.splitext(run_log_path)[1][1:]
+if file_format not in ['parquet', 'feather']:
+	file_format = 'csv'
+
+start = time.time()
+run_log_df = annotate_run_log(load_run_log(run_log_path))
+
+# make a new directory to store the summaries (if one doesn't exist)
+if not os.path.exists(output_direct):
+	os.makedirs(output_direct)
+
+# per dataset and per script success and error category rates, for every way of running them
+write_summary(summarize_runs(run_log_df, 'doi'), output_direct + '/doi_summary', file_format)
+write_summary(summarize_runs(run_log_df, 'unique_name'), output_direct + '/file_summary', file_format)
+
+# datasets in which every script ran without preprocessing
+perfect = perfect_dois(run_log_df, VANILLA)
+with open(output_direct + '/perfect_dois.txt', 'w') as handle:
+	for doi in perfect:
+		handle.write(doi + '\n')
+
+if create_date_path:
+	# retrieve create dates from pickle file, converting the dois to directory form
+	with open(create_date_path, 'rb') as handle:
+		doi_to_create_date = pickle.load(handle)
+	doi_to_create_date = {doi_to_directory(doi): date for doi, date in doi_to_create_date.items()}
+	run_log_df = add_create_years(run_log_df, doi_to_create_date)
+	write_summary(summarize_runs(run_log_df, 'create_year'), output_direct + '/year_summary',
+				  file_format)
+	years_df, grouped_years_df = year_counts(run_log_df, VANILLA)
+	write_summary(years_df, output_direct + '/years', file_format)
+	write_summary(grouped_years_df, output_direct + '/grouped_years', file_format)
+
+num_dois = latest_runs(run_log_df, VANILLA)['doi'].nunique()
+print("Summarized {:,} runs of {:,} datasets ({:.1%} perfect) in {:.1f}s".format(
+	len(run_log_df), num_dois, len(perfect) / max(num_dois, 1), time.time() - start))
@@ -0,0 +1,71 @@
+"""
+Micro-benchmark of the preprocessing passes: runs helpers.preprocess_lines, and
+each transform on its own, over a large synthetic R corpus and reports lines
+per second, so that regressions in the rewrite rules show up.
+Usage: python benchmark_preprocess.py [num_lines]
+"""
+from __future__ import print_function
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+scripts_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'odyssey_scripts')
+sys.path.insert(0, scripts_dir)
+import helpers
+from preproc_regression import LINE_TEMPLATES, make_corpus
+
+# ordinary lines of analysis code, which make up most of a real script
+CODE_LINES = [
+	'model <- lm(y ~ x1 + x2, data = df)\n',
+	'print(summary(model))\n',
+	'df$z <- ifelse(df$x > 0, df$x, NA)\n',
+	'for (i in 1:nrow(df)) {\n',
+	'  results[i] <- mean(df[i, ], na.rm = TRUE)\n',
+	'}\n',
+	'# fit the second specification\n',
+	'ggplot(df, aes(x = x1, y = y)) + geom_point()\n',
+	'tab <- table(df$group, df$treatment)\n',
+	'\n',
+]
+
+def make_lines(num_lines, seed=0):
+	"""Generate num_lines lines of synthetic R, one in ten from the preprocessing templates"""
+	rng = random.Random(seed)
+	return [rng.choice(LINE_TEMPLATES) if rng.random() < 0.1 else rng.choice(CODE_LINES)
+			for _ in range(num_lines)]
+
+def lines_per_second(function, lines):
+	start = time.time()
+	function(lines)
+	return len(lines) / (time.time() - start)
+
+if __name__ == "__main__":
+	num_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+	lines = make_lines(num_lines)
+	work_dir = tempfile.mkdtemp()
+	try:
+		# a dataset for the path lookups to search
+		make_corpus(work_dir, num_datasets=1)
+		dataset = os.path.join(work_dir, os.listdir(work_dir)[0])
+		index = helpers.DirectoryIndex(dataset)
+		prelude = helpers.read_prelude(os.path.join(scripts_dir, "install_and_load.R"))
+
+		benchmarks = [
+			("transform_setwd", lambda lines: list(helpers.transform_setwd(lines, dataset, index))),
+			("transform_source", lambda lines: list(helpers.transform_source(lines, dataset, index))),
+			("transform_lib", lambda lines: list(helpers.transform_lib(lines, prelude))),
+			("transform_file_paths", lambda lines: list(helpers.transform_file_paths(
+				lines, "script.R", dataset, False, index))),
+			("maybe_import_operation", lambda lines: [helpers.maybe_import_operation(line)
+													  for line in lines]),
+			("preprocess_lines", lambda lines: helpers.preprocess_lines(
+				lines, "script.R", dataset, prelude, False, index)),
+		]
+		for name, function in benchmarks:
+			print("{:24s} {:12,.0f} lines/s".format(name, lines_per_second(function, lines)))
+	finally:
+		shutil.rmtree(work_dir)
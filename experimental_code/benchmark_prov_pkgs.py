@@ -0,0 +1,174 @@
+"""
+Benchmark of helpers.get_pkgs_from_prov_json: writes a synthetic provR provenance document
+with the given number of activities, loads it, and compares finding its packages with the
+single precompiled package-call pattern and a version dict against the two uncompiled
+re.match calls per activity and linear scan of the installed packages used before,
+checking that every package the old scan finds is still found and counting the
+package-loading lines each recognizes. Before that, it checks packages_from_code on
+lines that have been misread, such as calls inside comments and strings.
+Usage: python benchmark_prov_pkgs.py [num_activities]
+"""
+from __future__ import print_function
+
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'odyssey_scripts'))
+import helpers
+
+PACKAGES = ["dplyr", "ggplot2", "foreign", "reshape2", "data.table", "lme4", "stringr", "stats",
+			"plyr", "xtable", "sandwich", "lmtest", "MASS", "car", "zoo", "readxl"]
+
+CODE_LINES = [
+	'model <- lm(y ~ x1 + x2, data = df)',
+	'print(summary(model))',
+	'df$z <- ifelse(df$x > 0, df$x, NA)',
+	'results[i] <- mean(df[i, ], na.rm = TRUE)',
+	'tab <- table(df$group, df$treatment)',
+]
+
+# lines of R code and the packages packages_from_code must find in them
+PACKAGE_LINE_CASES = [
+	('library(tidyverse) # library(nope)', ['tidyverse']),
+	('# library(nope)\x00library(a)', ['a']),
+	("print('#'); require(b) # require(c)", ['b']),
+	('x <- "# not a comment"; library(d)', ['d']),
+	("cat('library(fake)')", []),
+	('print("library(fake2)")', []),
+	('x <- "open\x00library(e)', ['e']),
+	('p_load(f, # the first\n g)', ['f', 'g']),
+	('pacman::p_load(char = c("dplyr", "tidyr"))', ['dplyr', 'tidyr']),
+	('p_load(char = pkgs)', []),
+	('mylibrary(h); foo::library(i); base::library(j)', ['j']),
+	('library(k, character.only = TRUE); requireNamespace(l); requireNamespace("m")', ['m']),
+]
+
+def package_line(rng, package):
+	"""A line of R loading a package in one of the ways scripts do"""
+	return rng.choice(['library({})', 'library("{}")', "require('{}')", 'library(package = "{}")',
+					   'suppressMessages(library({}))', 'require({}, quietly = TRUE)',
+					   'requireNamespace("{}")', 'pacman::p_load({})',
+					   'library({}); library(zoo)', 'pacman::p_load({}, "zoo")']).format(package)
+
+def write_members(handle, name, members, last=False):
+	"""Write a top-level object of the document a member at a time"""
+	handle.write('"{}": {{\n'.format(name))
+	first = True
+	for key, value in members:
+		if not first:
+			handle.write(',\n')
+		handle.write(json.dumps(key) + ': ' + json.dumps(value))
+		first = False
+	handle.write('\n}' + ('' if last else ',') + '\n')
+
+def make_prov_json(prov_path, num_activities, seed=0):
+	"""Write a synthetic provenance document with num_activities activities, one in a hundred
+	   loading a package, and a data entity, file entity and edges for some of the rest"""
+	rng = random.Random(seed)
+	num_entities = num_activities // 2
+	with open(prov_path, 'w') as handle:
+		handle.write('{\n"prefix": {"prov": "http://www.w3.org/ns/prov#", "rdt": "http://rdatatracker.org/"},\n')
+		activities = (("p{}".format(i), {
+			'rdt:name': package_line(rng, rng.choice(PACKAGES)) if rng.random() < 0.01 else rng.choice(CODE_LINES),
+			'rdt:type': 'Operation', 'rdt:elapsedTime': '0.5', 'rdt:scriptNum': 1,
+			'rdt:startLine': i, 'rdt:startCol': 1, 'rdt:endLine': i, 'rdt:endCol': 20})
+			for i in range(1, num_activities + 1))
+		environment = [('environment', {'rdt:name': 'environment', 'rdt:language': 'R',
+										'rdt:installedPackages': [{'package': package, 'version': '1.{}.0'.format(i)}
+																  for i, package in enumerate(PACKAGES)]})]
+		write_members(handle, 'activity', (member for members in [activities, environment] for member in members))
+		write_members(handle, 'entity', (("d{}".format(i), {
+			'rdt:name': "data_{}.csv".format(i) if i % 50 == 0 else "x{}".format(i),
+			'rdt:type': 'File' if i % 50 == 0 else 'Data', 'rdt:value': str(rng.random()),
+			'rdt:location': "/n/regal/data/data_{}.csv".format(i) if i % 50 == 0 else ''})
+			for i in range(1, num_entities + 1)))
+		write_members(handle, 'wasInformedBy', (("e{}".format(i), {
+			'prov:informant': "p{}".format(i), 'prov:informed': "p{}".format(i + 1)})
+			for i in range(1, num_activities)))
+		write_members(handle, 'wasGeneratedBy', (("pd{}".format(i), {
+			'prov:activity': "p{}".format(i), 'prov:entity': "d{}".format(i)})
+			for i in range(1, num_entities + 1) if i % 100 != 0))
+		write_members(handle, 'used', (("dp{}".format(i), {
+			'prov:entity': "d{}".format(i), 'prov:activity': "p{}".format(i + 1)})
+			for i in range(1, num_entities + 1) if i % 100 == 0), last=True)
+		handle.write('}\n')
+
+def legacy_get_pkgs_from_prov_json(prov_json):
+	"""get_pkgs_from_prov_json as it was before the single pattern"""
+	# regular expression to capture library name
+	library_regex = re.compile(r"library\((?P<lib_name>.*)\)", re.VERBOSE)
+
+	# set of used libraries
+	used_packages = set()
+
+	# Identify libraries being used in script and add them to set
+	for command in prov_json['activity'].values():
+		# extract the package name from the JSON
+		package_match = re.match('^\s*library\s*\((?:.*?package\s*=\s*|\s*)[\"\']([^\"]+)[\"\']',
+								 command['rdt:name'])
+		if not package_match:
+			package_match = re.match('^\s*require\s*\((?:.*?package\s*=\s*|\s*)[\"\']([^\"]+)[\"\']',
+									 command['rdt:name'])
+		# if a package name was found, add to the set
+		if package_match:
+			used_packages.add(package_match.group(1))
+
+	# filter out pre-installed packages
+	used_packages -= helpers.BASE_PACKAGES
+
+	# list of (package, version) tuples
+	packages = []
+
+	# Filter packages in user's environment by which ones were used
+	for package_dict in prov_json['activity']["environment"]["rdt:installedPackages"]:
+		if package_dict["package"] in used_packages:
+			packages.append((package_dict["package"], package_dict["version"]))
+
+	return packages
+
+def timed(function, *args):
+	"""Run function, returning its result and the seconds it took"""
+	start = time.time()
+	result = function(*args)
+	return result, time.time() - start
+
+if __name__ == "__main__":
+	num_activities = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+	for code_line, packages in PACKAGE_LINE_CASES:
+		assert helpers.packages_from_code(code_line) == packages, code_line
+	work_dir = tempfile.mkdtemp()
+	try:
+		prov_path = os.path.join(work_dir, "prov_script.json")
+		make_prov_json(prov_path, num_activities)
+		with open(prov_path, 'r') as handle:
+			prov_json = json.load(handle, object_pairs_hook=OrderedDict)
+		print("{:,} activities, {:.0f} MB document".format(num_activities, os.path.getsize(prov_path) / 1e6))
+
+		legacy, legacy_seconds = timed(legacy_get_pkgs_from_prov_json, prov_json)
+		print("two re.match per activity: {:6.2f}s, {} packages".format(legacy_seconds, len(legacy)))
+		current, seconds = timed(helpers.get_pkgs_from_prov_json, prov_json)
+		print("single pattern:            {:6.2f}s, {} packages ({:.1f}x)".format(
+			seconds, len(current), legacy_seconds / max(seconds, 1e-9)))
+
+		# the old scan only saw quoted names at the start of a line
+		assert set(legacy) <= set(current)
+		installed = dict(package_dict.values() for package_dict in
+						 prov_json['activity']["environment"]["rdt:installedPackages"])
+		expected = set((package, installed[package]) for package in PACKAGES) - \
+			set((package, installed[package]) for package in helpers.BASE_PACKAGES if package in installed)
+		assert set(current) == expected, sorted(expected - set(current))
+
+		# lines loading packages each recognizes, e.g. bare names and pacman::p_load
+		names = [command.get('rdt:name', '') for command in prov_json['activity'].values()]
+		legacy_calls = sum(1 for name in names if re.match(r'^\s*(library|require)\s*\((?:.*?package\s*=\s*|\s*)[\"\']', name))
+		calls = sum(1 for name in names if helpers.packages_from_code(name))
+		print("package-loading lines recognized: {:,} before, {:,} now".format(legacy_calls, calls))
+	finally:
+		shutil.rmtree(work_dir)
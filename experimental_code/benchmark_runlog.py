@@ -0,0 +1,90 @@
+"""
+Benchmark of helpers.get_runlog_data: writes synthetic prov_data/run_log.csv files,
+shaped like the ones get_dataset_reprod.R leaves behind, for 10k and 100k datasets
+and times aggregating them with the default thread pool and with a single reader,
+against the old loop that concatenated one log at a time (only run on the smaller
+corpora, since it takes quadratic time). The thread pool pays off on network
+filesystems, where each read waits on a metadata round-trip.
+Usage: python benchmark_runlog.py [num_datasets ...]
+"""
+from __future__ import print_function
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'odyssey_scripts'))
+import helpers
+
+# largest corpus to run the old aggregation on
+MAX_LEGACY_DATASETS = 10000
+
+ERRORS = [
+	"success",
+	"Error in library(foo) : there is no package called 'foo'",
+	"Error in file(file, rt) : cannot open the connection[newline]In addition: Warning message:",
+	"Error in setwd(C:/Users/author/project) : cannot change working directory",
+	"Error in eval(ei, envir) : object 'df' not found",
+]
+
+def make_run_logs(corpus_dir, num_datasets, seed=0):
+	"""Write a run log with 1 to 5 scripts, each run with source and provR, for num_datasets datasets"""
+	rng = random.Random(seed)
+	for i in range(num_datasets):
+		doi = "doi--10.7910-DVN-RUN{:06d}".format(i)
+		os.makedirs(os.path.join(corpus_dir, doi, "prov_data"))
+		with open(os.path.join(corpus_dir, doi, "prov_data", "run_log.csv"), 'w') as run_log:
+			run_log.write('"doi","filename","run_type","error"\n')
+			for run_type in ["source", "provR"]:
+				for j in range(rng.randint(1, 5)):
+					run_log.write('"{}","script_{}.R","{}","{}"\n'.format(
+						corpus_dir + '/' + doi, j, run_type, rng.choice(ERRORS)))
+
+def legacy_get_runlog_data(path_to_datasets):
+	"""get_runlog_data as it was, concatenating the run logs one at a time"""
+	doi_directs = [doi for doi in os.listdir(path_to_datasets) if doi != '.DS_Store']
+	run_data_df = pd.DataFrame()
+	error_dois = []
+	for my_doi in doi_directs:
+		try:
+			my_path = path_to_datasets + '/' + my_doi + '/prov_data/' + 'run_log.csv'
+			run_data_df = pd.concat([run_data_df, pd.read_csv(my_path)])
+		except:
+			error_dois.append(my_doi)
+	return (run_data_df, error_dois)
+
+def timed(function, *args):
+	start = time.time()
+	result = function(*args)
+	return result, time.time() - start
+
+if __name__ == "__main__":
+	sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000]
+	for num_datasets in sizes:
+		work_dir = tempfile.mkdtemp()
+		try:
+			make_run_logs(work_dir, num_datasets)
+			(run_data_df, error_dois), seconds = timed(helpers.get_runlog_data, work_dir)
+			assert not error_dois
+			print("{:>7,} datasets, {:>9,} rows: get_runlog_data {:7.2f}s, {:6.1f} MB".format(
+				num_datasets, len(run_data_df), seconds,
+				run_data_df.memory_usage(deep=True).sum() / 1e6))
+			(single_df, _), seconds = timed(helpers.get_runlog_data, work_dir, True, 1)
+			pd.testing.assert_frame_equal(run_data_df, single_df)
+			print("{:>7,} datasets, {:>9,} rows: one reader       {:7.2f}s".format(
+				num_datasets, len(single_df), seconds))
+			if num_datasets <= MAX_LEGACY_DATASETS:
+				(legacy_df, legacy_errors), legacy_seconds = timed(legacy_get_runlog_data, work_dir)
+				# both should find the same rows, in the same order
+				pd.testing.assert_frame_equal(run_data_df.astype(str),
+											  legacy_df.reset_index(drop=True).astype(str))
+				print("{:>7,} datasets, {:>9,} rows: legacy          {:7.2f}s, {:6.1f} MB".format(
+					num_datasets, len(legacy_df), legacy_seconds,
+					legacy_df.memory_usage(deep=True).sum() / 1e6))
+		finally:
+			shutil.rmtree(work_dir)
@@ -0,0 +1,62 @@
+"""
+Benchmark sequential (helpers.get_r_dois) against concurrent, cached
+(helpers.get_r_dois_parallel) and incremental (helpers.update_r_dois) discovery
+of R file DOIs on a local fake search endpoint that adds a fixed latency to
+every request.
+Usage: python benchmark_search.py [num_items] [latency]
+"""
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+								'..', 'odyssey_scripts'))
+from helpers import get_r_dois, get_r_dois_parallel, update_r_dois
+from fake_dataverse import serve_fake_dataverse, make_search_items
+
+num_items = int(sys.argv[1]) if len(sys.argv) > 1 else 30000
+latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.25
+
+server = serve_fake_dataverse({}, latency=latency, search_items=make_search_items(num_items))
+api_url = server.url + "/api/search/"
+cache_dir = tempfile.mkdtemp()
+
+try:
+	start = time.time()
+	sequential = get_r_dois("fake-key", api_url=api_url)
+	print("get_r_dois:                       {:6.2f}s, {} dois".format(
+		time.time() - start, len(sequential)))
+
+	shutil.rmtree(cache_dir)
+	start = time.time()
+	parallel = get_r_dois_parallel("fake-key", api_url=api_url, cache_dir=cache_dir)
+	print("get_r_dois_parallel (cold cache): {:6.2f}s, {} dois".format(
+		time.time() - start, len(parallel)))
+
+	server.num_requests = 0
+	start = time.time()
+	cached = get_r_dois_parallel("fake-key", api_url=api_url, cache_dir=cache_dir)
+	print("get_r_dois_parallel (warm cache): {:6.2f}s, {} dois, {} requests".format(
+		time.time() - start, len(cached), server.num_requests))
+
+	assert set(sequential) == set(parallel) == set(cached)
+
+	# bootstrap an incremental crawl, then publish a day's worth of new files
+	doi_path = os.path.join(cache_dir, "r_dois.txt")
+	update_r_dois("fake-key", doi_path, api_url=api_url)
+	server.search_items.extend(make_search_items(24, first_item=num_items))
+	server.num_requests = 0
+	start = time.time()
+	new_dois = update_r_dois("fake-key", doi_path, api_url=api_url)
+	print("update_r_dois (one new day):      {:6.2f}s, {} new dois, {} requests".format(
+		time.time() - start, len(new_dois), server.num_requests))
+
+	with open(doi_path, 'r') as handle:
+		assert set(handle) == set(get_r_dois("fake-key", api_url=api_url))
+finally:
+	server.shutdown()
+	shutil.rmtree(cache_dir, ignore_errors=True)
@@ -0,0 +1,263 @@
+"""
+Local stand-in for the parts of the Dataverse API that the helpers use
+(/api/datasets/:persistentId, /api/access/datafile/<id> and /api/search/). Running this file
+downloads and then re-syncs a synthetic corpus through helpers.download_datasets
+and checks the result, so the download engine can be exercised without touching
+Harvard Dataverse.
+"""
+from __future__ import print_function
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+try:
+	from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+	from urllib.parse import urlparse, parse_qs
+except ImportError:
+	from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+	from SocketServer import ThreadingMixIn
+	from urlparse import urlparse, parse_qs
+
+	class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+		daemon_threads = True
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+								'..', 'odyssey_scripts'))
+from helpers import download_datasets, doi_to_directory
+
+
+class FakeDataverse(ThreadingHTTPServer):
+	"""Threaded HTTP server holding a corpus of fake datasets
+	Parameters
+	----------
+	datasets : dict of string to list of (string, bytes)
+			   maps each doi to its (filename, contents) pairs
+	latency : float
+			  seconds to sleep before answering each request
+	search_items : list of dict
+				   file search results, in the order the search API returns them
+	"""
+	daemon_threads = True
+
+	def __init__(self, datasets, latency=0.0, search_items=None):
+		ThreadingHTTPServer.__init__(self, ('127.0.0.1', 0), FakeDataverseHandler)
+		self.latency = latency
+		self.search_items = search_items or []
+		self.datasets = {}
+		self.versions = {}
+		self.datafiles = {}
+		self.next_fileid = 1
+		for doi in sorted(datasets):
+			self.publish(doi, datasets[doi])
+		# track how many requests are being served at once
+		self.lock = threading.Lock()
+		self.in_flight = 0
+		self.max_in_flight = 0
+		self.num_requests = 0
+		self.bytes_sent = 0
+
+	def publish(self, doi, files):
+		"""Publish a new version of a dataset with the given (filename, contents) pairs"""
+		self.versions[doi] = self.versions.get(doi, 0) + 1
+		# like dataverse, unchanged files keep their ids across versions
+		previous = {(record['dataFile']['filename'], record['dataFile']['md5']): record
+					for record in self.datasets.get(doi, [])}
+		self.datasets[doi] = []
+		for filename, contents in files:
+			md5 = hashlib.md5(contents).hexdigest()
+			if (filename, md5) in previous:
+				self.datasets[doi].append(previous[(filename, md5)])
+				continue
+			self.datasets[doi].append({'dataFile': {'id': self.next_fileid, 'filename': filename,
+													'filesize': len(contents), 'md5': md5}})
+			self.datafiles[self.next_fileid] = contents
+			self.next_fileid += 1
+
+	@property
+	def url(self):
+		return "http://127.0.0.1:{}".format(self.server_address[1])
+
+
+class FakeDataverseHandler(BaseHTTPRequestHandler):
+	protocol_version = "HTTP/1.1"
+	disable_nagle_algorithm = True
+
+	def log_message(self, format, *args):
+		pass
+
+	def do_GET(self):
+		server = self.server
+		with server.lock:
+			server.in_flight += 1
+			server.num_requests += 1
+			server.max_in_flight = max(server.max_in_flight, server.in_flight)
+		try:
+			time.sleep(server.latency)
+			url = urlparse(self.path)
+			params = parse_qs(url.query)
+			datafile_match = re.match(r"^/api/access/datafile/(\d+)$", url.path)
+			if url.path == "/api/datasets/:persistentId":
+				doi = params.get('persistentId', [''])[0]
+				if doi not in server.datasets:
+					self.send_body(404, b'{"status": "ERROR"}')
+				else:
+					body = {'status': 'OK', 'data': {'latestVersion': {
+						'versionNumber': server.versions[doi], 'versionMinorNumber': 0,
+						'files': server.datasets[doi]}}}
+					self.send_body(200, json.dumps(body).encode('utf-8'))
+			elif url.path == "/api/search/":
+				start = int(params.get('start', ['0'])[0])
+				per_page = int(params.get('per_page', ['10'])[0])
+				items = server.search_items
+				if params.get('sort') == ['date']:
+					items = sorted(items, key=lambda item: item['published_at'],
+								   reverse=params.get('order') == ['desc'])
+				items = items[start:start + per_page]
+				body = {'status': 'OK', 'data': {'total_count': len(server.search_items),
+												 'start': start, 'items': items}}
+				self.send_body(200, json.dumps(body).encode('utf-8'))
+			elif datafile_match and int(datafile_match.group(1)) in server.datafiles:
+				contents = server.datafiles[int(datafile_match.group(1))]
+				range_match = re.match(r"^bytes=(\d+)-$", self.headers.get('Range', ''))
+				# serve only the tail of the file if asked for a byte range
+				if range_match and int(range_match.group(1)) < len(contents):
+					self.send_body(206, contents[int(range_match.group(1)):],
+								   "application/octet-stream")
+				elif range_match:
+					self.send_body(416, b'')
+				else:
+					self.send_body(200, contents, "application/octet-stream")
+			else:
+				self.send_body(404, b'{"status": "ERROR"}')
+		finally:
+			with server.lock:
+				server.in_flight -= 1
+
+	def send_body(self, status, body, content_type="application/json"):
+		self.send_response(status)
+		self.send_header("Content-Type", content_type)
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+		with self.server.lock:
+			self.server.bytes_sent += len(body)
+
+
+def serve_fake_dataverse(datasets, latency=0.0, search_items=None):
+	"""Start a FakeDataverse on a background thread and return it"""
+	server = FakeDataverse(datasets, latency, search_items)
+	thread = threading.Thread(target=server.serve_forever)
+	thread.daemon = True
+	thread.start()
+	return server
+
+
+def make_corpus(num_datasets, files_per_dataset, file_size):
+	"""Build a synthetic corpus of num_datasets datasets with files_per_dataset files each"""
+	corpus = {}
+	for i in range(num_datasets):
+		doi = "doi:10.7910/DVN/FAKE{:03d}".format(i)
+		corpus[doi] = [("file_{}.R".format(j), os.urandom(file_size))
+					   for j in range(files_per_dataset)]
+	return corpus
+
+
+def make_search_items(num_items, files_per_dataset=3, first_item=0):
+	"""Build num_items R file search results spread over datasets of files_per_dataset files,
+	   published an hour apart"""
+	items = []
+	for i in range(first_item, first_item + num_items):
+		doi = "doi:10.7910/DVN/FAKE{:05d}".format(i // files_per_dataset)
+		published_at = time.gmtime(time.mktime((2015, 1, 1, 0, 0, 0, 0, 0, 0)) + 3600 * i)
+		items.append({'name': "script_{}.R".format(i), 'type': 'file',
+					  'file_content_type': 'type/x-r-syntax',
+					  'published_at': time.strftime("%Y-%m-%dT%H:%M:%SZ", published_at),
+					  'dataset_citation': 'Author, 2017, "Dataset {}", {}, Harvard Dataverse, V1'.format(
+						  i // files_per_dataset, doi)})
+	return items
+
+
+def check_files(corpus, destination):
+	"""Check that every file of the corpus was downloaded byte-for-byte"""
+	for doi, files in corpus.items():
+		for filename, contents in files:
+			with open(os.path.join(destination, doi_to_directory(doi), filename), 'rb') as handle:
+				assert handle.read() == contents
+
+
+if __name__ == "__main__":
+	max_per_host = 4
+	corpus = make_corpus(num_datasets=5, files_per_dataset=40, file_size=4096)
+	server = serve_fake_dataverse(corpus, latency=0.02)
+	destination = tempfile.mkdtemp()
+	try:
+		start = time.time()
+		results = download_datasets(list(corpus) + ["doi:10.7910/DVN/MISSING"], destination,
+									"fake-key", max_workers=16, max_per_host=max_per_host,
+									server_url=server.url, sync=True)
+		elapsed = time.time() - start
+
+		# every real dataset should have downloaded byte-for-byte, the missing one should fail
+		assert not results.pop("doi:10.7910/DVN/MISSING")
+		assert all(results.values())
+		check_files(corpus, destination)
+		assert server.max_in_flight <= max_per_host
+
+		print("Downloaded {} files in {:.2f}s ({} requests, at most {} in flight)".format(
+			sum(len(files) for files in corpus.values()), elapsed, server.num_requests,
+			server.max_in_flight))
+
+		# publish a new version of one dataset with one changed and one added file,
+		# and leave half of the added file behind as if a download had been interrupted
+		doi = sorted(corpus)[0]
+		corpus[doi][0] = (corpus[doi][0][0], os.urandom(4096))
+		corpus[doi].append(("new_file.csv", os.urandom(1 << 20)))
+		server.publish(doi, corpus[doi])
+		new_fileid = server.next_fileid - 1
+		with open(os.path.join(destination, doi_to_directory(doi), ".{}.part".format(new_fileid)),
+				  'wb') as handle:
+			handle.write(corpus[doi][-1][1][:1 << 19])
+
+		server.num_requests = server.bytes_sent = 0
+		results = download_datasets(list(corpus), destination, "fake-key", max_workers=16,
+									max_per_host=max_per_host, server_url=server.url, sync=True)
+		assert all(results.values())
+		check_files(corpus, destination)
+		# one listing per dataset plus the two changed files
+		assert server.num_requests == len(corpus) + 2
+		print("Re-synced with {} requests and {} file bytes".format(
+			server.num_requests, server.bytes_sent))
+
+		# a partial file longer than the file is answered with a 416, and must be replaced
+		# by the whole file without waiting for a second connection when only one is allowed
+		corpus[doi][1] = (corpus[doi][1][0], os.urandom(4096))
+		server.publish(doi, corpus[doi])
+		with open(os.path.join(destination, doi_to_directory(doi),
+							   ".{}.part".format(server.next_fileid - 1)), 'wb') as handle:
+			handle.write(os.urandom(8192))
+		results = download_datasets([doi], destination, "fake-key", max_workers=4, max_per_host=1,
+									server_url=server.url, sync=True)
+		assert results[doi]
+		check_files({doi: corpus[doi]}, destination)
+		print("Replaced a partial file past the end of the file over one connection")
+
+		# files in different folders of a dataset can share a filename; the last one is kept
+		doi = "doi:10.7910/DVN/DUPLICATES"
+		duplicates = [("data.csv", os.urandom(1 << 16)) for _ in range(4)]
+		server.publish(doi, duplicates)
+		for _ in range(10):
+			results = download_datasets([doi], destination, "fake-key", max_workers=16,
+										max_per_host=max_per_host, server_url=server.url)
+			assert results[doi]
+			check_files({doi: duplicates[-1:]}, destination)
+		print("Downloaded duplicate filenames without collisions")
+	finally:
+		server.shutdown()
+		shutil.rmtree(destination)
@@ -8,7 +8,6 @@ https://stackoverflow.com/questions/25027122/break-the-function-after-certain-ti
 
 import pickle
 import requests
-import json
 import os
 import signal
 import shutil
@@ -17,6 +16,9 @@ from tqdm import tqdm as tqdm
 
 dataverse_key = "670994aa-dbf5-4240-a3a6-74cca05a9f07"
 
+# number of bytes to read from the network and write at a time
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
 class TimeoutException(Exception):   # Custom exception class
 	pass
 
@@ -36,7 +38,7 @@ with open('doi_to_fileids.pkl', 'rb') as handle:
 
 # convert the dictionary to a list of key/value pairs and 
 # free the dictionary from ram
-my_items = doi_to_fileids.items()
+my_items = list(doi_to_fileids.items())
 
 # iterate through the key/value pairs in the dictionary
 for i in tqdm(range(len(my_items))):
@@ -52,15 +54,24 @@ for i in tqdm(range(len(my_items))):
 			os.makedirs(mydirect)
 		# iterate through list of filename, fileid tuples
 		for filename, fileid in myfile_tuples:
-			response = requests.get("https://dataverse.harvard.edu/api/access/datafile/" + str(fileid), 
-									params={"key": dataverse_key})
-			# write the response to a new file with the correct filename
-			with open(mydirect + "/" + filename, 'w') as handle:
-				handle.write(response.content)
+			with requests.get("https://dataverse.harvard.edu/api/access/datafile/" + str(fileid),
+							  params={"key": dataverse_key}, stream=True) as response:
+				# don't save an error page as if it were the file
+				response.raise_for_status()
+				# stream the response in chunks to a temporary file, then move it into place
+				with open(mydirect + "/" + filename + ".part", 'wb') as handle:
+					for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+						handle.write(chunk)
+			os.replace(mydirect + "/" + filename + ".part", mydirect + "/" + filename)
 	except TimeoutException:
 		# cleanup the directory
 		shutil.rmtree(mydirect)
 		continue # continue the for loop if downloading takes more than 30 seconds
+	except requests.RequestException:
+		# stop the timer and cleanup the directory of a file that failed to download
+		signal.alarm(0)
+		shutil.rmtree(mydirect)
+		continue
 	else:
 		# Reset the alarm
 		signal.alarm(0)
\ No newline at end of file
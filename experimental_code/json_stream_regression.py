@@ -0,0 +1,51 @@
+"""
+Regression check for helpers.JSONStream: streams the same provenance-like
+document at every chunk size from 1 character up to its whole length and
+checks that the members decoded each time match json.loads. Chunk boundaries
+then fall inside every key, string, number and literal of the document, e.g.
+right after the "12." or "1e" of a number that continues in the next chunk.
+Usage: python json_stream_regression.py
+"""
+from __future__ import print_function
+
+import io
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+								'..', 'odyssey_scripts'))
+from helpers import JSONStream
+
+DOCUMENT = u"""{"prefix": {"prov": "http://www.w3.org/ns/prov#"}, "version": 12.5,
+"count": -3, "valid": true,
+"agent": {"x": 12.5, "y": -0.25e-7, "z": 1E+10, "w": 0, "v": -17, "u": null, "t": false},
+"entity": {"rdt:d1": {"rdt:name": "data.csv", "rdt:type": "File", "rdt:size": 1024,
+		   "rdt:ratio": 0.125, "rdt:values": [1, 2.5e3, -4, {"n": 6.0}]},
+		   "rdt:d2": {"rdt:name": "caf\\u00e9 \\"quoted\\"", "rdt:type": "Snapshot"}},
+"activity": {"rdt:p1": {"rdt:name": "x <- 1.5e2", "rdt:elapsedTime": 0.5}},
+"wasGeneratedBy": {}, "used": {"rdt:pd1": {"prov:activity": "rdt:p1", "prov:entity": "rdt:d1"}}}
+"""
+
+
+def stream(document, chunk_size):
+	"""Stream the document, returning its top-level scalars and the members of its objects"""
+	reader = JSONStream(io.StringIO(document), chunk_size)
+	decoded = []
+	for section, value in reader.iter_top_level():
+		if value is not None:
+			decoded.append((section, value))
+			continue
+		decoded.append((section, list(reader.iter_members())))
+	return decoded
+
+
+if __name__ == "__main__":
+	expected = [(section, list(value.items()) if isinstance(value, dict) else value)
+				for section, value in json.loads(DOCUMENT).items()]
+	for chunk_size in range(1, len(DOCUMENT) + 1):
+		decoded = stream(DOCUMENT, chunk_size)
+		if decoded != expected:
+			print("chunk size {} decoded {!r}".format(chunk_size, decoded))
+			sys.exit(1)
+	print("{} chunk sizes decoded, 0 differences".format(len(DOCUMENT)))
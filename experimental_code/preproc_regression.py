@@ -0,0 +1,126 @@
+"""
+Regression check for helpers.all_preproc: preprocesses a corpus of datasets
+once with the multi-pass chain (preprocess_source, preprocess_lib and
+preprocess_file_paths, each reading and writing the __preproc__ file) and once
+with all_preproc, and checks that both leave byte-identical dataset trees.
+The chain can be taken from an older helpers.py, e.g. one checked out with
+"git show <commit>:odyssey_scripts/helpers.py > old_helpers.py".
+Usage: python preproc_regression.py [corpus_dir] [reference_helpers.py]
+(a synthetic corpus is generated if no corpus, or "-", is given)
+"""
+from __future__ import print_function
+
+import filecmp
+import importlib.util
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+scripts_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'odyssey_scripts')
+sys.path.insert(0, scripts_dir)
+import helpers
+
+# building blocks for synthetic R scripts
+LINE_TEMPLATES = [
+	'# a comment mentioning library(commented) and read.csv("commented.csv")\n',
+	'x <- 1 + 2\n',
+	'library(dplyr)\n',
+	'library("ggplot2")\n',
+	'require(stats)\n',
+	'install.packages("foreign")\n',
+	'suppressMessages(library(reshape2))\n',
+	'setwd("C:/Users/author/Dropbox/project/data")\n',
+	'setwd("/home/author/project")\n',
+	'setwd("results")\n',
+	'source("C:\\\\Users\\\\author\\\\code\\\\functions.R")\n',
+	'source("code/functions.R")\n',
+	'source(file = "missing_script.R")\n',
+	'df <- read.csv("C:/Users/author/project/data/input.csv")\n',
+	'df <- read.csv(file = "input.csv", header = TRUE)\n',
+	'df <- read.table("data\\\\input.csv", sep = ",")\n',
+	'load("results/model.RData")\n',
+	'load(file = "model.RData")\n',
+	'dat <- readRDS("nowhere/missing.rds")\n',
+	'write.csv(df, "output.csv")\n',
+	'rm(list = ls())\n',
+	'  rm(x)\n',
+	'plot(df$x, df$y, main = "plot.title")\n',
+]
+
+def make_corpus(corpus_dir, num_datasets=20, seed=0):
+	"""Generate num_datasets synthetic datasets of R scripts and data files"""
+	rng = random.Random(seed)
+	for i in range(num_datasets):
+		dataset = os.path.join(corpus_dir, "doi--10.7910-DVN-REG{:03d}".format(i))
+		for subdir in ['data', 'results', 'code']:
+			os.makedirs(os.path.join(dataset, subdir))
+		for data_file in ['data/input.csv', 'results/model.RData', 'code/functions.R']:
+			with open(os.path.join(dataset, data_file), 'w') as handle:
+				handle.write("placeholder\n")
+		for j in range(3):
+			lines = [rng.choice(LINE_TEMPLATES) for _ in range(rng.randint(5, 40))]
+			script = ''.join(lines)
+			# exercise missing trailing newlines and windows line endings
+			if rng.random() < 0.3:
+				script = script.rstrip('\n')
+			if rng.random() < 0.3:
+				script = script.replace('\n', '\r\n')
+			with open(os.path.join(dataset, "script_{}.R".format(j)), 'wb') as handle:
+				handle.write(script.encode('utf-8'))
+
+def r_files(dataset):
+	return sorted(my_file for my_file in os.listdir(dataset)
+				  if my_file.endswith(".R") and "__preproc__" not in my_file)
+
+def compare_trees(left, right):
+	"""Return the relative paths that differ between two directory trees"""
+	differences = []
+	comparison = filecmp.dircmp(left, right)
+	differences.extend(comparison.left_only + comparison.right_only + comparison.funny_files)
+	for name in comparison.common_files:
+		if not filecmp.cmp(os.path.join(left, name), os.path.join(right, name), shallow=False):
+			differences.append(name)
+	for name in comparison.common_dirs:
+		differences.extend(name + '/' + difference for difference in
+						   compare_trees(os.path.join(left, name), os.path.join(right, name)))
+	return differences
+
+if __name__ == "__main__":
+	work_dir = tempfile.mkdtemp()
+	try:
+		corpus_dir = sys.argv[1] if len(sys.argv) > 1 else "-"
+		if corpus_dir == "-":
+			corpus_dir = os.path.join(work_dir, "corpus")
+			make_corpus(corpus_dir)
+		reference = helpers
+		if len(sys.argv) > 2:
+			spec = importlib.util.spec_from_file_location("reference_helpers", sys.argv[2])
+			reference = importlib.util.module_from_spec(spec)
+			spec.loader.exec_module(reference)
+
+		chain_dir = os.path.join(work_dir, "chain")
+		single_dir = os.path.join(work_dir, "single")
+		shutil.copytree(corpus_dir, chain_dir)
+		shutil.copytree(corpus_dir, single_dir)
+
+		# the chain reads install_and_load.R from the working directory
+		os.chdir(scripts_dir)
+		num_files = 0
+		for dataset in sorted(os.listdir(chain_dir)):
+			for r_file in r_files(os.path.join(chain_dir, dataset)):
+				reference.preprocess_source(r_file, os.path.join(chain_dir, dataset), from_preproc=True)
+				reference.preprocess_lib(r_file, os.path.join(chain_dir, dataset), from_preproc=True)
+				reference.preprocess_file_paths(r_file, os.path.join(chain_dir, dataset),
+												from_preproc=True, report_missing=True)
+				helpers.all_preproc(r_file, os.path.join(single_dir, dataset), "error")
+				num_files += 1
+
+		differences = compare_trees(chain_dir, single_dir)
+		for difference in differences:
+			print("differs: " + difference)
+		print("{} scripts preprocessed, {} differences".format(num_files, len(differences)))
+		sys.exit(1 if differences else 0)
+	finally:
+		shutil.rmtree(work_dir)
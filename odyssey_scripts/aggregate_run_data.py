@@ -1,29 +1,44 @@
 import os
 import sys
 
-import pandas as pd
+from helpers import get_runlog_data, get_missing_files, write_run_log, update_runlog_data, \
+	RUN_LOG_FORMATS
 
-from helpers import get_runlog_data, get_missing_files
+# with "--parquet" or "--feather", also write the run log in that columnar format
+# (needs pyarrow), which is much faster to load for analysis
+format_flags = ['--' + file_format for file_format in RUN_LOG_FORMATS]
+formats = [arg[2:] for arg in sys.argv[1:] if arg in format_flags]
+# with "--incremental", only re-read the datasets whose prov_data changed since the
+# last aggregation into the output directory
+incremental = "--incremental" in sys.argv
+args = [arg for arg in sys.argv[1:] if arg not in format_flags + ["--incremental"]]
 
 # accept commandline arguments for dataset directory and 
 # output directory for the resultant csv
-output_direct = sys.argv[-1]
-dataset_direct = sys.argv[-2]
-run_log_df, error_files = get_runlog_data(dataset_direct)
+output_direct = args[-1]
+dataset_direct = args[-2]
 
 # make a new directory to store the dataset
 # (if one doesn't exist)
 if not os.path.exists(output_direct):   
 	os.makedirs(output_direct)
 
-# write the dataframe to csv
-run_log_df.to_csv(output_direct + '/master_run_log.csv', index=False)
+if incremental:
+	# splice the changed datasets into the existing run log and write it out
+	run_log_df, error_files, changed_dois = update_runlog_data(dataset_direct, output_direct,
+															   ['csv'] + formats)
+	print("Re-read the run logs of {} datasets".format(len(changed_dois)))
+else:
+	run_log_df, error_files = get_runlog_data(dataset_direct)
+	# write the dataframe to csv (and any columnar formats asked for)
+	for file_format in ['csv'] + formats:
+		write_run_log(run_log_df, output_direct, file_format)
 
 # create a pickle of missing files
-get_missing_files(dataset_direct, output_direct)
+error_files += get_missing_files(dataset_direct, output_direct, incremental=incremental)
 
 # if there were errors, write those to the directory as well
 if error_files:
-	with open(output_direct + 'error_files.txt', 'w') as handle:
+	with open(output_direct + '/error_files.txt', 'w') as handle:
 		for error_file in error_files:
 			handle.write(error_file + '\n')
\ No newline at end of file
@@ -7,4 +7,4 @@
 #SBATCH -o ./logs/provR%j.out      # File to which STDERR will be written
 #SBATCH -e ./logs/provR%j.err      # File to which STDERR will be written
 
-python aggregate_run_data.py $1 $2
+python aggregate_run_data.py $1 $2 $3 $4
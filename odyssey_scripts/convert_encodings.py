@@ -0,0 +1,29 @@
+import os
+import sys
+import time
+from helpers import convert_datasets, ENCODING_CACHE_NAME
+
+if __name__ == "__main__":
+    # usage: python convert_encodings.py dataset_dir [report_path] [cache_path]
+    # (an argument given as "" takes its default)
+    # - report_path: where to write the per-file report (default: encoding_report.csv)
+    # - cache_path: where to keep the cache of detected encodings, so that later runs don't
+    #   detect the encodings of unchanged scripts again (default: in dataset_dir)
+    args = sys.argv[1:] + [""] * 2
+    dataset_dir = args[0]
+    report_path = args[1] or "encoding_report.csv"
+    cache_path = args[2] or os.path.join(dataset_dir, ENCODING_CACHE_NAME)
+
+    # convert the R files of the datasets to utf-8 in parallel on the cores allocated to the job
+    start = time.time()
+    report_df = convert_datasets(dataset_dir, report_path=report_path, cache_path=cache_path)
+    seconds = time.time() - start
+
+    print("Checked {} R files of {} datasets ({:.1f} MB) in {:.1f}s, {:.1f} MB/s".format(
+        len(report_df), report_df['dataset'].nunique(), report_df['num_bytes'].sum() / 1e6,
+        seconds, report_df['num_bytes'].sum() / 1e6 / max(seconds, 1e-9)))
+    print("Converted {} files ({} failed, {} encodings cached); detected by {}".format(
+        report_df['converted'].sum(), (report_df['error'].fillna('') != '').sum(),
+        report_df['cached'].sum(),
+        ", ".join("{}: {}".format(method, count) for method, count in
+                  report_df['method'].value_counts().items())))
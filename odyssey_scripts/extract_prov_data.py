@@ -0,0 +1,34 @@
+from __future__ import print_function
+
+import sys
+import time
+
+import pandas as pd
+
+from helpers import extract_prov_data, write_run_log_table
+
+if __name__ == "__main__":
+    # get the dataset directory, the database to write the tables to and, optionally, the
+    # master run log to add to it (as csv, parquet or feather) as command line arguments
+    dataset_dir = sys.argv[1]
+    db_path = sys.argv[2] if len(sys.argv) > 2 else "prov_data.sqlite"
+    run_log_path = sys.argv[3] if len(sys.argv) > 3 else None
+
+    # extract the files and packages of every provenance document on the job's cores
+    start = time.time()
+    num_scripts, error_scripts = extract_prov_data(dataset_dir, db_path, print_status=True)
+
+    # add the run log, so that e.g. the packages of failing scripts are a join away
+    if run_log_path:
+        if run_log_path.endswith(".parquet"):
+            run_log_df = pd.read_parquet(run_log_path)
+        elif run_log_path.endswith(".feather"):
+            run_log_df = pd.read_feather(run_log_path)
+        else:
+            run_log_df = pd.read_csv(run_log_path, dtype=str)
+        write_run_log_table(run_log_df, db_path)
+
+    print("Extracted {} provenance documents ({} failed) in {:.1f}s".format(
+        num_scripts, len(error_scripts), time.time() - start))
+    for error_script in error_scripts:
+        print("Failed to extract " + error_script, file=sys.stderr)
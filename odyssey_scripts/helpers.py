@@ -2,15 +2,179 @@ import requests
 import json
 import re
 import os
-import sys
+import errno
+import stat
+import time
 import shutil
+import tempfile
 import fnmatch
 import pickle
 import codecs
 import chardet
+import io
+import hashlib
+import sqlite3
+import functools
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from chardet.universaldetector import UniversalDetector
+
+from collections import OrderedDict
 
 import pandas as pd
-import numpy as np
+from requests.adapters import HTTPAdapter
+
+# reflinks need ioctl, which only unix-like systems have
+try:
+	import fcntl
+except ImportError:
+	fcntl = None
+
+# base URL of the dataverse to download from (Harvard's, by default)
+DATAVERSE_URL = "https://dataverse.harvard.edu"
+# url of its search API, and the search for all R files
+SEARCH_URL = DATAVERSE_URL + "/api/search/"
+R_FILE_QUERY = "fileContentType:type/x-r-syntax"
+# pattern for the doi in a search result's dataset citation
+DOI_REGEX = re.compile("(doi:[^,]*)")
+
+# rules used by the preprocessing passes: each maps to a compiled pattern and a
+# literal that any line the pattern matches must contain, which is checked first
+# to skip the regex on the (many) lines that can't match
+PREPROC_RULES = {
+	# calls to setwd, with a possibly empty path
+	'setwd': (re.compile(r"\s*setwd\s*\(\"?([^\"]*)\"?\)"), "setwd"),
+	# calls to setwd, with a non-empty path
+	'setwd_path': (re.compile(r"\s*setwd\s*\(\"?([^\"]+)\"?\)"), "setwd"),
+	# calls to source with a quoted R file
+	'source': (re.compile(r"^\s*source\s*\((?:.*?file\s*=\s*|\s*)[\"']([^\"]+\.[Rr])[\"']"),
+			   "source"),
+	# calls that load or install packages
+	'library': (re.compile(r"library\s*\(\"?([^\"]*)\"?\)"), "library"),
+	'require': (re.compile(r"require\s*\(\"?([^\"]*)\"?\)"), "require"),
+	'install.packages': (re.compile(r"install.packages\s*\(\"?([^\"]*)\"?\)"), "packages"),
+	# calls to rm, which clear the environment
+	'rm': (re.compile(r"^\s*rm\s*\("), "rm"),
+	# quoted file paths passed to a function
+	'file_path': (re.compile(r"\((?:.*?file\s*=\s*|\s*)[\"']([^\"]+\.\w+)[\"']"), "("),
+	# names of common import functions, in one alternation (no literal to check)
+	'import': (re.compile(r"read|load|fromJSON|import|scan"), ""),
+}
+# file name extension of R scripts
+R_EXTENSION_REGEX = re.compile(r'\.[rR]$')
+# file name (with an extension) at the end of a path
+FILENAME_REGEX = re.compile(r".*?\s*(\S+\.[^ \s,]+)\s*")
+# number of bytes to hold in memory at a time while streaming a download to disk
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# name of the file recording what has been downloaded into each dataset directory
+MANIFEST_NAME = ".dataverse_manifest.json"
+# R code declaring "install_and_load", kept next to this module
+PRELUDE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "install_and_load.R")
+# preludes already read by this process, by path
+PRELUDE_CACHE = {}
+# columns of the prov_data/run_log.csv files written by get_dataset_reprod.R
+RUN_LOG_COLUMNS = ['doi', 'filename', 'run_type', 'error']
+# columns of the run log with few distinct values, stored as pandas categoricals. The same
+# as error_analysis/run_log.py's, so that run logs have the same dtypes whichever side
+# built or loaded them
+RUN_LOG_CATEGORICALS = ['doi', 'filename', 'run_type', 'error']
+# columnar formats the master run log can be written in, by file extension
+RUN_LOG_FORMATS = ['parquet', 'feather']
+# name of the file in the aggregation output directory recording the prov_data artifacts
+# each aggregate was built from
+AGGREGATE_STATE_NAME = "aggregate_state.json"
+# packages that come with R (or with the provenance collection), left out of the packages
+# a script uses
+BASE_PACKAGES = set(['datasets', 'utils', 'graphics', 'grDevices',
+					 'methods', 'stats', 'provR', 'devtools'])
+# separates lines of R code joined to be scanned for package calls in one pass
+CODE_SEPARATOR = "\x00"
+# number of activity names scanned for package calls at a time when streaming
+PACKAGE_SCAN_BATCH = 10000
+# calls loading packages, anywhere in R code: (function, arguments), allowing one level of
+# parentheses in the arguments but not spanning joined lines. The pattern starts with the
+# function names, as anything optional before them slows every search down several times
+PACKAGE_CALL_REGEX = re.compile(r"(requireNamespace|require|library|p_load)"
+								r"\s*\(((?:[^()\x00]|\([^()\x00]*\))*)\)")
+# R strings and comments: (string) when a string matches, so that a "#" in a string isn't
+# taken for a comment. Neither spans joined lines, so a quote left open doesn't swallow the
+# lines after it. Only the lines around package calls are searched, as most lines have neither
+R_STRING_OR_COMMENT_REGEX = re.compile(r"""("(?:[^"\\\x00]|\\.)*"|'(?:[^'\\\x00]|\\.)*'|`[^`\x00]*`)"""
+									   r"""|#[^\n\x00]*""")
+# characters that start a string or a comment in R
+R_STRING_OR_COMMENT_START = "\"'`#"
+# namespaces the package calls may be qualified with
+PACKAGE_CALL_NAMESPACES = ("pacman::", "base::")
+# commas between the arguments of a call, outside any parentheses
+PACKAGE_ARG_SEPARATOR_REGEX = re.compile(r",(?![^()]*\))")
+# an argument of a package call: (name, quote, quoted value, bare value, c(...) vector),
+# with no value when it can't name a package
+PACKAGE_ARG_REGEX = re.compile(r"""^\s*(?:([\w.]+)\s*=(?!=)\s*)?"""
+							   r"""(?:(["'])([\w.]+)\2|([A-Za-z][\w.]*)|c\s*\((.*)\)|.*?)\s*$""", re.DOTALL)
+# quoted package names in a c(...) vector
+QUOTED_PACKAGE_REGEX = re.compile(r"""(["'])([\w.]+)\1""")
+# sections of a provenance document needed to find a script's files and packages
+PROV_SECTIONS = ['entity', 'used', 'wasGeneratedBy', 'activity']
+# characters read at a time when streaming a provenance document
+PROV_CHUNK_SIZE = 1024 * 1024
+# pieces of JSON syntax between the values of an object: whitespace, a key and its colon,
+# and the comma or brace after a value
+JSON_WHITESPACE_REGEX = re.compile(r"[ \t\n\r]*")
+JSON_KEY_REGEX = re.compile(r'[ \t\n\r]*"((?:[^"\\]|\\.)*)"[ \t\n\r]*:', re.DOTALL)
+JSON_SEPARATOR_REGEX = re.compile(r"[ \t\n\r]*([,}])")
+# characters a JSON number starts with, and those that can continue one
+JSON_NUMBER_START = "-0123456789"
+JSON_NUMBER_CHARACTERS = ".eE+-0123456789"
+# name pattern of the provenance documents get_dataset_reprod.R writes to prov_data, with
+# the name of the script (without its extension)
+PROV_FILE_REGEX = re.compile(r"^prov_(.*)\.json$")
+# tables written by extract_prov_data: name -> (column definitions, indexed columns)
+PROV_TABLES = OrderedDict([
+	('scripts', ("doi TEXT, script TEXT, prov_path TEXT, prov_size INTEGER, num_inputs INTEGER, "
+				 "num_outputs INTEGER, num_packages INTEGER, seconds REAL, error TEXT, "
+				 "PRIMARY KEY (doi, script)", [])),
+	('file_io', ("doi TEXT, script TEXT, direction TEXT, filename TEXT, location TEXT",
+				 [['doi', 'script'], ['filename']])),
+	('packages', ("doi TEXT, script TEXT, package TEXT, version TEXT",
+				  [['doi', 'script'], ['package']])),
+])
+# bytes at the start of a file chardet guesses its encoding from
+ENCODING_PREFIX_BYTES = 64 * 1024
+# confidence below which a guess from the prefix is redone over the whole file
+ENCODING_MIN_CONFIDENCE = 0.9
+# bytes read at a time when checking or detecting the encoding of a file
+ENCODING_BLOCK_SIZE = 1024 * 1024
+# columns of the per-file report of an encoding conversion
+ENCODING_REPORT_COLUMNS = ['dataset', 'file', 'encoding', 'confidence', 'method', 'num_bytes',
+						   'seconds', 'converted', 'cached', 'error']
+# columns of the cache of detected encodings, keyed by a file's sha1 and size. The status is
+# "unchanged" for files already in ascii or utf-8, "converted" or "failed"
+ENCODING_CACHE_COLUMNS = ("sha1 TEXT, size INTEGER, encoding TEXT, confidence REAL, method TEXT, "
+						  "status TEXT, PRIMARY KEY (sha1, size)")
+# seconds to wait for another process writing to the encoding cache
+ENCODING_CACHE_TIMEOUT = 60
+# default name of the encoding cache, kept in the datasets directory so that every job
+# preprocessing those datasets shares one cache. Hidden, so that it isn't taken for a dataset
+ENCODING_CACHE_NAME = ".encoding_cache.sqlite"
+# manifest refresh_datasets writes to the archive of what it moved there
+REFRESH_MANIFEST_NAME = "manifest.csv"
+# columns of the manifest: the dataset, what was moved ("preproc" files or the "prov_data"
+# directory), where from (relative to the datasets directory), where to (relative to the
+# archive) and any error
+REFRESH_MANIFEST_COLUMNS = ['dataset', 'kind', 'source', 'destination', 'error']
+# ways of filling a dataset's working tree from its pristine snapshot, cheapest first:
+# copy-on-write clones, hardlinks to the snapshot's (read-only) files, and copies
+SNAPSHOT_LINK_MODES = ['reflink', 'hardlink', 'copy']
+# linux ioctl making a file a copy-on-write clone of another (FICLONE)
+FICLONE = 0x40049409
+# extension of the record of each snapshot's files, kept beside the snapshot directory
+SNAPSHOT_RECORD_EXTENSION = ".json"
+# columns of the summaries of snapshot_datasets and reset_datasets
+SNAPSHOT_SUMMARY_COLUMNS = ['dataset', 'num_files', 'link_modes', 'seconds', 'error']
+# suffix of the hidden work directory replace_tree builds a tree in, beside the tree
+REPLACE_TREE_SUFFIX = ".replacing"
+# files read concurrently per core when aggregating results, which mostly wait on the filesystem
+READERS_PER_CORE = 4
 
 
 def doi_to_directory(doi):
@@ -41,6 +205,18 @@ def directory_to_doi(doi):
 	"""
 	return doi.replace("--", ":").replace("-", "/")
 
+def available_cores():
+	"""Get the number of cores allocated to this job by SLURM (or on this machine
+	   when not running under SLURM)
+	Returns
+	-------
+	int
+	"""
+	for variable in ['SLURM_CPUS_ON_NODE', 'SLURM_NTASKS']:
+		if os.environ.get(variable, '').isdigit():
+			return int(os.environ[variable])
+	return multiprocessing.cpu_count()
+
 def get_r_dois(dataverse_key, save=False, print_status=False,
 			   api_url="https://dataverse.harvard.edu/api/search/", max_retries=5):
 	"""Get list of dois for all R files in a dataverse (defaulting to Harvard's)
@@ -86,7 +262,7 @@ def get_r_dois(dataverse_key, save=False, print_status=False,
 			# iterate through results, recording dataset_citations
 			for myresult in myresults:
 				# extract the DOI (if any) from the result
-				doi_match = re.search("(doi:[^,]*)", myresult['dataset_citation'])
+				doi_match = DOI_REGEX.search(myresult['dataset_citation'])
 				if doi_match:
 					r_dois.append(doi_match.group(1) + '\n')
 		# retry if failed to pull data
@@ -114,18 +290,610 @@ def get_r_dois(dataverse_key, save=False, print_status=False,
 
 	# if save, then save as .txt file 
 	if save:
-		# remove old output file if one exists
-		if os.path.exists('r_dois.txt'):   
-			os.remove('r_dois.txt')
-
-		# write dois to file, one-per-line
-		with open('r_dois.txt', 'a') as myfile:
-			for doi in r_dois:
-				myfile.write(doi)
+		save_r_dois(r_dois)
 	return r_dois
 
+def save_r_dois(r_dois, doi_path='r_dois.txt'):
+	"""Write dois to a .txt file, one-per-line, replacing any existing file
+	Parameters
+	----------
+	r_dois : list of string
+			 dois to save, each ending in a newline
+	doi_path : string
+			   path to the .txt file
+	"""
+	# remove old output file if one exists
+	if os.path.exists(doi_path):
+		os.remove(doi_path)
+
+	# write dois to file, one-per-line
+	with open(doi_path, 'a') as myfile:
+		for doi in r_dois:
+			myfile.write(doi)
+
+def extract_dois(search_items):
+	"""Extract the dataset dois from a page of search results
+	Parameters
+	----------
+	search_items : list of dict
+				   "items" of a dataverse search API response
+	Returns
+	-------
+	dois : list of string
+		   dois of the datasets the items belong to, each ending in a newline
+	"""
+	dois = []
+	for item in search_items:
+		# extract the DOI (if any) from the result
+		doi_match = DOI_REGEX.search(item['dataset_citation'])
+		if doi_match:
+			dois.append(doi_match.group(1) + '\n')
+	return dois
+
+def fetch_search_page(query, page_num, dataverse_key, session=None, api_url=SEARCH_URL,
+					  per_page=1000, max_retries=5, backoff=1.0, cache_dir=None, cache_key=None,
+					  extra_params=None):
+	"""Fetch one page of file search results, retrying with exponential backoff
+	Parameters
+	----------
+	query : string
+			search query
+	page_num : int
+			   zero-based page number
+	dataverse_key : string
+					containing user's dataverse API key
+	session : requests.Session
+			  session to issue the request through (default: no shared session)
+	api_url : string
+			  url of the dataverse search API
+	per_page : int
+			   number of results per page
+	max_retries : int
+				  number of times to retry the page before giving up
+	backoff : float
+			  seconds to wait before the first retry, doubling for every retry after
+	cache_dir : string
+				directory to cache raw pages in (default: no caching)
+	cache_key : string
+				extra string distinguishing cached crawls of the same query, e.g. the
+				total number of results at the time of the crawl
+	extra_params : dict
+				   additional parameters to pass to the search API
+	Returns
+	-------
+	page : dict
+		   "data" of the search API response, containing "items" and "total_count"
+	"""
+	session = session if session is not None else requests
+	params = {"q": query, "type": "file", "key": dataverse_key,
+			  "start": str(per_page * page_num), "per_page": str(per_page)}
+	params.update(extra_params or {})
+
+	# look for the page in the cache, which is keyed by everything but the api key
+	cache_path = None
+	if cache_dir:
+		key_params = dict(params, key=None, cache_key=cache_key, api_url=api_url)
+		crawl_key = hashlib.sha1(json.dumps(key_params, sort_keys=True).encode('utf-8')).hexdigest()
+		cache_path = cache_dir + '/' + crawl_key + '.json'
+		if os.path.exists(cache_path):
+			with open(cache_path, 'r') as handle:
+				return json.load(handle)
+
+	for attempt in range(max_retries + 1):
+		try:
+			response = session.get(api_url, params=params)
+			response.raise_for_status()
+			page = response.json()['data']
+			break
+		# retry if failed to pull data
+		except Exception:
+			if attempt == max_retries:
+				raise
+			time.sleep(backoff * 2 ** attempt)
+
+	# atomically write the page to the cache
+	if cache_path:
+		# pages are fetched concurrently, so another thread may create the directory first
+		try:
+			os.makedirs(cache_dir)
+		except OSError:
+			if not os.path.isdir(cache_dir):
+				raise
+		with open(cache_path + '.part', 'w') as handle:
+			json.dump(page, handle)
+		os.replace(cache_path + '.part', cache_path)
+	return page
+
+def get_r_dois_parallel(dataverse_key, save=False, print_status=False, api_url=SEARCH_URL,
+						max_retries=5, backoff=1.0, max_workers=8, cache_dir='search_cache',
+						per_page=1000):
+	"""Get list of dois for all R files in a dataverse (defaulting to Harvard's), fetching
+	   the pages of search results concurrently. Raw pages are cached on disk, so
+	   re-running an interrupted crawl only fetches the pages that are missing.
+	Parameters
+	----------
+	dataverse_key : string
+					containing user's dataverse API key
+	save : boolean
+		   whether or not to save the result as a .txt file
+	print_status : boolean
+				   whether or not to print status messages
+	api_url : string
+			  url pointing to the dataverse to get URLs for
+	max_retries : int
+				  number of times to retry each page before giving up
+	backoff : float
+			  seconds to wait before the first retry of a page, doubling after that
+	max_workers : int
+				  number of pages to fetch concurrently
+	cache_dir : string
+				directory to cache raw pages in (None to disable caching)
+	per_page : int
+			   number of results per page
+	Returns
+	-------
+	r_dois : list of string
+			 dois containing r_files in Harvard dataverse
+	"""
+	session = make_dataverse_session(max_workers)
+
+	# the first page tells us how many results (and so how many pages) there are
+	first_page = fetch_search_page(R_FILE_QUERY, 0, dataverse_key, session, api_url, per_page,
+								   max_retries, backoff)
+	total_count = first_page['total_count']
+	num_pages = max(1, -(-total_count // per_page))
+	if print_status:
+		print("Fetching {} results in {} pages...".format(total_count, num_pages))
+
+	# pages of a crawl are only valid as long as the result set is the same size
+	cache_key = str(total_count)
+	r_dois = set(extract_dois(first_page['items']))
+	with ThreadPoolExecutor(max_workers=max_workers) as executor:
+		pages = {executor.submit(fetch_search_page, R_FILE_QUERY, page_num, dataverse_key,
+								 session, api_url, per_page, max_retries, backoff,
+								 cache_dir, cache_key): page_num
+				 for page_num in range(1, num_pages)}
+		for page in as_completed(pages):
+			# a page that fails all of its retries fails the crawl, but the pages
+			# that succeeded stay cached for the next attempt
+			r_dois.update(extract_dois(page.result()['items']))
+			if print_status:
+				print("Parsed results from page {}".format(pages[page]))
+	session.close()
+
+	# remove duplicate DOIs
+	r_dois = list(r_dois)
+
+	# if save, then save as .txt file
+	if save:
+		save_r_dois(r_dois)
+	return r_dois
+
+def update_r_dois(dataverse_key, doi_path='r_dois.txt', state_path=None, print_status=False,
+				  api_url=SEARCH_URL, max_retries=5, backoff=1.0, per_page=1000):
+	"""Incrementally update a .txt file of dois for all R files in a dataverse, only
+	   fetching results published since the last update. The newest publication date
+	   seen (the high-water mark) is stored in a state file next to the .txt file.
+	   Without a state file, all results are crawled once with get_r_dois_parallel.
+	Parameters
+	----------
+	dataverse_key : string
+					containing user's dataverse API key
+	doi_path : string
+			   path to the .txt file of known dois, one-per-line
+	state_path : string
+				 path to the state file (default: "<doi_path without .txt>_state.json")
+	print_status : boolean
+				   whether or not to print status messages
+	api_url : string
+			  url pointing to the dataverse to get URLs for
+	max_retries : int
+				  number of times to retry each page before giving up
+	backoff : float
+			  seconds to wait before the first retry of a page, doubling after that
+	per_page : int
+			   number of results per page
+	Returns
+	-------
+	new_dois : list of string
+			   dois that were not in the .txt file before, each ending in a newline
+	"""
+	if state_path is None:
+		state_path = os.path.splitext(doi_path)[0] + '_state.json'
+
+	# load the known dois and the high-water mark of the last crawl
+	known_dois = set()
+	if os.path.exists(doi_path):
+		with open(doi_path, 'r') as handle:
+			known_dois = set(line.strip() + '\n' for line in handle if line.strip())
+	high_water_mark = None
+	if os.path.exists(state_path):
+		with open(state_path, 'r') as handle:
+			high_water_mark = json.load(handle)['high_water_mark']
+
+	session = make_dataverse_session()
+	# newest results first, so we can stop as soon as we reach ones we have seen
+	newest_first = {"sort": "date", "order": "desc"}
+	found_dois = set()
+	new_high_water_mark = high_water_mark
+	page_num = 0
+	while True:
+		if print_status:
+			print("Requesting page {} from API...".format(page_num))
+		page = fetch_search_page(R_FILE_QUERY, page_num, dataverse_key, session, api_url, per_page,
+								 max_retries, backoff, extra_params=newest_first)
+		items = page['items']
+		# the next crawl can start from the newest publication date seen
+		dates = [item['published_at'] for item in items if item.get('published_at')]
+		if new_high_water_mark:
+			dates.append(new_high_water_mark)
+		new_high_water_mark = max(dates) if dates else None
+		# without a high-water mark there is nothing to stop at, so crawl everything
+		if high_water_mark is None:
+			found_dois.update(get_r_dois_parallel(dataverse_key, api_url=api_url,
+												  max_retries=max_retries, backoff=backoff,
+												  cache_dir=None, per_page=per_page))
+			break
+		# keep results published at or after the high-water mark (dates are ISO 8601,
+		# so they compare correctly as strings); ties are caught again, which is harmless
+		newer_items = [item for item in items
+					   if item.get('published_at') is None or item['published_at'] >= high_water_mark]
+		found_dois.update(extract_dois(newer_items))
+		if len(newer_items) < len(items) or len(items) < per_page:
+			break
+		page_num += 1
+	session.close()
+
+	# merge with the known dois, appending only the new ones to the file
+	new_dois = sorted(found_dois - known_dois)
+	with open(doi_path, 'a') as handle:
+		for doi in new_dois:
+			handle.write(doi)
+	if print_status:
+		print("Found {} new dois ({} known)".format(len(new_dois), len(known_dois)))
+
+	# only advance the high-water mark once the dois are safely written
+	with open(state_path + '.part', 'w') as handle:
+		json.dump({'high_water_mark': new_high_water_mark}, handle)
+	os.replace(state_path + '.part', state_path)
+	return new_dois
+
+def make_dataverse_session(max_per_host=8):
+	"""Create a requests session that keeps connections to the dataverse alive
+	   and caps the number of requests in flight to any one host
+	Parameters
+	----------
+	max_per_host : int
+				   maximum number of simultaneous connections (and therefore
+				   in-flight requests) to a single host
+	Returns
+	-------
+	session : requests.Session
+			  pooled session that can be shared between download threads
+	"""
+	session = requests.Session()
+	# block until a pooled connection frees up rather than opening extra ones
+	adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_per_host, pool_block=True)
+	session.mount("http://", adapter)
+	session.mount("https://", adapter)
+	return session
+
+def get_dataset_version(doi, dataverse_key, session=None, server_url=DATAVERSE_URL):
+	"""Get the metadata (including the file listing) of the latest version of a dataset
+	Parameters
+	----------
+	doi : string
+		  doi of the dataset
+	dataverse_key : string
+					dataverse api key
+	session : requests.Session
+			  session to issue the request through (default: no shared session)
+	server_url : string
+				 base URL of the dataverse
+	Returns
+	-------
+	latest_version : dict
+					 latest version record as returned by the dataverse API
+	"""
+	session = session if session is not None else requests
+	# query the dataverse API for all the files in a dataset
+	response = session.get(server_url + "/api/datasets/:persistentId",
+						   params={"persistentId": doi, "key": dataverse_key})
+	response.raise_for_status()
+	return response.json()['data']['latestVersion']
+
+def get_dataset_files(doi, dataverse_key, session=None, server_url=DATAVERSE_URL):
+	"""Get the file listing of the latest version of a dataset
+	Parameters
+	----------
+	doi : string
+		  doi of the dataset
+	dataverse_key : string
+					dataverse api key
+	session : requests.Session
+			  session to issue the request through (default: no shared session)
+	server_url : string
+				 base URL of the dataverse
+	Returns
+	-------
+	files : list of dict
+			file metadata records as returned by the dataverse API
+	"""
+	return get_dataset_version(doi, dataverse_key, session, server_url)['files']
+
+def get_file_md5(data_file):
+	"""Get the md5 checksum of a file from its dataverse metadata
+	Parameters
+	----------
+	data_file : dict
+				"dataFile" record of a file returned by the dataverse API
+	Returns
+	-------
+	string
+	md5 hex digest, or None if dataverse did not report one
+	"""
+	# older dataverse versions report "md5", newer ones a typed "checksum"
+	if data_file.get('md5'):
+		return data_file['md5']
+	checksum = data_file.get('checksum') or {}
+	if checksum.get('type', '').upper() == 'MD5':
+		return checksum.get('value')
+	return None
+
+def load_manifest(doi_direct):
+	"""Load the download manifest of a dataset directory
+	Parameters
+	----------
+	doi_direct : string
+				 path to the dataset directory
+	Returns
+	-------
+	manifest : dict
+			   manifest with "version" and "files" (file id -> filename, size and md5)
+			   keys, empty if the dataset has not been synced before
+	"""
+	try:
+		with open(doi_direct + '/' + MANIFEST_NAME, 'r') as handle:
+			return json.load(handle)
+	except (IOError, OSError, ValueError):
+		return {'version': None, 'files': {}}
+
+def save_manifest(doi_direct, manifest):
+	"""Atomically write the download manifest of a dataset directory
+	Parameters
+	----------
+	doi_direct : string
+				 path to the dataset directory
+	manifest : dict
+			   manifest to write (see load_manifest)
+	"""
+	manifest_path = doi_direct + '/' + MANIFEST_NAME
+	with open(manifest_path + '.part', 'w') as handle:
+		json.dump(manifest, handle, indent=1, sort_keys=True)
+	os.replace(manifest_path + '.part', manifest_path)
+
+def is_file_current(record, file_path, manifest):
+	"""Check whether a local file already matches its dataverse metadata
+	Parameters
+	----------
+	record : dict
+			 manifest record of the file's latest dataverse metadata
+	file_path : string
+				path to the local copy of the file
+	manifest : dict
+			   manifest of the dataset at the time of the previous download
+	Returns
+	-------
+	bool
+	"""
+	previous = manifest['files'].get(str(record['id']))
+	# only trust the manifest if the file was downloaded with identical metadata
+	if previous != record:
+		return False
+	try:
+		local_size = os.path.getsize(file_path)
+	except OSError:
+		return False
+	return record['size'] is None or local_size == record['size']
+
+def download_datafile(fileid, file_path, dataverse_key, session=None, server_url=DATAVERSE_URL,
+					  chunk_size=DOWNLOAD_CHUNK_SIZE, resume=False, md5=None):
+	"""Stream a single dataverse file to file_path. The body is written chunk by chunk
+	   to a temporary, hidden ".part" file that is renamed into place once complete, so memory
+	   use does not depend on the file size and file_path never holds a partial file.
+	Parameters
+	----------
+	fileid : int
+			 dataverse id of the file
+	file_path : string
+				path to write the file to
+	dataverse_key : string
+					dataverse api key
+	session : requests.Session
+			  session to issue the request through (default: no shared session)
+	server_url : string
+				 base URL of the dataverse
+	chunk_size : int
+				 number of bytes to read from the network and write at a time
+	resume : bool
+			 whether to continue a ".part" file left by an earlier attempt (and to keep
+			 the ".part" file for a later attempt if this one fails)
+	md5 : string
+		  expected md5 digest of the file; the download fails if it does not match
+	"""
+	session = session if session is not None else requests
+	# hidden, so that a partial file is never mistaken for an R script, and named by
+	# file id, so that two downloads in flight can never write to the same one
+	part_path = os.path.join(os.path.dirname(file_path), ".{}.part".format(fileid))
+	try:
+		while True:
+			checksum = hashlib.md5()
+			headers = {}
+			offset = 0
+			# ask only for the bytes we are missing
+			if resume and os.path.exists(part_path):
+				offset = os.path.getsize(part_path)
+				headers['Range'] = 'bytes={}-'.format(offset)
+			# query the API for the file contents without reading the body yet
+			with session.get(server_url + "/api/access/datafile/" + str(fileid),
+							 params={"key": dataverse_key}, headers=headers, stream=True) as response:
+				# the partial file is useless if it is already past the end of the file, so
+				# drop it and ask for the whole file, after leaving the with block has
+				# released this connection back to the pool. Without a range, a 416 can't
+				# come back, so this retries at most once
+				if offset and response.status_code == 416:
+					os.remove(part_path)
+					continue
+				response.raise_for_status()
+				# append if the server honoured the range request, otherwise start over
+				if offset and response.status_code == 206:
+					with open(part_path, 'rb') as handle:
+						for chunk in iter(lambda: handle.read(chunk_size), b''):
+							checksum.update(chunk)
+					mode = 'ab'
+				else:
+					mode = 'wb'
+				# write the response to the temporary file in binary chunks
+				with open(part_path, mode) as handle:
+					for chunk in response.iter_content(chunk_size=chunk_size):
+						checksum.update(chunk)
+						handle.write(chunk)
+			break
+		if md5 and checksum.hexdigest() != md5:
+			os.remove(part_path)
+			raise IOError("md5 mismatch downloading file {}".format(fileid))
+		# atomically move the completed file into place
+		os.replace(part_path, file_path)
+	except Exception:
+		if not resume and os.path.exists(part_path):
+			os.remove(part_path)
+		raise
+
+def download_datasets(dois, destination, dataverse_key, max_workers=8, max_per_host=8,
+					  server_url=DATAVERSE_URL, print_status=False, sync=False):
+	"""Concurrently download every file of every doi to the destination directory.
+	   File listings and file contents are fetched on a shared thread pool over
+	   a single keep-alive session.
+	Parameters
+	----------
+	dois : list of string
+		   dois of the datasets to be downloaded
+	destination : string
+				  path to the destination in which to store the downloaded directories
+	dataverse_key : string
+					dataverse api key to use for completing the download
+	max_workers : int
+				  number of download threads
+	max_per_host : int
+				   maximum number of in-flight requests to the dataverse
+	server_url : string
+				 base URL of the dataverse to download the datasets from
+	print_status : boolean
+				   whether or not to print status messages
+	sync : boolean
+		   whether to only fetch files that are new or changed since the last sync,
+		   resuming partially downloaded files, according to the manifest kept
+		   in each dataset directory
+	Returns
+	-------
+	results : dict of string to bool
+			  whether each dataset was successfully downloaded to the destination
+	"""
+	# make a new directory to store the datasets
+	# (if one doesn't exist)
+	if not os.path.exists(destination):
+		os.makedirs(destination)
+
+	session = make_dataverse_session(max_per_host)
+	results = {}
+	# per-dataset sync state: directory, manifest being built and number of pending files
+	synced = {}
+
+	with ThreadPoolExecutor(max_workers=max_workers) as executor:
+		# request the file listings of all the datasets at once
+		listings = {executor.submit(get_dataset_version, doi, dataverse_key, session, server_url): doi
+					for doi in dois}
+		downloads = {}
+
+		# queue up the files of each dataset as soon as its listing arrives
+		for listing in as_completed(listings):
+			doi = listings[listing]
+			try:
+				latest_version = listing.result()
+			except Exception:
+				if print_status:
+					print("Failed to fetch file listing for {}".format(doi))
+				results[doi] = False
+				continue
+			results[doi] = True
+
+			# convert DOI into a friendly directory name by replacing slashes and colons
+			doi_direct = destination + '/' + doi_to_directory(doi)
+
+			# make a new directory to store the dataset
+			if not os.path.exists(doi_direct):
+				os.makedirs(doi_direct)
+
+			if sync:
+				old_manifest = load_manifest(doi_direct)
+				manifest = {'doi': doi, 'files': {},
+							'version': '{}.{}'.format(latest_version.get('versionNumber'),
+													  latest_version.get('versionMinorNumber'))}
+				synced[doi] = [doi_direct, manifest, 0]
+
+			# files in different folders of a dataset can share a filename, but they are all
+			# saved into doi_direct, so keep only the last file with each name, as a serial
+			# download would have
+			files = OrderedDict((file['dataFile']['filename'], file)
+								for file in latest_version['files'])
+			for file in files.values():
+				data_file = file['dataFile']
+				file_path = doi_direct + "/" + data_file['filename']
+				record = {'id': data_file['id'], 'filename': data_file['filename'],
+						  'size': data_file.get('filesize'), 'md5': get_file_md5(data_file)}
+				# ingested tabular files are served in a different format than the one
+				# dataverse reports the size and checksum of, so those can't be verified
+				if data_file.get('originalFileFormat'):
+					record['size'] = record['md5'] = None
+				if sync:
+					# skip files that are unchanged since the last sync
+					if is_file_current(record, file_path, old_manifest):
+						manifest['files'][str(data_file['id'])] = record
+						continue
+					synced[doi][2] += 1
+				download = executor.submit(download_datafile, data_file['id'], file_path,
+										   dataverse_key, session, server_url,
+										   resume=sync and record['md5'] is not None,
+										   md5=record['md5'])
+				downloads[download] = (doi, record)
+
+			# nothing to fetch, so the manifest is already complete
+			if sync and not synced[doi][2]:
+				save_manifest(doi_direct, manifest)
+
+		# a dataset failed if any of its files failed
+		for download in as_completed(downloads):
+			doi, record = downloads[download]
+			try:
+				download.result()
+				if sync:
+					synced[doi][1]['files'][str(record['id'])] = record
+			except Exception:
+				if print_status:
+					print("Failed to download a file of {}".format(doi))
+				results[doi] = False
+			# record what has been fetched once the dataset's last file is done
+			if sync:
+				synced[doi][2] -= 1
+				if not synced[doi][2]:
+					save_manifest(synced[doi][0], synced[doi][1])
+
+	session.close()
+	return results
+
 def download_dataset(doi, destination, dataverse_key,
-					 api_url="https://dataverse.harvard.edu/api/search/"):
+					 api_url="https://dataverse.harvard.edu/api/search/", max_workers=8,
+					 max_per_host=8, server_url=DATAVERSE_URL, sync=False):
 	"""Download doi to the destination directory
 	Parameters
 	----------
@@ -136,58 +904,103 @@ def download_dataset(doi, destination, dataverse_key,
 	dataverse_key : string
 					dataverse api key to use for completing the download
 	api_url : string
-			  URL of the dataverse API to download the dataset from
+			  unused, kept for backwards compatibility (see server_url)
+	max_workers : int
+				  number of files to download concurrently
+	max_per_host : int
+				   maximum number of in-flight requests to the dataverse
+	server_url : string
+				 base URL of the dataverse to download the dataset from
+	sync : boolean
+		   whether to only fetch files that are new or changed since the last sync
+		   (see download_datasets)
 	Returns
 	-------
 	bool
 	whether the dataset was successfully downloaded to the destination
 	"""
+	return download_datasets([doi], destination, dataverse_key, max_workers=max_workers,
+							 max_per_host=max_per_host, server_url=server_url, sync=sync)[doi]
 
-	# make a new directory to store the dataset
-	# (if one doesn't exist)
-	if not os.path.exists(destination):   
-		os.makedirs(destination)
-
-	try:
-		# query the dataverse API for all the files in a dataverse
-		files = requests.get("https://dataverse.harvard.edu/api/datasets/:persistentId",
-							 params= {"persistentId": doi, "key": dataverse_key})\
-							 .json()['data']['latestVersion']['files']
-	except:
-		return False
-
-	# convert DOI into a friendly directory name by replacing slashes and colons
-	doi_direct = destination + '/' + doi.replace("/", "-").replace(":", "--")
+def read_run_log_body(run_log_path):
+	"""Read a run log, split into its header and the rows beneath it
+	Parameters
+	----------
+	run_log_path : string
+				   path to a prov_data/run_log.csv file
+	Returns
+	-------
+	(header, body) : tuple of (list of string, string)
+					 the column names and the csv text of the rows, ending in a newline
+					 unless there are no rows
+	"""
+	with io.open(run_log_path, 'r', encoding='utf-8', newline='') as run_log:
+		header = run_log.readline()
+		body = run_log.read()
+	if body and not body.endswith('\n'):
+		body += '\n'
+	return [column.strip().strip('"') for column in header.split(',')], body
 
-	# make a new directory to store the dataset
-	if not os.path.exists(doi_direct):   
-		os.makedirs(doi_direct)
+def read_run_log(run_log_path):
+	"""Read a run log, leaving well-formed ones as text to be parsed together with others
+	Parameters
+	----------
+	run_log_path : string
+				   path to a prov_data/run_log.csv file
+	Returns
+	-------
+	(body, run_log_df) : tuple of (string, pandas.DataFrame)
+						 the csv text of the rows if the log looks like get_dataset_reprod.R
+						 wrote it, otherwise None and the parsed log
+	"""
+	header, body = read_run_log_body(run_log_path)
+	# an unbalanced quote would run into the next log's rows
+	if header == RUN_LOG_COLUMNS and body.count('"') % 2 == 0:
+		return body, None
+	return None, pd.read_csv(run_log_path, dtype=str)
 
-	# for each file result
-	for file in files:
+def read_dataset_files(path_to_datasets, doi_directs, read, max_workers=None):
+	"""Read a file from every dataset concurrently on a pool of threads
+	Parameters
+	----------
+	path_to_datasets : string
+					   path to the directory containing processed datasets
+	doi_directs : list of string
+				  names of the dataset directories
+	read : function
+		   reads a file given its dataset's directory
+	max_workers : int
+				  number of files to read at once (default: READERS_PER_CORE per core
+				  allocated to this job)
+	Returns
+	-------
+	list of (string, object, Exception)
+	the name of each dataset directory, in the order given, with what read returned
+	for it or the error it raised
+	"""
+	def read_dataset(my_doi):
 		try:
-			# parse the filename and fileid 
-			filename = file['dataFile']['filename']
-			fileid = file['dataFile']['id']
-
-			# query the API for the file contents
-			response = requests.get("https://dataverse.harvard.edu/api/access/datafile/" + str(fileid),
-									params={"key": dataverse_key})
-
-			# write the response to correctly-named file in the dataset directory
-			with open(doi_direct + "/" + filename, 'w') as handle:
-				handle.write(response.content)
-		except:
-			return False
+			return (my_doi, read(path_to_datasets + '/' + my_doi), None)
+		except Exception as error:
+			return (my_doi, None, error)
 
-	return True
+	with ThreadPoolExecutor(max_workers=max_workers or READERS_PER_CORE * available_cores()) as executor:
+		return list(executor.map(read_dataset, doi_directs))
 
-def get_runlog_data(path_to_datasets):
+def get_runlog_data(path_to_datasets, categorical=True, max_workers=None, doi_directs=None):
 	"""Aggregate run-time data for all datasets in the given
 	Parameters
 	----------
 	path_to_datasets : string 
 					   path to the directory containing processed datasets
+	categorical : bool
+				  whether to store the RUN_LOG_CATEGORICALS columns as categoricals,
+				  which takes a fraction of the memory
+	max_workers : int
+				  number of run logs to read at once (default: READERS_PER_CORE per core
+				  allocated to this job)
+	doi_directs : list of string
+				  names of the dataset directories to aggregate (default: all of them)
 	Returns
 	-------
 	(run_data_df, error_dois) : tuple of (pandas.DataFrame, list of string)
@@ -198,25 +1011,236 @@ def get_runlog_data(path_to_datasets):
 								an empty list unless there was a catastrophic error)
 	
 	"""
-	# get list of dataset directories, ignoring macOS directory metadata file (if present)
-	doi_directs = [doi for doi in os.listdir(path_to_datasets) if doi != '.DS_Store']
-	# initialize empty dataframe to store run logs of all the files
-	run_data_df = pd.DataFrame()
+	# get list of dataset directories, ignoring hidden entries such as the macOS directory
+	# metadata file and the encoding cache (if present)
+	if doi_directs is None:
+		doi_directs = [doi for doi in os.listdir(path_to_datasets) if not doi.startswith('.')]
+	# the rows of every well-formed run log, parsed together at the end
+	bodies = []
+	# run logs that don't look like get_dataset_reprod.R wrote them are parsed on their own
+	run_data_dfs = []
 	# initialize empty list to store problem doi's
 	error_dois = []
 
-	# iterate through directories and concatenate run logs
-	for my_doi in doi_directs:
-		try:
-			# assemble path
-			my_path = path_to_datasets + '/' + my_doi + '/prov_data/' + 'run_log.csv'
-			# concatenate to dataframe
-			run_data_df = pd.concat([run_data_df, pd.read_csv(my_path)])
-		except:
+	# read the run logs concurrently, since each read mostly waits on the filesystem
+	read = lambda doi_path: read_run_log(doi_path + '/prov_data/' + 'run_log.csv')
+	for my_doi, run_log, error in read_dataset_files(path_to_datasets, doi_directs, read,
+													 max_workers):
+		if error is not None:
 			error_dois.append(my_doi)
+		elif run_log[0] is not None:
+			bodies.append(run_log[0])
+		else:
+			run_data_dfs.append(run_log[1])
+
+	# parse all the rows at once, rather than growing a dataframe one log at a time
+	run_data_dfs.insert(0, pd.read_csv(io.StringIO(''.join(bodies)), names=RUN_LOG_COLUMNS,
+									   header=None, dtype=str))
+	run_data_df = pd.concat(run_data_dfs, ignore_index=True)
+	if categorical:
+		for column in RUN_LOG_CATEGORICALS:
+			run_data_df[column] = run_data_df[column].astype('category')
 	return (run_data_df, error_dois)
 
-def get_missing_files(path_to_datasets, pickle_path):
+def get_prov_signatures(path_to_datasets, doi_directs, artifact, max_workers=None):
+	"""Get the modification time and size of a prov_data artifact in every dataset
+	Parameters
+	----------
+	path_to_datasets : string
+					   path to the directory containing processed datasets
+	doi_directs : list of string
+				  names of the dataset directories
+	artifact : string
+			   name of the file in prov_data, e.g. "run_log.csv"
+	max_workers : int
+				  number of files to stat at once (default: READERS_PER_CORE per core
+				  allocated to this job)
+	Returns
+	-------
+	signatures : dict of string to list
+				 maps each dataset directory to the [mtime, size] of its artifact, or None
+				 if it doesn't have one
+	"""
+	def stat(doi_path):
+		try:
+			stat_result = os.stat(doi_path + '/prov_data/' + artifact)
+		except OSError:
+			return None
+		return [stat_result.st_mtime, stat_result.st_size]
+
+	return {my_doi: signature for my_doi, signature, error in
+			read_dataset_files(path_to_datasets, doi_directs, stat, max_workers)}
+
+def load_aggregate_state(output_direct, artifact):
+	"""Load the signatures of the prov_data artifacts an aggregate was built from
+	Parameters
+	----------
+	output_direct : string
+					path to the directory the aggregates are written to
+	artifact : string
+			   name of the aggregated file in prov_data, e.g. "run_log.csv"
+	Returns
+	-------
+	signatures : dict of string to list
+				 as returned by get_prov_signatures, or None if nothing has been aggregated
+	"""
+	try:
+		with open(output_direct + '/' + AGGREGATE_STATE_NAME, 'r') as handle:
+			return json.load(handle).get(artifact)
+	except (IOError, OSError, ValueError):
+		return None
+
+def save_aggregate_state(output_direct, artifact, signatures):
+	"""Atomically record the signatures of the prov_data artifacts an aggregate was built from
+	Parameters
+	----------
+	output_direct : string
+					path to the directory the aggregates are written to
+	artifact : string
+			   name of the aggregated file in prov_data, e.g. "run_log.csv"
+	signatures : dict of string to list
+				 as returned by get_prov_signatures
+	"""
+	state_path = output_direct + '/' + AGGREGATE_STATE_NAME
+	try:
+		with open(state_path, 'r') as handle:
+			state = json.load(handle)
+	except (IOError, OSError, ValueError):
+		state = {}
+	state[artifact] = signatures
+	with open(state_path + '.part', 'w') as handle:
+		json.dump(state, handle, sort_keys=True)
+	os.replace(state_path + '.part', state_path)
+
+def get_changed_datasets(signatures, previous_signatures):
+	"""Find the datasets whose prov_data artifact changed since the last aggregation
+	Parameters
+	----------
+	signatures : dict of string to list
+				 current signatures, as returned by get_prov_signatures
+	previous_signatures : dict of string to list
+						  signatures recorded by the last aggregation
+	Returns
+	-------
+	(changed, removed) : tuple of (list of string, list of string)
+						 datasets that are new or whose artifact changed, and datasets
+						 that are no longer there
+	"""
+	changed = [my_doi for my_doi, signature in signatures.items()
+			   if my_doi not in previous_signatures or previous_signatures[my_doi] != signature]
+	removed = [my_doi for my_doi in previous_signatures if my_doi not in signatures]
+	return changed, removed
+
+def update_runlog_data(path_to_datasets, output_direct, file_formats=('csv',), categorical=True,
+					   max_workers=None):
+	"""Bring the master run log in output_direct up to date, only re-reading the run logs
+	   of datasets that changed since it was last aggregated, and write it out
+	Parameters
+	----------
+	path_to_datasets : string
+					   path to the directory containing processed datasets
+	output_direct : string
+					path to the directory holding master_run_log.csv and the aggregation state
+	file_formats : sequence of string
+				   formats to write the run log in (see write_run_log); the csv is always
+				   written, since it is what the next update starts from
+	categorical : bool
+				  whether to store the RUN_LOG_CATEGORICALS columns as categoricals
+	max_workers : int
+				  number of run logs to read at once (default: READERS_PER_CORE per core
+				  allocated to this job)
+	Returns
+	-------
+	(run_data_df, error_dois, changed_dois) : tuple of (pandas.DataFrame, list of string, list of string)
+											  the aggregated run log and failed datasets, as
+											  returned by get_runlog_data, followed by the
+											  datasets that were re-read
+	"""
+	doi_directs = [doi for doi in os.listdir(path_to_datasets) if not doi.startswith('.')]
+	signatures = get_prov_signatures(path_to_datasets, doi_directs, 'run_log.csv', max_workers)
+	previous_signatures = load_aggregate_state(output_direct, 'run_log.csv')
+	master_path = output_direct + '/master_run_log.csv'
+
+	if previous_signatures is None or not os.path.exists(master_path):
+		# nothing to start from, so aggregate every dataset
+		run_data_df, error_dois = get_runlog_data(path_to_datasets, False, max_workers)
+		changed_dois = doi_directs
+	else:
+		changed_dois, removed_dois = get_changed_datasets(signatures, previous_signatures)
+		new_data_df, error_dois = get_runlog_data(path_to_datasets, False, max_workers, changed_dois)
+		previous_df = pd.read_csv(master_path, dtype=str)
+		# the doi column holds the path R was given to the dataset directory, so its last
+		# part is the dataset directory the rows came from
+		row_dois = previous_df['doi'].str.rstrip('/').str.split('/').str[-1]
+		stale = row_dois.isin(set(changed_dois) | set(removed_dois))
+		run_data_df = pd.concat([previous_df[~stale], new_data_df], ignore_index=True)
+
+	if categorical:
+		for column in RUN_LOG_CATEGORICALS:
+			run_data_df[column] = run_data_df[column].astype('category')
+	if not os.path.exists(output_direct):
+		os.makedirs(output_direct)
+	for file_format in ['csv'] + [file_format for file_format in file_formats if file_format != 'csv']:
+		write_run_log(run_data_df, output_direct, file_format)
+	# leave out datasets that failed, so that they are read again next time
+	for my_doi in error_dois:
+		signatures.pop(my_doi, None)
+	# only record the state once the run log it describes has been written
+	save_aggregate_state(output_direct, 'run_log.csv', signatures)
+	return (run_data_df, error_dois, changed_dois)
+
+def write_run_log(run_data_df, output_direct, file_format='csv'):
+	"""Write the aggregated run log to output_direct as master_run_log.<file_format>
+	Parameters
+	----------
+	run_data_df : pandas.DataFrame
+				  aggregated run log, as returned by get_runlog_data
+	output_direct : string
+					path to the directory to write the run log to
+	file_format : string
+				  "csv", or one of RUN_LOG_FORMATS to write a columnar file with the
+				  doi, filename, run_type and error columns dictionary-encoded (needs pyarrow)
+	Returns
+	-------
+	string
+	path to the written run log
+	"""
+	output_path = output_direct + '/master_run_log.' + file_format
+	if file_format == 'csv':
+		run_data_df.to_csv(output_path, index=False)
+		return output_path
+	if file_format not in RUN_LOG_FORMATS:
+		raise ValueError("unknown run log format: " + file_format)
+	# categoricals are stored as dictionary-encoded columns, so each distinct value is
+	# written (and later read) once
+	run_data_df = run_data_df.reset_index(drop=True)
+	for column in RUN_LOG_CATEGORICALS:
+		if column in run_data_df:
+			run_data_df[column] = run_data_df[column].astype('category')
+	if file_format == 'parquet':
+		run_data_df.to_parquet(output_path, index=False)
+	else:
+		run_data_df.to_feather(output_path)
+	return output_path
+
+def read_missing_files(missing_path):
+	"""Read the distinct lines of a missing files report
+	Parameters
+	----------
+	missing_path : string
+				   path to a prov_data/missing_files.txt file
+	Returns
+	-------
+	list of string
+	the distinct "script,path" lines, or an empty list if nothing was reported missing
+	"""
+	if not os.path.exists(missing_path):
+		return []
+	# open the file for reading and collect the results
+	with open(missing_path, 'r') as my_file:
+		return list(set(line.strip() for line in my_file if line.strip()))
+
+def get_missing_files(path_to_datasets, pickle_path, max_workers=None, incremental=False):
 	"""Aggregate missing files data for all datasets in the given path and pickle the result
 	Parameters
 	----------
@@ -224,75 +1248,698 @@ def get_missing_files(path_to_datasets, pickle_path):
 					   path to the directory containing processed datasets
 	pickle_path : string
 				  path to pickle file to store the dictionary
+	max_workers : int
+				  number of reports to read at once (default: READERS_PER_CORE per core
+				  allocated to this job)
+	incremental : bool
+				  whether to start from the existing pickle, only re-reading the reports of
+				  datasets that changed since it was written
+	Returns
+	-------
+	error_dois : list of string
+				 datasets whose missing files report couldn't be read
 	"""
 	# get list of dataset directories, ignoring macOS directory metadata file (if present)
-	doi_directs = [doi for doi in os.listdir(path_to_datasets) if doi != '.DS_Store']
+	doi_directs = [doi for doi in os.listdir(path_to_datasets) if doi.startswith("doi")]
 	missing_dict = {}
+	error_dois = []
+	signatures = get_prov_signatures(path_to_datasets, doi_directs, 'missing_files.txt', max_workers)
+	previous_signatures = load_aggregate_state(pickle_path, 'missing_files.txt')
 
-	# iterate through directories and concatenate run logs
-	for my_doi in doi_directs:
-		if my_doi.startswith("doi"):
-			missing_dict[my_doi] = []
-			try:
-				# assemble path
-				my_path = path_to_datasets + '/' + my_doi + '/prov_data/' + 'missing_files.txt'
-				# open the file for reading and collect the results
-				with open(my_path, 'r') as my_file:
-					for line in my_file.readlines():
-						if line.strip():
-							missing_dict[my_doi].append(line.strip())
-					missing_dict[my_doi] = list(set(missing_dict[my_doi]))
-			except:
-				pass
+	# only re-read the reports of datasets that changed, if there is a pickle to start from
+	read_dois = doi_directs
+	if incremental and previous_signatures is not None and \
+	   os.path.exists(pickle_path + '/missing_files.pkl'):
+		with open(pickle_path + '/missing_files.pkl', 'rb') as handle:
+			previous_dict = pickle.load(handle)
+		read_dois = get_changed_datasets(signatures, previous_signatures)[0]
+		missing_dict = {my_doi: previous_dict.get(my_doi, []) for my_doi in doi_directs}
+
+	# read the reports concurrently, since each read mostly waits on the filesystem
+	read = lambda doi_path: read_missing_files(doi_path + '/prov_data/' + 'missing_files.txt')
+	for my_doi, missing_files, error in read_dataset_files(path_to_datasets, read_dois, read,
+														   max_workers):
+		missing_dict[my_doi] = missing_files or []
+		if error is not None:
+			error_dois.append(my_doi)
+			signatures.pop(my_doi, None)
 
 	# pickle the file
 	with open(pickle_path + '/missing_files.pkl', 'wb') as handle:
 		pickle.dump(missing_dict, handle, protocol=pickle.HIGHEST_PROTOCOL)
+	# only record the state once the pickle it describes has been written
+	save_aggregate_state(pickle_path, 'missing_files.txt', signatures)
+	return error_dois
 
-def refresh_datasets(path_to_datasets, path_to_archive):
-	"""Clean datasets of all traces of preprocessing and provenance collection
+def move_path(source, destination):
+	"""Move a file or directory with a rename, only copying it when the destination is on
+	   another filesystem
+	Parameters
+	----------
+	source : string
+			 path to move
+	destination : string
+				  path to move it to, which must not exist
+	"""
+	try:
+		os.rename(source, destination)
+	except OSError as error:
+		if error.errno != errno.EXDEV:
+			raise
+		shutil.move(source, destination)
+
+def refresh_dataset(path_to_datasets, my_doi, path_to_archive, dry_run=False):
+	"""Move the preprocessed files and prov_data directory of one dataset to the archive
+	Parameters
+	----------
+	path_to_datasets : string
+					   path to the directory containing processed datasets
+	my_doi : string
+			 name of the dataset directory
+	path_to_archive : string
+					  path to the archive directory
+	dry_run : bool
+			  whether to only list what would be moved
+	Returns
+	-------
+	rows : list of dict
+		   one row of the manifest (see REFRESH_MANIFEST_COLUMNS) per file or directory moved
+	"""
+	doi_dir_path = path_to_datasets + '/' + my_doi
+	# one pass over the directory finds both the preprocessed files and prov_data
+	rows = [{'dataset': my_doi, 'kind': 'prov_data' if entry.name == 'prov_data' else 'preproc',
+			 'source': my_doi + '/' + entry.name, 'destination': my_doi + '/' + entry.name, 'error': ''}
+			for entry in os.scandir(doi_dir_path)
+			if "__preproc__" in entry.name or (entry.name == 'prov_data' and entry.is_dir())]
+	if dry_run or not rows:
+		return rows
+
+	os.makedirs(path_to_archive + '/' + my_doi)
+	for row in rows:
+		# prov_data is archived with a rename too, rather than deleted file by file
+		try:
+			move_path(path_to_datasets + '/' + row['source'], path_to_archive + '/' + row['destination'])
+		except OSError as error:
+			row['error'] = repr(error)
+	return rows
+
+def read_refresh_manifest(path_to_archive):
+	"""Read the manifest refresh_datasets wrote to an archive
+	Parameters
+	----------
+	path_to_archive : string
+					  path to the archive directory
+	Returns
+	-------
+	manifest_df : pandas.DataFrame
+				  one row per file or directory moved (see REFRESH_MANIFEST_COLUMNS)
+	"""
+	return pd.read_csv(os.path.join(path_to_archive, REFRESH_MANIFEST_NAME), dtype=str,
+					   keep_default_na=False)
+
+def refresh_datasets(path_to_datasets, path_to_archive, max_workers=None, dry_run=False):
+	"""Clean datasets of all traces of preprocessing and provenance collection, moving the
+	   preprocessed files and prov_data directories to the archive with renames, a dataset
+	   per worker of a pool of threads, and writing a manifest of what was moved to the
+	   archive (see REFRESH_MANIFEST_COLUMNS), which restore_datasets uses
 	Parameters
 	----------
 	path_to_datasets : string 
 					   path to the directory containing processed datasets
 	path_to_archive : string
 					  path to the directory to move preprocessed files to
+	max_workers : int
+				  number of datasets to clean at once (default: READERS_PER_CORE per core
+				  allocated to this job)
+	dry_run : bool
+			  whether to only list what would be moved, changing nothing
+	Returns
+	-------
+	manifest_df : pandas.DataFrame
+				  one row per file or directory moved (or that would be, in a dry run)
 	"""
-	# get list of dataset directories, ignoring macOS directory metadata file (if present)
-	doi_directs = [doi for doi in os.listdir(path_to_datasets) if doi != '.DS_Store']
-
-	# create a new archive directory, deleting any directories with the same path and name
-	if os.path.exists(path_to_archive):
-		shutil.rmtree(path_to_archive)
-	os.makedirs(path_to_archive)
-
-	# iterate through directories, deleting prov_data directory and preprocessed files
-	for my_doi in doi_directs:
-		# assemble paths
-		doi_dir_path = path_to_datasets + '/' + my_doi
-		# get list of ignoring macOS directory metadata file (if present)
-		doi_files = [my_file for my_file in os.listdir(doi_dir_path) if\
-					 my_file != '.DS_Store' and re.match('.*__preproc__', my_file)]
-
-		# create a new doi archive directory, deleting any directories with the same path and name
-		if os.path.exists(path_to_archive + "/" + my_doi):
-			shutil.rmtree(path_to_archive + "/" + my_doi)
-		os.makedirs(path_to_archive + "/" + my_doi)
-
-		# remove preprocessed files
-		for my_file in doi_files:
-			doi_file_path = doi_dir_path + '/' + my_file
+	# get list of dataset directories, ignoring hidden entries such as the macOS directory
+	# metadata file and the work directories of replace_tree (if present)
+	doi_directs = sorted(entry.name for entry in os.scandir(path_to_datasets)
+						 if not entry.name.startswith('.') and entry.is_dir())
+	def remove_entry(entry):
+		if entry.is_dir(follow_symlinks=False):
+			shutil.rmtree(entry.path)
+		else:
+			os.remove(entry.path)
+
+	def refresh(my_doi):
+		return refresh_dataset(path_to_datasets, my_doi, path_to_archive, dry_run)
+
+	with ThreadPoolExecutor(max_workers=max_workers or READERS_PER_CORE * available_cores()) as executor:
+		if not dry_run:
+			# create a new archive directory, deleting any directories with the same path and
+			# name (after moving it aside, so that its datasets are deleted in parallel)
+			if os.path.exists(path_to_archive):
+				old_archive = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(path_to_archive)),
+											   prefix='.' + os.path.basename(path_to_archive) + '.')
+				os.rename(path_to_archive, old_archive + '/archive')
+				list(executor.map(remove_entry, list(os.scandir(old_archive + '/archive'))))
+				shutil.rmtree(old_archive)
+			os.makedirs(path_to_archive)
+
+		rows = [row for dataset_rows in executor.map(refresh, doi_directs) for row in dataset_rows]
+
+	manifest_df = pd.DataFrame(rows, columns=REFRESH_MANIFEST_COLUMNS)
+	if not dry_run:
+		manifest_df.to_csv(os.path.join(path_to_archive, REFRESH_MANIFEST_NAME), index=False)
+	return manifest_df
+
+def restore_dataset(path_to_datasets, path_to_archive, manifest_df):
+	"""Move the files and directories of one dataset back from the archive
+	Parameters
+	----------
+	path_to_datasets : string
+					   path to the directory containing processed datasets
+	path_to_archive : string
+					  path to the archive directory
+	manifest_df : pandas.DataFrame
+				  the dataset's rows of the manifest
+	Returns
+	-------
+	rows : list of dict
+		   the rows, with any error restoring them
+	"""
+	rows = []
+	for row in manifest_df.to_dict('records'):
+		source = path_to_datasets + '/' + row['source']
+		destination = path_to_archive + '/' + row['destination']
+		if row['error']:
+			# never archived
+			continue
+		if os.path.lexists(source):
+			# don't overwrite what a later run wrote
+			row['error'] = "already exists"
+		else:
 			try:
-				shutil.move(doi_file_path, '/'.join([path_to_archive, my_doi, my_file]))
-			except OSError:
-				pass
-		# remove prov_data directory
+				move_path(destination, source)
+			except OSError as error:
+				row['error'] = repr(error)
+		rows.append(row)
+	return rows
+
+def restore_datasets(path_to_datasets, path_to_archive, max_workers=None):
+	"""Move what refresh_datasets archived back into the datasets, from its manifest
+	Parameters
+	----------
+	path_to_datasets : string
+					   path to the directory containing processed datasets
+	path_to_archive : string
+					  path to the archive directory written by refresh_datasets
+	max_workers : int
+				  number of datasets to restore at once (default: READERS_PER_CORE per core
+				  allocated to this job)
+	Returns
+	-------
+	restored_df : pandas.DataFrame
+				  one row per file or directory archived (see REFRESH_MANIFEST_COLUMNS),
+				  with the error of any that couldn't be restored
+	"""
+	manifest_df = read_refresh_manifest(path_to_archive)
+
+	def restore(group):
+		return restore_dataset(path_to_datasets, path_to_archive, group[1])
+
+	with ThreadPoolExecutor(max_workers=max_workers or READERS_PER_CORE * available_cores()) as executor:
+		rows = [row for dataset_rows in executor.map(restore, manifest_df.groupby('dataset', sort=False))
+				for row in dataset_rows]
+	return pd.DataFrame(rows, columns=REFRESH_MANIFEST_COLUMNS)
+
+def clone_file(source, destination):
+	"""Make a file a copy-on-write clone (reflink) of another, sharing its blocks until
+	   either is written to
+	Parameters
+	----------
+	source : string
+			 path to the file to clone
+	destination : string
+				  path to create the clone at
+	Raises
+	------
+	OSError
+	if the platform or filesystem can't clone files
+	"""
+	if fcntl is None:
+		raise OSError(errno.EOPNOTSUPP, "reflinks are not supported on this platform")
+	try:
+		with open(source, 'rb') as source_handle, open(destination, 'wb') as destination_handle:
+			fcntl.ioctl(destination_handle.fileno(), FICLONE, source_handle.fileno())
+		shutil.copystat(source, destination)
+	except OSError:
+		if os.path.exists(destination):
+			os.remove(destination)
+		raise
+
+def link_file(source, destination, link_modes=SNAPSHOT_LINK_MODES, writable=False):
+	"""Create a file with the contents of another in the first of link_modes that works
+	Parameters
+	----------
+	source : string
+			 path to the file
+	destination : string
+				  path to create the new file at
+	link_modes : list of string
+				 "reflink", "hardlink" and/or "copy" (see SNAPSHOT_LINK_MODES), in the order
+				 to try them
+	writable : bool
+			   whether to make a reflinked or copied file writable by its owner (a hardlinked
+			   file shares the permissions of the source)
+	Returns
+	-------
+	string
+	the link mode used
+	"""
+	for link_mode in link_modes:
 		try:
-			shutil.rmtree(doi_dir_path + '/prov_data')
-		except:
-			pass
+			if link_mode == 'reflink':
+				clone_file(source, destination)
+			elif link_mode == 'hardlink':
+				os.link(source, destination)
+			else:
+				shutil.copy2(source, destination)
+		except OSError:
+			if link_mode == link_modes[-1]:
+				raise
+			continue
+		if writable and link_mode != 'hardlink':
+			os.chmod(destination, os.stat(destination).st_mode | stat.S_IWUSR)
+		return link_mode
+
+def link_tree(source_dir, destination_dir, link_mode='auto', writable=False):
+	"""Recreate a directory tree, creating its files with link_file
+	Parameters
+	----------
+	source_dir : string
+				 path to the directory tree to recreate
+	destination_dir : string
+					  path to recreate it at, which must not exist
+	link_mode : string
+				"reflink", "hardlink" or "copy", or "auto" to use the cheapest that works
+	writable : bool
+			   whether to make reflinked or copied files writable by their owner
+	Returns
+	-------
+	(num_files, link_modes) : tuple of (int, set of string)
+							  the number of files created, and the link modes used
+	"""
+	link_modes = SNAPSHOT_LINK_MODES if link_mode == 'auto' else [link_mode]
+	used_modes = set()
+	num_files = 0
+	os.makedirs(destination_dir)
+	for root, dirs, files in os.walk(source_dir):
+		destination_root = os.path.join(destination_dir, os.path.relpath(root, source_dir))
+		for my_dir in dirs:
+			os.mkdir(os.path.join(destination_root, my_dir))
+		for my_file in files:
+			used_mode = link_file(os.path.join(root, my_file), os.path.join(destination_root, my_file),
+								  link_modes, writable)
+			# don't retry the modes that failed on every later file
+			link_modes = link_modes[link_modes.index(used_mode):]
+			used_modes.add(used_mode)
+			num_files += 1
+	return num_files, used_modes
+
+def replace_tree(build, path):
+	"""Build a directory tree beside path and swap it in for whatever is at path, deleting
+	   the old tree only once the new one is in place
+	Parameters
+	----------
+	build : function
+			builds the new tree at the path it's given, returning a result
+	path : string
+		   path to the directory tree to replace
+	Returns
+	-------
+	what build returned
+	"""
+	parent_dir = os.path.dirname(os.path.abspath(path))
+	prefix = '.' + os.path.basename(path) + '.'
+	# clean up after an earlier call that died before swapping the new tree in, putting the
+	# old tree back if it had already been moved aside. The work directory is hidden, so the
+	# dataset listings skip it in the meantime
+	for entry in os.scandir(parent_dir):
+		if entry.name.startswith(prefix) and entry.name.endswith(REPLACE_TREE_SUFFIX) and \
+				len(entry.name) == len(prefix) + 8 + len(REPLACE_TREE_SUFFIX):
+			if not os.path.exists(path) and os.path.isdir(os.path.join(entry.path, 'old')):
+				os.rename(os.path.join(entry.path, 'old'), path)
+			shutil.rmtree(entry.path)
+	work_dir = tempfile.mkdtemp(dir=parent_dir, prefix=prefix, suffix=REPLACE_TREE_SUFFIX)
+	try:
+		result = build(os.path.join(work_dir, 'new'))
+		if os.path.exists(path):
+			os.rename(path, os.path.join(work_dir, 'old'))
+		os.rename(os.path.join(work_dir, 'new'), path)
+	finally:
+		shutil.rmtree(work_dir)
+	return result
+
+def stat_tree(path):
+	"""Get the size and modification time of every file in a directory tree
+	Parameters
+	----------
+	path : string
+		   path to the directory tree
+	Returns
+	-------
+	dict of string to list of int
+	maps the path of each file, relative to path, to its size and modification time (in ns)
+	"""
+	stats = {}
+	for root, dirs, files in os.walk(path):
+		for my_file in files:
+			file_stat = os.stat(os.path.join(root, my_file))
+			stats[os.path.relpath(os.path.join(root, my_file), path)] = [file_stat.st_size,
+																		 file_stat.st_mtime_ns]
+	return stats
+
+def check_snapshot(snapshot_path):
+	"""Find the files of a snapshot that changed since it was recorded, e.g. written through
+	   a hardlink by a user whom its read-only permissions don't stop (such as root)
+	Parameters
+	----------
+	snapshot_path : string
+					path to the snapshot (see snapshot_dataset)
+	Returns
+	-------
+	list of string
+	paths of the files added, removed or changed, relative to the snapshot
+	"""
+	with open(snapshot_path + SNAPSHOT_RECORD_EXTENSION, 'r') as handle:
+		recorded = json.load(handle)
+	stats = stat_tree(snapshot_path)
+	return sorted(my_file for my_file in set(recorded) | set(stats)
+				  if recorded.get(my_file) != stats.get(my_file))
+
+def snapshot_dataset(dataset_path, snapshot_path, link_mode='auto'):
+	"""Record a read-only pristine snapshot of a freshly downloaded dataset, replacing any
+	   earlier snapshot. With hardlinks the dataset's files share the snapshot's inodes, so
+	   they become read-only too: a script overwriting one of its inputs then fails rather
+	   than changing the snapshot (reflinks don't have this problem). The size and
+	   modification time of every file is recorded beside the snapshot, so that
+	   reset_dataset can check it is still pristine
+	Parameters
+	----------
+	dataset_path : string
+				   path to the dataset directory
+	snapshot_path : string
+					path to record the snapshot at
+	link_mode : string
+				"reflink", "hardlink" or "copy", or "auto" to use the cheapest that works
+	Returns
+	-------
+	summary : dict
+			  the dataset's name, the number of files, the link modes used, the seconds
+			  taken and any error
+	"""
+	start = time.time()
+	summary = {'dataset': os.path.basename(dataset_path), 'num_files': 0, 'link_modes': '', 'error': ''}
+
+	def build(new_path):
+		num_files, link_modes = link_tree(dataset_path, new_path, link_mode)
+		# only the files are made read-only, so that snapshots can still be replaced
+		for root, dirs, files in os.walk(new_path):
+			for my_file in files:
+				file_path = os.path.join(root, my_file)
+				os.chmod(file_path, os.stat(file_path).st_mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+		return num_files, link_modes
+
+	try:
+		num_files, link_modes = replace_tree(build, snapshot_path)
+		record_path = snapshot_path + SNAPSHOT_RECORD_EXTENSION
+		with open(record_path + '.part', 'w') as handle:
+			json.dump(stat_tree(snapshot_path), handle, sort_keys=True)
+		os.replace(record_path + '.part', record_path)
+		summary.update({'num_files': num_files, 'link_modes': ' '.join(sorted(link_modes))})
+	except Exception as error:
+		summary['error'] = repr(error)
+	summary['seconds'] = time.time() - start
+	return summary
+
+def reset_dataset(snapshot_path, dataset_path, link_mode='auto'):
+	"""Rebuild a dataset's working tree from its pristine snapshot, with one link (or clone)
+	   per file, dropping everything preprocessing and provenance collection added to it.
+	   A snapshot that changed since it was recorded is not used
+	Parameters
+	----------
+	snapshot_path : string
+					path to the dataset's snapshot (see snapshot_dataset)
+	dataset_path : string
+				   path to the dataset directory
+	link_mode : string
+				"reflink", "hardlink" or "copy", or "auto" to use the cheapest that works
+	Returns
+	-------
+	summary : dict
+			  the dataset's name, the number of files, the link modes used, the seconds
+			  taken and any error
+	"""
+	start = time.time()
+	summary = {'dataset': os.path.basename(dataset_path), 'num_files': 0, 'link_modes': '', 'error': ''}
+	try:
+		changed_files = check_snapshot(snapshot_path)
+		if changed_files:
+			raise IOError("snapshot changed since it was recorded: " + ', '.join(changed_files))
+		num_files, link_modes = replace_tree(
+			lambda new_path: link_tree(snapshot_path, new_path, link_mode, writable=True), dataset_path)
+		summary.update({'num_files': num_files, 'link_modes': ' '.join(sorted(link_modes))})
+	except Exception as error:
+		summary['error'] = repr(error)
+	summary['seconds'] = time.time() - start
+	return summary
+
+def snapshot_datasets(path_to_datasets, path_to_snapshots, link_mode='auto', overwrite=False,
+					  doi_directs=None, max_workers=None):
+	"""Record a read-only pristine snapshot of every dataset (see snapshot_dataset) on a pool
+	   of threads, to reset them to with reset_datasets
+	Parameters
+	----------
+	path_to_datasets : string
+					   path to the directory containing the downloaded datasets
+	path_to_snapshots : string
+						path to the directory to keep the snapshots in, which should be on the
+						same filesystem for hardlinks or reflinks to work
+	link_mode : string
+				"reflink", "hardlink" or "copy", or "auto" to use the cheapest that works
+	overwrite : bool
+				whether to replace existing snapshots (e.g. after downloading a newer version)
+	doi_directs : list of string
+				  names of the dataset directories to snapshot (default: all of them)
+	max_workers : int
+				  number of datasets to snapshot at once (default: READERS_PER_CORE per core
+				  allocated to this job)
+	Returns
+	-------
+	summary_df : pandas.DataFrame
+				 one row per dataset snapshotted (see SNAPSHOT_SUMMARY_COLUMNS)
+	"""
+	if doi_directs is None:
+		doi_directs = [entry.name for entry in os.scandir(path_to_datasets)
+					   if entry.name.startswith("doi") and entry.is_dir()]
+	if not overwrite:
+		doi_directs = [my_doi for my_doi in doi_directs
+					   if not os.path.exists(path_to_snapshots + '/' + my_doi)]
+	if not os.path.exists(path_to_snapshots):
+		os.makedirs(path_to_snapshots)
+
+	def snapshot(my_doi):
+		return snapshot_dataset(path_to_datasets + '/' + my_doi, path_to_snapshots + '/' + my_doi, link_mode)
+
+	with ThreadPoolExecutor(max_workers=max_workers or READERS_PER_CORE * available_cores()) as executor:
+		summaries = list(executor.map(snapshot, sorted(doi_directs)))
+	return pd.DataFrame(summaries, columns=SNAPSHOT_SUMMARY_COLUMNS)
+
+def reset_datasets(path_to_snapshots, path_to_datasets, link_mode='auto', doi_directs=None,
+				   max_workers=None):
+	"""Reset datasets to their pristine snapshots (see reset_dataset) on a pool of threads,
+	   instead of refreshing them or downloading them again
+	Parameters
+	----------
+	path_to_snapshots : string
+						path to the directory containing the snapshots
+	path_to_datasets : string
+					   path to the directory containing the datasets to reset
+	link_mode : string
+				"reflink", "hardlink" or "copy", or "auto" to use the cheapest that works
+	doi_directs : list of string
+				  names of the dataset directories to reset (default: every one with a snapshot)
+	max_workers : int
+				  number of datasets to reset at once (default: READERS_PER_CORE per core
+				  allocated to this job)
+	Returns
+	-------
+	summary_df : pandas.DataFrame
+				 one row per dataset reset (see SNAPSHOT_SUMMARY_COLUMNS)
+	"""
+	if doi_directs is None:
+		doi_directs = [entry.name for entry in os.scandir(path_to_snapshots)
+					   if entry.name.startswith("doi") and entry.is_dir()]
+
+	def reset(my_doi):
+		return reset_dataset(path_to_snapshots + '/' + my_doi, path_to_datasets + '/' + my_doi, link_mode)
+
+	with ThreadPoolExecutor(max_workers=max_workers or READERS_PER_CORE * available_cores()) as executor:
+		summaries = list(executor.map(reset, sorted(doi_directs)))
+	return pd.DataFrame(summaries, columns=SNAPSHOT_SUMMARY_COLUMNS)
+
+class DirectoryIndex(object):
+	"""Index of every file and directory in a dataset, built with a single os.walk, that
+	   answers find_file, find_dir and find_rel_path lookups without touching the
+	   filesystem. Lookups it can't answer exactly (paths outside the dataset, paths
+	   with "." or ".." components, directories os.walk doesn't descend into such as
+	   symlinks) fall back to the filesystem.
+	Parameters
+	----------
+	root : string
+		   path to the dataset directory
+	"""
+	def __init__(self, root):
+		self.root = root
+		self.build()
+
+	def build(self):
+		"""(Re)walk the dataset directory"""
+		# maps basenames to relative paths, in os.walk order
+		self.files = {}
+		self.dirs = {}
+		# relative paths of every file and directory, and of the directories walked
+		self.file_paths = set()
+		self.dir_paths = set()
+		self.walked = {}
+		# position of every path in os.walk order
+		self.order = {}
+		for root, dirs, files in os.walk(self.root):
+			rel_root = self.relative(root)
+			if rel_root is None:
+				continue
+			# remember modification times to tell when entries are added
+			self.walked[rel_root] = os.stat(root).st_mtime
+			for name in dirs:
+				self.insert(self.join(rel_root, name), is_dir=True)
+			for name in files:
+				self.insert(self.join(rel_root, name), is_dir=False)
+
+	def is_stale(self):
+		"""Check whether any indexed directory has changed since the index was built
+		Returns
+		-------
+		bool
+		"""
+		for rel_root, mtime in self.walked.items():
+			try:
+				if os.stat(self.root + '/' + rel_root).st_mtime != mtime:
+					return True
+			except OSError:
+				return True
+		return False
+
+	def refresh(self):
+		"""Rebuild the index if files have been added or removed since it was built"""
+		if self.is_stale():
+			self.build()
+
+	def add(self, path, is_dir=False):
+		"""Record a file or directory created after the index was built
+		Parameters
+		----------
+		path : string
+			   path to the new file or directory
+		is_dir : bool
+				 whether the path is to a directory
+		"""
+		rel_path = self.relative(path)
+		if rel_path is not None and rel_path != '.':
+			self.insert(rel_path, is_dir)
+
+	def insert(self, rel_path, is_dir):
+		names, paths = (self.dirs, self.dir_paths) if is_dir else (self.files, self.file_paths)
+		if rel_path not in paths:
+			paths.add(rel_path)
+			self.order[rel_path] = len(self.order)
+			names.setdefault(os.path.basename(rel_path), []).append(rel_path)
+			# keep the parent directory's recorded mtime in step with the addition
+			parent = os.path.dirname(rel_path) or '.'
+			if parent in self.walked:
+				try:
+					self.walked[parent] = os.stat(self.root + '/' + parent).st_mtime
+				except OSError:
+					pass
+
+	@staticmethod
+	def join(rel_root, name):
+		return name if rel_root == '.' else rel_root + '/' + name
+
+	def relative(self, path):
+		"""Get path relative to the dataset directory ('.' for the directory itself)
+		Returns
+		-------
+		string
+		relative path, or None if path isn't a plain path inside the dataset
+		"""
+		if path == self.root:
+			return '.'
+		if not path.startswith(self.root + '/'):
+			return None
+		rel_path = path[len(self.root) + 1:]
+		if any(part in ('', '.', '..') for part in rel_path.split('/')):
+			return None
+		return rel_path
+
+	def find(self, pattern, path, is_dir=False):
+		"""Equivalent of find_file (or find_dir) over the index
+		Parameters
+		----------
+		pattern : string
+				  unix-style pattern to attempt to match to a file (or directory)
+		path : string
+			   path to the directory to search
+		is_dir : bool
+				 whether to search for a directory
+		Returns
+		-------
+		string
+		path to a matching file (or directory) relative to path, or the empty string
+		"""
+		rel_root = self.relative(path)
+		if rel_root not in self.walked:
+			return (find_dir if is_dir else find_file)(pattern, path)
+		names = self.dirs if is_dir else self.files
+		# most patterns are plain file names, which can be looked up directly
+		if any(char in pattern for char in '*?['):
+			candidates = [rel_path for name in names if fnmatch.fnmatch(name, pattern)
+						  for rel_path in names[name]]
+			candidates.sort(key=self.order.get)
+		else:
+			candidates = names.get(pattern, [])
+		for rel_path in candidates:
+			if rel_root == '.':
+				return rel_path
+			if rel_path.startswith(rel_root + '/'):
+				return rel_path[len(rel_root) + 1:]
+		return ''
+
+	def exists(self, path):
+		"""Equivalent of os.path.exists over the index"""
+		return self.lookup(path, os.path.exists, self.file_paths, self.dir_paths)
 
-def find_file(pattern, path):
+	def isdir(self, path):
+		"""Equivalent of os.path.isdir over the index"""
+		return self.lookup(path, os.path.isdir, self.dir_paths)
+
+	def lookup(self, path, test_fun, *path_sets):
+		rel_path = self.relative(path)
+		# the index only knows the contents of directories it has walked
+		if rel_path is None or (os.path.dirname(rel_path) or '.') not in self.walked:
+			return test_fun(path)
+		if rel_path == '.':
+			return True
+		return any(rel_path in path_set for path_set in path_sets)
+
+def find_file(pattern, path, index=None):
 	"""Recursively search the directory pointed to by path for a file matching pattern.
 	   Inspired by https://stackoverflow.com/questions/120656/directory-listing-in-python
 	Parameters
@@ -301,12 +1948,16 @@ def find_file(pattern, path):
 			  unix-style pattern to attempt to match to a file
 	path : string
 		   path to the directory to search
+	index : DirectoryIndex
+			index of the dataset containing path, to search instead of the filesystem
 
 	Returns 
 	-------
 	string 
 	path to a matching file or the empty string
 	"""
+	if index is not None:
+		return index.find(pattern, path, is_dir=False)
 	len_root_path = len(path.split('/'))
 	for root, dirs, files in os.walk(path):
 		for name in files:
@@ -314,7 +1965,7 @@ def find_file(pattern, path):
 				return '/'.join((os.path.join(root, name)).split('/')[len_root_path:])
 	return ''
 
-def find_dir(pattern, path):
+def find_dir(pattern, path, index=None):
 	"""Recursively search the directory pointed to by path for a directory matching pattern.
 	   Inspired by https://stackoverflow.com/questions/120656/directory-listing-in-python
 	Parameters
@@ -323,12 +1974,16 @@ def find_dir(pattern, path):
 			  unix-style pattern to attempt to match to a directory
 	path : string
 		   path to the directory to search
+	index : DirectoryIndex
+			index of the dataset containing path, to search instead of the filesystem
 
 	Returns 
 	-------
 	string 
 	path to a matching directory or the empty string
 	"""
+	if index is not None:
+		return index.find(pattern, path, is_dir=True)
 	len_root_path = len(path.split('/'))
 	for root, dirs, files in os.walk(path):
 		for name in dirs:
@@ -348,7 +2003,7 @@ def get_r_filename(r_file):
 	string
 	name of R file without file extension
 	"""
-	return re.split('\.[rR]$', r_file)[0]
+	return R_EXTENSION_REGEX.split(r_file)[0]
 
 def extract_filename(path):
 	"""Parse out the file name from a file path
@@ -365,12 +2020,12 @@ def extract_filename(path):
 	# get last group of a path
 	if path:
 		file_name = os.path.basename(path)
-		file_name = re.match(".*?\s*(\S+\.[^ \s,]+)\s*", file_name)
+		file_name = FILENAME_REGEX.match(file_name)
 		if file_name:
 			return file_name.group(1)
 	return ''
 
-def find_rel_path(path, root_dir, is_dir=False):
+def find_rel_path(path, root_dir, is_dir=False, index=None):
 	"""Attempt to search along a user-provided absolute path for 
 	   the provided file or directory
 	Parameters
@@ -381,6 +2036,8 @@ def find_rel_path(path, root_dir, is_dir=False):
 			   root directory to begin search from
 	is_dir : bool
 			 whether the path is to a directory
+	index : DirectoryIndex
+			index of the dataset containing root_dir, to check instead of the filesystem
 	Returns
 	-------
 	rel_path : string
@@ -390,6 +2047,8 @@ def find_rel_path(path, root_dir, is_dir=False):
 	path_dirs = path.split('/')
 	item_name = path_dirs[-1]
 	test_fun = os.path.isdir if is_dir else os.path.exists
+	if index is not None:
+		test_fun = index.isdir if is_dir else index.exists
 	if test_fun(root_dir + '/' + item_name):
 		return item_name
 	else:
@@ -406,21 +2065,285 @@ def find_rel_path(path, root_dir, is_dir=False):
 				return try_path
 		return ''
 
-def maybe_import_operation(r_command):
-	"""Searches an r command for common import functions
+def maybe_import_operation(r_command):
+	"""Searches an r command for common import functions
+	Parameters
+	----------
+	r_command : string
+				command from R file
+	Returns
+	-------
+	bool
+	"""
+	return PREPROC_RULES['import'][0].search(r_command) is not None
+
+def relines(chunks):
+	"""Re-split strings written one after another into lines, exactly as reading
+	   them back from a file with readlines() would
+	Parameters
+	----------
+	chunks : iterable of string
+			 strings in the order they would be written
+	Returns
+	-------
+	generator of string
+	lines, each ending in a newline except possibly the last
+	"""
+	buffer = ''
+	for chunk in chunks:
+		buffer += chunk
+		if '\n' in buffer:
+			lines = buffer.split('\n')
+			for line in lines[:-1]:
+				yield line + '\n'
+			buffer = lines[-1]
+	if buffer:
+		yield buffer
+
+def transform_setwd(lines, script_dir, index=None):
+	"""Rewrite calls to setwd to point at the matching directory in the dataset,
+	   deleting the calls for which no directory can be found
+	Parameters
+	----------
+	lines : iterable of string
+			lines of the R script
+	script_dir : string
+				 path to the directory containing the R file
+	index : DirectoryIndex
+			index of the dataset to look for directories in (default: search the filesystem)
+	Returns
+	-------
+	generator of string
+	rewritten lines
+	"""
+	setwd_regex, setwd_literal = PREPROC_RULES['setwd']
+	# for storing return value
+	curr_wd = script_dir
+
+	for line in lines:
+		# ignore commented lines
+		if line.startswith("#"):
+			yield line
+		else:
+			contains_setwd = setwd_literal in line and setwd_regex.match(line)
+			# if the line contains a call to setwd
+			if contains_setwd:
+				# try to find the path to the working directory (if any)
+				path_to_wd = find_rel_path(contains_setwd.group(1), curr_wd, is_dir=True,
+										   index=index)
+				if not path_to_wd:
+					path_to_wd = find_dir(os.path.basename(contains_setwd.group(1)),
+										  curr_wd, index)
+				# if a path was found, append modified setwd call to file
+				if path_to_wd and path_to_wd != curr_wd:
+					curr_wd += '/' + path_to_wd
+					yield "setwd(" + "\"" + path_to_wd + "\"" + ")\n"
+			else:
+				yield line
+
+def transform_source(lines, script_dir, index=None):
+	"""Rewrite calls to source to point at the preprocessed version of the sourced
+	   file, deleting the calls for which no file can be found
+	Parameters
+	----------
+	lines : iterable of string
+			lines of the R script
+	script_dir : string
+				 path to the directory containing the R file
+	index : DirectoryIndex
+			index of the dataset to look for files in (default: search the filesystem)
+	Returns
+	-------
+	generator of string
+	rewritten lines
+	"""
+	setwd_regex, setwd_literal = PREPROC_RULES['setwd']
+	source_regex, source_literal = PREPROC_RULES['source']
+	curr_wd = script_dir
+
+	for line in lines:
+		# if not a commented line
+		if not line.startswith('#'):
+			contains_setwd = setwd_literal in line and setwd_regex.match(line)
+			# if the line contains a call to setwd
+			if contains_setwd:
+				curr_wd += '/' + contains_setwd.group(1)
+			sourced_file = source_literal in line and source_regex.match(line)
+			if sourced_file:
+				sourced_file = sourced_file.group(1)
+				# replace windows pathing with POSIX style
+				line = line.replace('\\\\', '/')
+				# try to fine the relative path
+				rel_path = find_rel_path(sourced_file, curr_wd, index=index)
+				if not rel_path:
+					rel_path = find_file(extract_filename(sourced_file), curr_wd, index)
+				# if relative path found, recursively call function on the sourced file
+				if rel_path:
+					sourced_filename = get_r_filename(os.path.basename(rel_path))
+					yield 'source(' + '/'.join(rel_path.split('/')[:-1]) +\
+						  '\"'+ sourced_filename + '__preproc__.R\")\n'
+			else:
+				yield line
+		else:
+			yield line
+
+def transform_lib(lines, prelude):
+	"""Replace calls to "library", "require", and "install.packages" with "install_and_load",
+	   declaring it at the top of the script and again after every call to rm
+	Parameters
+	----------
+	lines : iterable of string
+			lines of the R script
+	prelude : string
+			  R code declaring "install_and_load"
+	Returns
+	-------
+	generator of string
+	rewritten lines
+	"""
+	package_rules = [PREPROC_RULES['library'], PREPROC_RULES['require'],
+					 PREPROC_RULES['install.packages']]
+	rm_regex, rm_literal = PREPROC_RULES['rm']
+	# add in declaration for "install_and_load" at the head of the preprocessed file
+	yield prelude
+	for line in lines:
+		# ignore commented lines
+		if line.startswith("#"):
+			yield line
+		else:
+			# replace "library", then "require", then "install.packages" calls
+			replaced = line
+			for package_regex, package_literal in package_rules:
+				if package_literal in replaced:
+					replaced = package_regex.sub("install_and_load(\"\\1\")", replaced)
+			# write the preprocessed result
+			yield replaced
+			# if the line clears the environment, re-declare "install_and_load" immediately after
+			if rm_literal in line and rm_regex.match(line):
+				yield prelude
+
+def transform_file_paths(lines, r_file, script_dir, report_missing=False, index=None,
+						 skip_lines=()):
+	"""Rewrite paths of files read by import functions to point at the matching file
+	   in the dataset
+	Parameters
+	----------
+	lines : iterable of string
+			lines of the R script
+	r_file: string
+			name of the R file being preprocessed
+	script_dir : string
+				 path to the directory containing the R file
+	report_missing : bool
+					 report when a file can't be found
+	index : DirectoryIndex
+			index of the dataset to look for files in (default: search the filesystem)
+	skip_lines : collection of string
+				 lines to pass through untouched, such as an injected source() of the prelude
+	Returns
+	-------
+	generator of string
+	rewritten lines
+	"""
+	# path to write missing files to
+	report_path = script_dir + "/prov_data/missing_files.txt"
+	setwd_regex, setwd_literal = PREPROC_RULES['setwd_path']
+	path_regex, path_literal = PREPROC_RULES['file_path']
+	curr_wd = script_dir
+
+	for line in lines:
+		# if not a commented or injected line
+		if not line.startswith('#') and line not in skip_lines:
+			contains_setwd = setwd_literal in line and setwd_regex.match(line)
+			# track calls to setwd to look in the right place for files
+			if contains_setwd:
+				curr_wd += '/' + contains_setwd.group(1)
+			potential_path = path_literal in line and path_regex.search(line)
+			if potential_path:
+				# replace windows pathing with POSIX style
+				line = line.replace('\\\\', '/')
+				if maybe_import_operation(line):
+					potential_path = potential_path.group(1)
+					if potential_path:
+						rel_path = find_rel_path(potential_path, curr_wd, index=index)
+						if not rel_path:
+							# try to find the path to the working directory (if any)
+							rel_path = find_file(extract_filename(potential_path), curr_wd, index)
+						# if a path was found, change the file part of the line
+						if rel_path:
+							line = re.sub(potential_path, rel_path, line)
+						# if the path wasn't found, report file as missing
+						elif report_missing:
+							if not os.path.exists(script_dir + "/prov_data"):
+								os.makedirs(script_dir + "/prov_data")
+							with open(report_path, 'a+') as missing_out:
+								missing_out.write(r_file + ',' + potential_path + '\n')
+							if index is not None:
+								index.add(script_dir + "/prov_data", is_dir=True)
+								index.add(report_path)
+		yield line
+
+def read_prelude(prelude_path=PRELUDE_PATH):
+	"""Read the R code declaring "install_and_load", as it is injected into scripts.
+	   Each prelude is only read from disk once per process.
 	Parameters
 	----------
-	r_command : string
-				command from R file
+	prelude_path : string
+				   path to install_and_load.R (default: the copy next to this module)
 	Returns
 	-------
-	bool
+	string
 	"""
-	r_import_list = ['read', 'load', 'fromJSON', 'import', 'scan']
-	for pattern in r_import_list:
-		if re.search(pattern, r_command):
-			return True
-	return False
+	if prelude_path not in PRELUDE_CACHE:
+		with open(prelude_path, 'r') as install_and_load:
+			PRELUDE_CACHE[prelude_path] = ''.join(install_and_load.readlines()) + "\n"
+	return PRELUDE_CACHE[prelude_path]
+
+def source_prelude(shared_prelude):
+	"""R code that declares "install_and_load" by sourcing a shared copy of the prelude,
+	   rather than inlining it
+	Parameters
+	----------
+	shared_prelude : string
+					 path to the shared install_and_load.R, as the R scripts will see it
+	Returns
+	-------
+	string
+	"""
+	return 'source("' + shared_prelude + '")\n'
+
+def write_shared_prelude(shared_prelude):
+	"""Write a copy of the prelude for preprocessed scripts to source
+	Parameters
+	----------
+	shared_prelude : string
+					 path to write install_and_load.R to
+	"""
+	shared_dir = os.path.dirname(os.path.abspath(shared_prelude))
+	if not os.path.isdir(shared_dir):
+		os.makedirs(shared_dir)
+	with open(shared_prelude, 'w') as outfile:
+		outfile.write(read_prelude())
+
+def rewrite_file(source_path, target_path, transform, *args):
+	"""Write the lines of source_path, rewritten by transform, to target_path
+	Parameters
+	----------
+	source_path : string
+				  path to the R file to read
+	target_path : string
+				  path to write the rewritten R file to (wiped first)
+	transform : function
+				one of the transform_* functions
+	args : 
+		   arguments to pass to transform after the lines
+	"""
+	# wipe the preprocessed file and open it for writing
+	with open(target_path, 'w') as outfile:
+		# write code from .R file, replacing function calls as necessary
+		with open(source_path, 'r') as infile:
+			for line in transform(infile.readlines(), *args):
+				outfile.write(line)
 
 def preprocess_setwd(r_file, script_dir, from_preproc=False):
 	"""Attempt to correct setwd errors by finding the correct directory or deleting the function call
@@ -449,32 +2372,7 @@ def preprocess_setwd(r_file, script_dir, from_preproc=False):
 	else:
 		file_to_copy = file_path
 
-	# for storing return value
-	curr_wd = script_dir
-
-	# wipe the preprocessed file and open it for writing
-	with open(preproc_path, 'w') as outfile:
-		# write code from .R file, replacing function calls as necessary
-		with open(file_to_copy, 'r') as infile:
-			for line in infile.readlines():
-				# ignore commented lines
-				if re.match("^#", line):
-					outfile.write(line)
-				else:
-					contains_setwd = re.match("\s*setwd\s*\(\"?([^\"]*)\"?\)", line)
-					# if the line contains a call to setwd
-					if contains_setwd:
-						# try to find the path to the working directory (if any)
-						path_to_wd = find_rel_path(contains_setwd.group(1), curr_wd, is_dir=True)
-						if not path_to_wd:
-							path_to_wd = find_dir(os.path.basename(contains_setwd.group(1)),
-												  curr_wd)
-						# if a path was found, append modified setwd call to file
-						if path_to_wd and path_to_wd != curr_wd:
-							curr_wd += '/' + path_to_wd
-							outfile.write("setwd(" + "\"" + path_to_wd + "\"" + ")\n")
-					else:
-						outfile.write(line)
+	rewrite_file(file_to_copy, preproc_path, transform_setwd, script_dir)
 	
 	# remove the file with _temp suffix if file was previously preprocessed
 	if from_preproc:
@@ -511,37 +2409,7 @@ def preprocess_lib(r_file, path, from_preproc=False):
 	else:
 		file_to_copy = file_path
 
-	# wipe the preprocessed file and open it for writing
-	with open(preproc_path, 'w') as outfile:
-		# add in declaration for "install_and_load" at the head of the preprocessed file
-		with open("install_and_load.R", 'r') as install_and_load:
-			for line in install_and_load.readlines():
-				outfile.write(line)
-			outfile.write("\n")
-		# write code from .R file, replacing function calls as necessary
-		with open(file_to_copy, 'r') as infile:
-			for line in infile.readlines():
-				# ignore commented lines
-				if re.match("^#", line):
-					outfile.write(line)
-				else:
-					# replace "library" calls
-					library_replace = re.sub("library\s*\(\"?([^\"]*)\"?\)",
-											 "install_and_load(\"\\1\")", line)
-					# replace "require" calls
-					require_replace = re.sub("require\s*\(\"?([^\"]*)\"?\)",
-											 "install_and_load(\"\\1\")", library_replace)
-					# replace "install.packages" calls
-					install_replace = re.sub("install.packages\s*\(\"?([^\"]*)\"?\)",
-											 "install_and_load(\"\\1\")", require_replace)
-					# write the preprocessed result
-					outfile.write(install_replace)
-					# if the line clears the environment, re-declare "install_and_load" immediately after
-					if re.match("^\s*rm\s*\(", line):
-						with open("install_and_load.R", 'r') as install_and_load:
-							for line in install_and_load.readlines():
-								outfile.write(line)
-							outfile.write("\n")
+	rewrite_file(file_to_copy, preproc_path, transform_lib, read_prelude())
 	
 	# remove the file with _temp suffix if file was previously preprocessed
 	if from_preproc:
@@ -572,8 +2440,6 @@ def preprocess_file_paths(r_file, script_dir, from_preproc=False, report_missing
 	preproc_path = script_dir + "/" + filename + "__preproc__" + ".R"
 	# path to temp file, named with suffix "_temp"
 	file_to_copy = script_dir + "/" + filename + "_temp" + ".R"
-	# path to write missing files to
-	report_path = script_dir + "/prov_data/missing_files.txt" 
 	# if file has already been preprocessed, create _temp file to copy from
 	if from_preproc:
 		try:
@@ -583,40 +2449,8 @@ def preprocess_file_paths(r_file, script_dir, from_preproc=False, report_missing
 	else:
 		file_to_copy = file_path
 
-	curr_wd = script_dir
-
-	# wipe the preprocessed file and open it for writing
-	with open(preproc_path, 'w') as outfile:
-		# write code from .R file, replacing function calls as necessary
-		with open(file_to_copy, 'r') as infile:
-			for line in infile.readlines():
-				# if not a commented line
-				if not re.match('^#', line):
-					contains_setwd = re.match("\s*setwd\s*\(\"?([^\"]+)\"?\)", line)
-					# track calls to setwd to look in the right place for files
-					if contains_setwd:
-						curr_wd += '/' + contains_setwd.group(1)
-					potential_path = re.search('\((?:.*?file\s*=\s*|\s*)[\"\']([^\"]+\.\w+)[\"\']', line)
-					if potential_path:
-						# replace windows pathing with POSIX style
-						line = re.sub(re.escape('\\\\'), '/', line)
-						if maybe_import_operation(line):
-							potential_path = potential_path.group(1)
-							if potential_path:
-								rel_path = find_rel_path(potential_path, curr_wd)
-								if not rel_path:
-									# try to find the path to the working directory (if any)
-									rel_path = find_file(extract_filename(potential_path), curr_wd)
-								# if a path was found, change the file part of the line
-								if rel_path:
-									line = re.sub(potential_path, rel_path, line)
-								# if the path wasn't found, report file as missing
-								elif report_missing:
-									if not os.path.exists(script_dir + "/prov_data"):
-										os.makedirs(script_dir + "/prov_data")
-									with open(report_path, 'a+') as missing_out:
-										missing_out.write(r_file + ',' + potential_path + '\n')
-				outfile.write(line)
+	rewrite_file(file_to_copy, preproc_path, transform_file_paths, r_file, script_dir,
+				 report_missing)
 	
 	# remove the file with _temp suffix if file was previously preprocessed
 	if from_preproc:
@@ -649,37 +2483,8 @@ def preprocess_source(r_file, script_dir, from_preproc=False):
 		os.rename(preproc_path, file_to_copy)
 	else:
 		file_to_copy = file_path
-	curr_wd = script_dir
 
-	# wipe the preprocessed file and open it for writing
-	with open(preproc_path, 'w') as outfile:
-		# write code from .R file, replacing function calls as necessary
-		with open(file_to_copy, 'r') as infile:
-			for line in infile.readlines():
-				# if not a commented line
-				if not re.match('^#', line):
-					contains_setwd = re.match("\s*setwd\s*\(\"?([^\"]*)\"?\)", line)
-					# if the line contains a call to setwd
-					if contains_setwd:
-						curr_wd += '/' + contains_setwd.group(1)
-					sourced_file = re.match('^\s*source\s*\((?:.*?file\s*=\s*|\s*)[\"\']([^\"]+\.[Rr])[\"\']', line)
-					if sourced_file:
-						sourced_file = sourced_file.group(1)
-						# replace windows pathing with POSIX style
-						line = re.sub(re.escape('\\\\'), '/', line)
-						# try to fine the relative path
-						rel_path = find_rel_path(sourced_file, curr_wd)
-						if not rel_path:
-							rel_path = find_file(extract_filename(sourced_file), curr_wd)
-						# if relative path found, recursively call function on the sourced file
-						if rel_path:
-							sourced_filename = get_r_filename(os.path.basename(rel_path))
-							outfile.write('source(' + '/'.join(rel_path.split('/')[:-1]) +\
-										   '\"'+ sourced_filename + '__preproc__.R\")\n')
-					else:
-						outfile.write(line)
-				else:
-					outfile.write(line)
+	rewrite_file(file_to_copy, preproc_path, transform_source, script_dir)
 	
 	# remove the file with _temp suffix if file was previously preprocessed
 	if from_preproc:
@@ -688,8 +2493,42 @@ def preprocess_source(r_file, script_dir, from_preproc=False):
 		except:
 			pass
 
-def all_preproc(r_file, path, error_string="error"):
-	"""Attempt to correct setwd, file path, and library errors
+def preprocess_lines(lines, r_file, script_dir, prelude, report_missing=False, index=None):
+	"""Apply the setwd, source, library and file path rewrites to the lines of an R script
+	   in memory, in the same order (and with the same result) as running preprocess_source,
+	   preprocess_lib and preprocess_file_paths one after the other
+	Parameters
+	----------
+	lines : iterable of string
+			lines of the R script
+	r_file: string
+			name of the R file being preprocessed
+	script_dir : string
+				 path to the directory containing the R file
+	prelude : string
+			  R code declaring "install_and_load"
+	report_missing : bool
+					 report when a file can't be found
+	index : DirectoryIndex
+			index of the dataset to look for files and directories in
+	Returns
+	-------
+	lines : list of string
+			preprocessed lines
+	"""
+	passes = [(transform_setwd, (script_dir, index)),
+			  (transform_source, (script_dir, index)),
+			  (transform_lib, (prelude,)),
+			  (transform_file_paths, (r_file, script_dir, report_missing, index, (prelude,)))]
+	# each pass sees the previous pass's output split into lines, as if it had
+	# been written out and read back in, and runs to completion before the next
+	for transform, args in passes:
+		lines = list(relines(transform(lines, *args)))
+	return lines
+
+def all_preproc(r_file, path, error_string="error", index=None, shared_prelude=None):
+	"""Attempt to correct setwd, file path, and library errors. The script is read once,
+	   rewritten in memory and written to its "__preproc__" file once.
 	Parameters
 	----------
 	r_file: string
@@ -699,6 +2538,12 @@ def all_preproc(r_file, path, error_string="error"):
 	error_string : string
 				   original error obtained by running the R script, defaults to
 				   "error", which will perform the preprocessing
+	index : DirectoryIndex
+			index of the dataset to look for files and directories in (default: a new
+			index of path, or no index for scripts that ran successfully)
+	shared_prelude : string
+					 path of a shared install_and_load.R for the script to source, instead
+					 of inlining the prelude (default: inline it)
 	"""
 	# parse out filename and construct file path
 	filename = get_r_filename(r_file)
@@ -707,12 +2552,107 @@ def all_preproc(r_file, path, error_string="error"):
 	preproc_path = path + "/" + filename + "__preproc__" + ".R"
 	# try all 3 preprocessing methods if there is an error
 	if error_string != "success":
-		preprocess_source(r_file, path, from_preproc=True)
-		preprocess_lib(r_file, path, from_preproc=True)
-		preprocess_file_paths(r_file, path, from_preproc=True, report_missing=True)
+		if index is None:
+			index = DirectoryIndex(path)
+		prelude = source_prelude(shared_prelude) if shared_prelude else read_prelude()
+		with open(file_path, 'r') as infile:
+			lines = preprocess_lines(infile.readlines(), r_file, path, prelude,
+									 report_missing=True, index=index)
+		with open(preproc_path, 'w') as outfile:
+			outfile.writelines(lines)
 	# else just copy and rename the file
 	else:
 		shutil.copyfile(file_path, preproc_path)
+	if index is not None:
+		index.add(preproc_path)
+
+def preprocess_dataset(dataset_path, shared_prelude=None, encoding_cache=None):
+	"""Convert every R script in a dataset to utf-8 and preprocess it with all_preproc
+	Parameters
+	----------
+	dataset_path : string
+				   path to the dataset directory
+	shared_prelude : string
+					 path of a shared install_and_load.R for the scripts to source
+					 (default: inline the prelude in every script)
+	encoding_cache : string
+					 path to the SQLite cache of detected encodings (default: don't use one)
+	Returns
+	-------
+	summary : dict
+			  the dataset's name, whether every script was preprocessed, the number of
+			  scripts, the time taken in seconds and any errors
+	"""
+	start = time.time()
+	errors = []
+	# get filenames to preprocess
+	orig_files = [my_file for my_file in os.listdir(dataset_path) if\
+				  (my_file.endswith(".R") or my_file.endswith(".r")) and\
+				  "__preproc__" not in my_file]
+	try:
+		convert_r_files(dataset_path, replace=True, cache_path=encoding_cache)
+		# index the dataset once for all of its files' path lookups
+		index = DirectoryIndex(dataset_path)
+		# a failing script shouldn't stop the rest of the dataset being preprocessed
+		for orig_file in orig_files:
+			try:
+				all_preproc(orig_file, dataset_path, "error", index, shared_prelude)
+			except Exception as error:
+				errors.append("{}: {!r}".format(orig_file, error))
+	except Exception as error:
+		errors.append(repr(error))
+	return {'dataset': os.path.basename(dataset_path), 'success': not errors,
+			'num_files': len(orig_files), 'seconds': time.time() - start,
+			'error': '; '.join(errors)}
+
+def preprocess_datasets(dataset_dir, processes=None, summary_path=None, shared_prelude=None,
+						encoding_cache=None):
+	"""Preprocess every dataset in a directory on a pool of processes
+	Parameters
+	----------
+	dataset_dir : string
+				  path to the directory containing the datasets
+	processes : int
+				number of worker processes (default: the cores allocated to this job)
+	summary_path : string
+				   path to write a csv summary of every dataset to (default: don't write one)
+	shared_prelude : string
+					 path to write a shared install_and_load.R to, for every script to source
+					 (default: inline the prelude in every script). It should be outside
+					 dataset_dir, which must only hold datasets
+	encoding_cache : string
+					 path to the SQLite cache of detected encodings, so that later passes
+					 don't detect the encodings of unchanged scripts again (default: don't
+					 use one)
+	Returns
+	-------
+	summary_df : pandas.DataFrame
+				 one row per dataset, as returned by preprocess_dataset
+	"""
+	dataset_paths = [os.path.join(dataset_dir, dataset) for dataset in sorted(os.listdir(dataset_dir))
+					 if dataset.startswith("doi")]
+	if shared_prelude:
+		# the scripts are run from their own directories, so source the prelude by absolute path
+		shared_prelude = os.path.abspath(shared_prelude)
+		write_shared_prelude(shared_prelude)
+	encoding_cache = os.path.abspath(encoding_cache) if encoding_cache else None
+	pool = multiprocessing.Pool(processes or available_cores())
+	try:
+		# hand out one dataset at a time, since their sizes vary a lot
+		summaries = list(pool.imap_unordered(functools.partial(preprocess_dataset,
+															   shared_prelude=shared_prelude,
+															   encoding_cache=encoding_cache),
+											 dataset_paths, chunksize=1))
+	finally:
+		pool.close()
+		pool.join()
+
+	summary_df = pd.DataFrame(summaries, columns=['dataset', 'success', 'num_files',
+												   'seconds', 'error'])
+	summary_df = summary_df.sort_values('dataset').reset_index(drop=True)
+	if summary_path:
+		summary_df.to_csv(summary_path, index=False)
+	return summary_df
 
 def get_io_from_prov_json(prov_json):
 	"""Identify input and output files from provenance JSON
@@ -755,6 +2695,116 @@ def get_io_from_prov_json(prov_json):
 
 	return input_files, output_files, file_locs
 
+def in_r_string_or_comment(code, position, line_start=0):
+	"""Check whether a position in R code falls inside a string or a comment
+	Parameters
+	----------
+	code : string
+		   R code, possibly many lines joined by CODE_SEPARATOR
+	position : int
+			   index into code
+	line_start : int
+				 index of the start of the line holding position, where strings and
+				 comments are searched from
+	Returns
+	-------
+	inside : bool
+	"""
+	line_end = code.find(CODE_SEPARATOR, position)
+	for found in R_STRING_OR_COMMENT_REGEX.finditer(code, line_start,
+													len(code) if line_end == -1 else line_end):
+		if found.start() >= position:
+			return False
+		# a comment runs to the end of the line, a string only to its closing quote
+		if found.group(1) is None or found.end() > position:
+			return True
+	return False
+
+def packages_from_code(code_line):
+	"""Get the packages loaded by a line of R code, if it loads any
+	Parameters
+	----------
+	code_line : string
+				line of R code, such as the "rdt:name" of a provenance activity, or many
+				lines joined by CODE_SEPARATOR
+	Returns
+	-------
+	packages : list of string
+			   names of the packages loaded by calls to "library", "require",
+			   "requireNamespace" or "pacman::p_load", in the order they are loaded,
+			   ignoring calls in comments
+	"""
+	packages = []
+	for call in PACKAGE_CALL_REGEX.finditer(code_line):
+		# skip calls of other functions ending in these names, e.g. mylibrary(x) or
+		# foo::library(x)
+		start = call.start()
+		if start and not code_line.endswith(PACKAGE_CALL_NAMESPACES, 0, start) and \
+				(code_line[start - 1].isalnum() or code_line[start - 1] in "._:"):
+			continue
+		# skip calls in comments or strings, e.g. library(x) # library(y) or cat("library(y)")
+		line_start = code_line.rfind(CODE_SEPARATOR, 0, start) + 1
+		line_start = code_line.rfind("\n", line_start, start) + 1 or line_start
+		if any(code_line.find(character, line_start, start) != -1
+			   for character in R_STRING_OR_COMMENT_START) and \
+				in_r_string_or_comment(code_line, start, line_start):
+			continue
+		function = call.group(1)
+		positional = []
+		named = {}
+		# drop comments between arguments spread over several lines
+		call_arguments = call.group(2)
+		if '#' in call_arguments:
+			call_arguments = R_STRING_OR_COMMENT_REGEX.sub(r"\1", call_arguments)
+		for argument in PACKAGE_ARG_SEPARATOR_REGEX.split(call_arguments):
+			name, _, quoted, bare, vector = PACKAGE_ARG_REGEX.match(argument).groups()
+			if name:
+				named[name] = (quoted, bare, vector)
+			else:
+				positional.append((quoted, bare, vector))
+		# with character.only, a bare name is a variable holding the package name
+		character_only = named.get('character.only', (None, None, None))[1] in ('TRUE', 'T')
+
+		# each argument naming packages, and whether a bare name in it is a variable
+		if function == 'p_load':
+			# p_load also takes a character vector of packages in "char"
+			arguments = [(argument, character_only) for argument in positional]
+			if 'char' in named:
+				arguments.append((named['char'], True))
+		else:
+			package_argument = named.get('package') or (positional[0] if positional else None)
+			# requireNamespace only takes the name as a string
+			arguments = [(package_argument, character_only or function == 'requireNamespace')] \
+				if package_argument else []
+		for (quoted, bare, vector), is_variable in arguments:
+			if quoted:
+				packages.append(quoted)
+			elif bare and not is_variable:
+				packages.append(bare)
+			elif vector and function == 'p_load':
+				packages.extend(name for _, name in QUOTED_PACKAGE_REGEX.findall(vector))
+	return packages
+
+def match_package_versions(used_packages, installed_packages):
+	"""Get the version of each package a script used from the packages installed when it ran
+	Parameters
+	----------
+	used_packages : iterable of string
+					names of the packages the script loaded
+	installed_packages : list of dict
+						 the "rdt:installedPackages" of the provenance environment, with
+						 "package" and "version" keys
+	Returns
+	-------
+	packages : list of tuple of (string, string)
+			   list of (package_name, version) tuples, in the order of used_packages,
+			   without the base packages or packages that weren't installed
+	"""
+	# look the versions up in a dict, built once per document
+	versions = {package_dict["package"]: package_dict["version"] for package_dict in installed_packages}
+	return [(package, versions[package]) for package in used_packages
+			if package in versions and package not in BASE_PACKAGES]
+
 def get_pkgs_from_prov_json(prov_json):
 	"""Identify packages used from provenance JSON
 	Parameters
@@ -766,40 +2816,363 @@ def get_pkgs_from_prov_json(prov_json):
 	Returns
 	-------
 	packages : list of tuple of (string, string)
-			   list of (package_name, version) tuples
-	"""
-	# regular expression to capture library name
-	library_regex = re.compile(r"library\((?P<lib_name>.*)\)", re.VERBOSE)
-
-	# set of used libraries
-	used_packages = set()
-
-	# Identify libraries being used in script and add them to set
-	for command in prov_json['activity'].values():
-		code_line = command['rdt:name']
-		# extract the package name from the JSON
-		package_match = re.match('^\s*library\s*\((?:.*?package\s*=\s*|\s*)[\"\']([^\"]+)[\"\']', 
-								 code_line)
-		if not package_match:
-			package_match = re.match('^\s*require\s*\((?:.*?package\s*=\s*|\s*)[\"\']([^\"]+)[\"\']',
-									 code_line)
-		# if a package name was found, add to the set
-		if package_match:
-			used_packages.add(package_match.group(1))
-	
-	# filter out pre-installed packages
-	used_packages -= set(['datasets', 'utils', 'graphics', 'grDevices', 
-						  'methods', 'stats', 'provR', 'devtools'])
-	
-	# list of (package, version) tuples
-	packages = []
-	
-	# Filter packages in user's environment by which ones were used
-	for package_dict in prov_json['activity']["environment"]["rdt:installedPackages"]:
-		if package_dict["package"] in used_packages:
-			packages.append((package_dict["package"], package_dict["version"]))
-	
-	return packages
+			   list of (package_name, version) tuples, in the order the script first
+			   loaded them
+	"""
+	# Identify libraries being used in script in one pass over all of its code, keeping
+	# the order they're first loaded in
+	code = CODE_SEPARATOR.join(command.get('rdt:name', '') for command in prov_json['activity'].values())
+	used_packages = OrderedDict.fromkeys(packages_from_code(code))
+
+	return match_package_versions(used_packages,
+								  prov_json['activity']["environment"]["rdt:installedPackages"])
+
+class JSONStream(object):
+	"""Reads a JSON document from a file a piece at a time, so that the members of its
+	   top-level objects can be decoded one by one without holding the whole document
+	Parameters
+	----------
+	handle : file
+			 text file to read the document from
+	chunk_size : int
+				 number of characters to read at a time
+	"""
+	def __init__(self, handle, chunk_size=PROV_CHUNK_SIZE):
+		self.handle = handle
+		self.chunk_size = chunk_size
+		self.decoder = json.JSONDecoder()
+		self.buffer = ''
+		self.pos = 0
+		self.eof = False
+
+	def fill(self):
+		"""Read more of the document into the buffer, dropping what has been consumed"""
+		if self.eof:
+			raise ValueError("unexpected end of JSON document")
+		# read at least as much as is buffered, so that decoding a large value that keeps
+		# running off the end of the buffer takes linear time
+		chunk = self.handle.read(max(self.chunk_size, len(self.buffer) - self.pos))
+		self.buffer = self.buffer[self.pos:] + chunk
+		self.pos = 0
+		self.eof = not chunk
+
+	def match(self, regex):
+		"""Consume a match of regex at the current position, reading more of the document
+		   if the match could run on past the end of the buffer"""
+		while True:
+			found = regex.match(self.buffer, self.pos)
+			if found and (found.end() < len(self.buffer) or self.eof):
+				self.pos = found.end()
+				return found
+			if self.eof:
+				raise ValueError("unexpected JSON at {!r}".format(self.buffer[self.pos:self.pos + 20]))
+			self.fill()
+
+	def peek(self):
+		"""Get the next character that isn't whitespace, without consuming it"""
+		while True:
+			self.pos = JSON_WHITESPACE_REGEX.match(self.buffer, self.pos).end()
+			if self.pos < len(self.buffer):
+				return self.buffer[self.pos]
+			if self.eof:
+				return ''
+			self.fill()
+
+	def expect(self, characters):
+		"""Consume the next character that isn't whitespace, which must be one of characters"""
+		character = self.peek()
+		if not character or character not in characters:
+			raise ValueError("expected one of {!r} at {!r}".format(
+				characters, self.buffer[self.pos:self.pos + 20]))
+		self.pos += 1
+		return character
+
+	def read_value(self):
+		"""Decode the next value of the document"""
+		self.peek()
+		while True:
+			try:
+				value, end = self.decoder.raw_decode(self.buffer, self.pos)
+				# a number that reaches the end of the buffer, or stops at a character that
+				# could continue it (e.g. "12." or "1e"), may run on into the next chunk
+				if (self.eof or self.buffer[self.pos] not in JSON_NUMBER_START or
+						(end < len(self.buffer) and self.buffer[end] not in JSON_NUMBER_CHARACTERS)):
+					self.pos = end
+					return value
+			except ValueError:
+				if self.eof:
+					raise
+			self.fill()
+
+	def read_key(self):
+		"""Decode the key of the next member of an object, and the colon after it"""
+		key = self.match(JSON_KEY_REGEX).group(1)
+		# only keys with escapes need decoding
+		return json.loads('"' + key + '"') if '\\' in key else key
+
+	def iter_members(self):
+		"""Decode the members of the object at the current position one at a time
+		Returns
+		-------
+		generator of (string, object)
+		"""
+		self.expect('{')
+		if self.peek() == '}':
+			self.pos += 1
+			return
+		raw_decode = self.decoder.raw_decode
+		while True:
+			# the whole member is usually in the buffer, so try decoding it in one go
+			buffer = self.buffer
+			key_match = JSON_KEY_REGEX.match(buffer, self.pos)
+			separator = None
+			if key_match and '\\' not in key_match.group(1):
+				try:
+					value, end = raw_decode(buffer, JSON_WHITESPACE_REGEX.match(buffer, key_match.end()).end())
+					separator = JSON_SEPARATOR_REGEX.match(buffer, end)
+				except ValueError:
+					pass
+			if separator and separator.end() < len(buffer):
+				self.pos = separator.end()
+				yield key_match.group(1), value
+			else:
+				# otherwise read it a piece at a time, filling the buffer as needed
+				key = self.read_key()
+				value = self.read_value()
+				separator = self.match(JSON_SEPARATOR_REGEX)
+				yield key, value
+			if separator.group(1) == '}':
+				return
+
+	def iter_sections(self, sections):
+		"""Decode the members of the given top-level objects of the document, one at a time.
+		   The members of other top-level objects are decoded and dropped one at a time.
+		Parameters
+		----------
+		sections : collection of string
+				   names of the top-level objects to decode
+		Returns
+		-------
+		generator of (string, string, object)
+		the name of the section, the member's key and its value
+		"""
+		for section, value in self.iter_top_level():
+			if value is not None:
+				continue
+			for key, member in self.iter_members():
+				if section in sections:
+					yield section, key, member
+
+	def iter_top_level(self):
+		"""Iterate over the members of the top-level object, leaving the reader positioned
+		   at the start of each member that is an object so that it can be streamed
+		Returns
+		-------
+		generator of (string, object)
+		the name of each member, and its value if it isn't an object (None if it is, in which
+		case it must be consumed, e.g. with iter_members, before moving on)
+		"""
+		self.expect('{')
+		if self.peek() == '}':
+			self.pos += 1
+			return
+		while True:
+			key = self.read_key()
+			if self.peek() == '{':
+				yield key, None
+			else:
+				yield key, self.read_value()
+			if self.match(JSON_SEPARATOR_REGEX).group(1) == '}':
+				return
+
+def read_prov_json(prov_path, chunk_size=PROV_CHUNK_SIZE):
+	"""Identify the input files, output files and packages of a script from its provenance
+	   JSON in a single streaming pass, keeping only the File entities, used and
+	   wasGeneratedBy records, activity names and the environment in memory
+	Parameters
+	----------
+	prov_path : string
+				path to a prov_*.json file written by provR
+	chunk_size : int
+				 number of characters to read at a time
+	Returns
+	-------
+	(input_files, output_files, file_locs, packages) : tuple of (list, list, dict, list)
+													   as returned by get_io_from_prov_json
+													   and get_pkgs_from_prov_json
+	"""
+	entity_to_file = {}
+	file_locs = {}
+	used_entities = []
+	generated_entities = []
+	used_packages = []
+	code_lines = []
+	installed_packages = []
+
+	with io.open(prov_path, 'r', encoding='utf-8') as handle:
+		for section, key, value in JSONStream(handle, chunk_size).iter_sections(PROV_SECTIONS):
+			if section == 'entity':
+				# get file entity names and locations
+				if value.get('rdt:type') == 'File':
+					entity_to_file[key] = value['rdt:name']
+					file_locs[value['rdt:name']] = value['rdt:location']
+			elif section == 'used':
+				used_entities.append(value['prov:entity'])
+			elif section == 'wasGeneratedBy':
+				generated_entities.append(value['prov:entity'])
+			elif key == 'environment':
+				installed_packages = value.get('rdt:installedPackages', [])
+			else:
+				# identify libraries being used in script, scanning the code in batches
+				code_lines.append(value.get('rdt:name', ''))
+				if len(code_lines) >= PACKAGE_SCAN_BATCH:
+					used_packages.extend(packages_from_code(CODE_SEPARATOR.join(code_lines)))
+					code_lines = []
+	used_packages.extend(packages_from_code(CODE_SEPARATOR.join(code_lines)))
+
+	# the entities may come after the records using them, so resolve the files at the end
+	input_files = [entity_to_file[entity] for entity in used_entities if entity in entity_to_file]
+	output_files = [entity_to_file[entity] for entity in generated_entities if entity in entity_to_file]
+	packages = match_package_versions(OrderedDict.fromkeys(used_packages), installed_packages)
+	return input_files, output_files, file_locs, packages
+
+def find_prov_files(path_to_datasets):
+	"""Find the provenance documents of every dataset
+	Parameters
+	----------
+	path_to_datasets : string
+					   path to the directory containing processed datasets
+	Returns
+	-------
+	list of (string, string, string)
+	the dataset directory name, the script (its filename in the run log without the
+	extension) and the path of each prov_data/prov_*.json
+	"""
+	prov_files = []
+	for my_doi in sorted(os.listdir(path_to_datasets)):
+		prov_dir = path_to_datasets + '/' + my_doi + '/prov_data'
+		if my_doi.startswith("doi") and os.path.isdir(prov_dir):
+			for prov_file in sorted(os.listdir(prov_dir)):
+				prov_match = PROV_FILE_REGEX.match(prov_file)
+				if prov_match:
+					prov_files.append((my_doi, prov_match.group(1), prov_dir + '/' + prov_file))
+	return prov_files
+
+def extract_prov_file(prov_file):
+	"""Extract the files and packages of one provenance document, for a pool of processes
+	Parameters
+	----------
+	prov_file : (string, string, string)
+				dataset directory name, script and path, as found by find_prov_files
+	Returns
+	-------
+	(prov_file, extracted, seconds, error) : tuple of (tuple, tuple, float, string)
+											 the document, what read_prov_json found in it
+											 (None if it failed), the time it took and the
+											 error, if any
+	"""
+	start = time.time()
+	try:
+		return prov_file, read_prov_json(prov_file[2]), time.time() - start, None
+	except Exception as error:
+		return prov_file, None, time.time() - start, repr(error)
+
+def create_prov_tables(connection):
+	"""Create the tables of extracted provenance (see PROV_TABLES) and their indexes, if needed
+	Parameters
+	----------
+	connection : sqlite3.Connection
+				 database to create the tables in
+	"""
+	for table, (columns, indexes) in PROV_TABLES.items():
+		connection.execute("CREATE TABLE IF NOT EXISTS {} ({})".format(table, columns))
+		for index_columns in indexes:
+			connection.execute("CREATE INDEX IF NOT EXISTS {}_{} ON {} ({})".format(
+				table, '_'.join(index_columns), table, ', '.join(index_columns)))
+
+def extract_prov_data(path_to_datasets, db_path, processes=None, print_status=False):
+	"""Extract the input and output files and packages of every provenance document in the
+	   datasets on a pool of processes, into tables of an SQLite database keyed by doi and
+	   script (see PROV_TABLES): "scripts" (one row per document, with any error), "file_io"
+	   (the inputs and outputs, with their locations) and "packages" (with their versions).
+	   The rows of documents that were extracted before are replaced.
+	Parameters
+	----------
+	path_to_datasets : string
+					   path to the directory containing processed datasets
+	db_path : string
+			  path to the SQLite database to write the tables to
+	processes : int
+				number of worker processes (default: the cores allocated to this job)
+	print_status : bool
+				   whether to print progress messages
+	Returns
+	-------
+	(num_scripts, error_scripts) : tuple of (int, list of string)
+								   the number of documents extracted, and the paths of those
+								   that failed
+	"""
+	prov_files = find_prov_files(path_to_datasets)
+	error_scripts = []
+	connection = sqlite3.connect(db_path)
+	try:
+		create_prov_tables(connection)
+		pool = multiprocessing.Pool(processes or available_cores())
+		try:
+			# documents vary a lot in size, so hand them out a few at a time
+			results = pool.imap_unordered(extract_prov_file, prov_files, chunksize=4)
+			for num_done, (prov_file, extracted, seconds, error) in enumerate(results, 1):
+				doi, script, prov_path = prov_file
+				for table in PROV_TABLES:
+					connection.execute("DELETE FROM {} WHERE doi = ? AND script = ?".format(table),
+									   (doi, script))
+				if extracted is None:
+					error_scripts.append(prov_path)
+					extracted = ([], [], {}, [])
+				input_files, output_files, file_locs, packages = extracted
+				connection.execute("INSERT INTO scripts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+								   (doi, script, prov_path, os.path.getsize(prov_path), len(input_files),
+									len(output_files), len(packages), seconds, error))
+				connection.executemany("INSERT INTO file_io VALUES (?, ?, ?, ?, ?)",
+									   [(doi, script, direction, filename, file_locs.get(filename))
+										for direction, filenames in [('input', input_files),
+																	 ('output', output_files)]
+										for filename in filenames])
+				connection.executemany("INSERT INTO packages VALUES (?, ?, ?, ?)",
+									   [(doi, script, package, version) for package, version in packages])
+				if print_status and num_done % 1000 == 0:
+					print("Extracted {} of {} provenance documents".format(num_done, len(prov_files)))
+		finally:
+			pool.close()
+			pool.join()
+		connection.commit()
+	finally:
+		connection.close()
+	return len(prov_files), error_scripts
+
+def write_run_log_table(run_data_df, db_path):
+	"""Write the run log to the database of extracted provenance, keyed like its tables by
+	   doi (the dataset directory name) and script (the filename without its extension),
+	   so that the two can be joined
+	Parameters
+	----------
+	run_data_df : pandas.DataFrame
+				  aggregated run log, as returned by get_runlog_data
+	db_path : string
+			  path to the SQLite database of extracted provenance
+	"""
+	run_log_df = pd.DataFrame({
+		'doi': run_data_df['doi'].astype(str).str.rstrip('/').str.split('/').str[-1],
+		'script': run_data_df['filename'].astype(str).str.replace(R_EXTENSION_REGEX, '', regex=True),
+		'run_type': run_data_df['run_type'].astype(str),
+		'error': run_data_df['error'].astype(str)})
+	connection = sqlite3.connect(db_path)
+	try:
+		run_log_df.to_sql('run_log', connection, if_exists='replace', index=False)
+		connection.execute("CREATE INDEX IF NOT EXISTS run_log_doi_script ON run_log (doi, script)")
+		connection.commit()
+	finally:
+		connection.close()
 
 """
 The following block of file decoding functions are heavily-modified versions of 
@@ -819,30 +3192,68 @@ def writeConversion(sourceFh, sourceFile, outputDir, targetFormat):
 		for line in sourceFh:
 			targetFile.write(line)
 
+def writeConversionAtomic(sourcePath, targetPath, sourceFormat, targetFormat,
+						  blockSize=ENCODING_BLOCK_SIZE):
+	"""Decode a file and encode it to another in large blocks, through a temporary file in the
+	   target's directory that replaces the target in one atomic os.replace, so that a failed
+	   or interrupted conversion leaves the target (or the original, when converting in
+	   place) untouched
+	Parameters
+	----------
+	sourcePath : string
+				 path to the file to convert
+	targetPath : string
+				 path to write the converted file to, which may be sourcePath
+	sourceFormat : string
+				   encoding of the file
+	targetFormat : string
+				   encoding to convert it to
+	blockSize : int
+				number of characters to convert at a time
+	"""
+	tempFh, tempPath = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(targetPath)),
+										prefix='.' + os.path.basename(targetPath) + '.', suffix='.tmp')
+	try:
+		# wrap the descriptor before opening the source, so that it is closed even if the
+		# source can't be opened or decoded; read with universal newlines, as 'rU' did, and
+		# write the newlines as they are read
+		with io.open(tempFh, 'w', encoding=targetFormat, newline='') as targetFh, \
+				io.open(sourcePath, 'r', encoding=sourceFormat) as sourceFh:
+			for block in iter(functools.partial(sourceFh.read, blockSize), ''):
+				targetFh.write(block)
+			targetFh.flush()
+			os.fsync(targetFh.fileno())
+		shutil.copymode(sourcePath, tempPath)
+		os.replace(tempPath, targetPath)
+	except BaseException:
+		os.remove(tempPath)
+		raise
+
 def convertFileWithDetection(sourceDir, sourceFile, outputDir, targetFormat, replace=False,
-							 logs=False):
+							 logs=False, sourceFormat=None):
 	if logs:
 		print("Converting '" + sourceFile + "'...")
 	sourcePath = os.path.join(sourceDir, sourceFile)
-	if replace:
-		os.rename(os.path.join(sourceDir, sourceFile),
-				  os.path.join(sourceDir, "__orig__" + sourceFile))
-		sourcePath = os.path.join(sourceDir,  "__orig__" + sourceFile)
+	targetPath = os.path.join(outputDir, sourceFile)
 
-	sourceFormat = get_encoding_type(sourcePath)
+	if not sourceFormat:
+		sourceFormat = get_encoding_type(sourcePath)
 	
 	try:
-		with codecs.open(sourcePath, 'rU', sourceFormat) as sourceFh:
-			writeConversion(sourceFh, sourceFile, outputDir, targetFormat)
-			if logs:
-				print('Done.')
-		if replace:
+		if not os.path.exists(outputDir):
+			os.makedirs(outputDir)
+		# converting in place replaces the original in one step, leaving no __orig__ copy
+		writeConversionAtomic(sourcePath, targetPath, sourceFormat, targetFormat)
+		if logs:
+			print('Done.')
+		if replace and os.path.abspath(targetPath) != os.path.abspath(sourcePath):
 			os.remove(sourcePath)
-		return
+		return True
 	except UnicodeDecodeError:
 		pass
 
 	print("Error: failed to convert " + sourceFile + ".")
+	return False
 
 def convertFileBestGuess(filename):
 	sourceFormats = ['ascii', 'iso-8859-1']
@@ -857,7 +3268,208 @@ def convertFileBestGuess(filename):
 """
 End of file decoding function block from Stack Overflow
 """
-def convert_r_files(path, replace=False, output_path=''):
+def detect_encoding(file_path, prefix_bytes=ENCODING_PREFIX_BYTES,
+					min_confidence=ENCODING_MIN_CONFIDENCE):
+	"""Detect the encoding of a file without running chardet over all of it: files that decode
+	   as ascii or utf-8 need no guess, others are guessed from their first prefix_bytes and
+	   only fed whole to chardet when that guess isn't confident
+	Parameters
+	----------
+	file_path : string
+				path to the file
+	prefix_bytes : int
+				   number of bytes at the start of the file to guess from
+	min_confidence : float
+					 confidence below which the guess is redone over the whole file
+	Returns
+	-------
+	(encoding, confidence, method) : tuple of (string, float, string)
+									 the encoding (None if chardet can't tell), chardet's
+									 confidence in it, and how it was found: "ascii" or
+									 "utf-8" when the file decodes as such, "prefix" or "full"
+	"""
+	decoder = codecs.getincrementaldecoder('utf-8')()
+	is_ascii = True
+	prefix = b''
+	with open(file_path, 'rb') as handle:
+		# check whether the file decodes as ascii or utf-8, a block at a time
+		try:
+			for block in iter(functools.partial(handle.read, ENCODING_BLOCK_SIZE), b''):
+				if len(prefix) < prefix_bytes:
+					prefix += block[:prefix_bytes - len(prefix)]
+				is_ascii = is_ascii and block.isascii()
+				if not is_ascii:
+					decoder.decode(block)
+			decoder.decode(b'', final=True)
+		except UnicodeDecodeError:
+			pass
+		else:
+			if is_ascii:
+				return 'ascii', 1.0, 'ascii'
+			# a byte order mark is left out of the converted file
+			return 'utf-8-sig' if prefix.startswith(codecs.BOM_UTF8) else 'utf-8', 1.0, 'utf-8'
+
+		# an ascii prefix says nothing about the bytes that failed to decode further on
+		result = chardet.detect(prefix)
+		if result['encoding'] not in (None, 'ascii') and result['confidence'] >= min_confidence:
+			return result['encoding'], result['confidence'], 'prefix'
+		detector = UniversalDetector()
+		handle.seek(0)
+		for block in iter(functools.partial(handle.read, ENCODING_BLOCK_SIZE), b''):
+			detector.feed(block)
+			if detector.done:
+				break
+		detector.close()
+		return detector.result['encoding'], detector.result['confidence'], 'full'
+
+def get_file_sha1(file_path):
+	"""Get the sha1 digest and size of a file, reading it a block at a time
+	Parameters
+	----------
+	file_path : string
+				path to the file
+	Returns
+	-------
+	(digest, size) : tuple of (string, int)
+					 sha1 hex digest and size in bytes
+	"""
+	sha1 = hashlib.sha1()
+	size = 0
+	with open(file_path, 'rb') as handle:
+		for block in iter(functools.partial(handle.read, ENCODING_BLOCK_SIZE), b''):
+			sha1.update(block)
+			size += len(block)
+	return sha1.hexdigest(), size
+
+def open_encoding_cache(cache_path):
+	"""Open the cache of detected encodings, creating it if needed
+	Parameters
+	----------
+	cache_path : string
+				 path to the SQLite database holding the cache
+	Returns
+	-------
+	connection : sqlite3.Connection
+	"""
+	connection = sqlite3.connect(cache_path, timeout=ENCODING_CACHE_TIMEOUT)
+	# let the pool's processes read the cache while another one is writing to it
+	connection.execute("PRAGMA journal_mode=WAL")
+	with connection:
+		connection.execute("CREATE TABLE IF NOT EXISTS encodings ({})".format(ENCODING_CACHE_COLUMNS))
+	return connection
+
+def lookup_encoding(cache, digest, size):
+	"""Look up a file's encoding in the cache of detected encodings
+	Parameters
+	----------
+	cache : sqlite3.Connection
+			cache, as opened by open_encoding_cache
+	digest : string
+			 sha1 hex digest of the file
+	size : int
+		   size of the file in bytes
+	Returns
+	-------
+	(encoding, confidence, method, status) : tuple of (string, float, string, string)
+											 as stored by store_encoding, or None if the
+											 file isn't in the cache
+	"""
+	return cache.execute("SELECT encoding, confidence, method, status FROM encodings "
+						 "WHERE sha1 = ? AND size = ?", (digest, size)).fetchone()
+
+def store_encoding(cache, digest, size, encoding, confidence, method, status):
+	"""Store a file's encoding in the cache of detected encodings, replacing any earlier entry.
+	   The entry is committed straight away, so the write lock is only held for this one file
+	Parameters
+	----------
+	cache : sqlite3.Connection
+			cache, as opened by open_encoding_cache
+	digest : string
+			 sha1 hex digest of the file
+	size : int
+		   size of the file in bytes
+	encoding, confidence, method : string, float, string
+								   as returned by detect_encoding
+	status : string
+			 "unchanged", "converted" or "failed"
+	"""
+	with cache:
+		cache.execute("INSERT OR REPLACE INTO encodings VALUES (?, ?, ?, ?, ?, ?)",
+					  (digest, size, encoding, confidence, method, status))
+
+def convert_r_file(source_dir, source_file, output_dir, replace=False, cache=None):
+	"""Convert an R file to utf-8, detecting its encoding with detect_encoding and leaving
+	   files already in ascii or utf-8 as they are
+	Parameters
+	----------
+	source_dir : string
+				 path to the directory containing the R file
+	source_file : string
+				  name of the R file
+	output_dir : string
+				 path to the directory to write the converted file to
+	replace : bool
+			  whether to replace the original file with the converted one
+	cache : sqlite3.Connection
+			cache of detected encodings to consult before detecting the file's encoding and to
+			store it in, as opened by open_encoding_cache (default: don't use one)
+	Returns
+	-------
+	report : dict
+			 the file's name, encoding, chardet's confidence in it, how it was detected
+			 (see detect_encoding), its size in bytes, the seconds taken, whether it was
+			 converted, whether its encoding came from the cache and any error
+	"""
+	start = time.time()
+	source_path = os.path.join(source_dir, source_file)
+	report = {'file': source_file, 'encoding': None, 'confidence': None, 'method': None,
+			  'num_bytes': None, 'converted': False, 'cached': False, 'error': ''}
+	try:
+		cached = None
+		if cache is not None:
+			digest, report['num_bytes'] = get_file_sha1(source_path)
+			cached = lookup_encoding(cache, digest, report['num_bytes'])
+		if cached:
+			encoding, report['confidence'], report['method'], status = cached
+			report['cached'] = True
+		else:
+			report['num_bytes'] = os.path.getsize(source_path)
+			encoding, report['confidence'], report['method'] = detect_encoding(source_path)
+			status = None
+		report['encoding'] = encoding
+
+		if encoding is None:
+			report['error'] = "unknown encoding"
+		elif status == 'failed':
+			# decoding the same bytes would fail the same way again
+			report['error'] = "failed to decode as " + encoding
+		elif encoding in ('ascii', 'utf-8'):
+			# already utf-8, so only copy it if it's meant to be written elsewhere
+			if not replace and os.path.abspath(output_dir) != os.path.abspath(source_dir):
+				if not os.path.exists(output_dir):
+					os.makedirs(output_dir)
+				shutil.copyfile(source_path, os.path.join(output_dir, source_file))
+		else:
+			report['converted'] = convertFileWithDetection(source_dir, source_file, output_dir, 'utf-8',
+														   replace, sourceFormat=encoding)
+			if not report['converted']:
+				report['error'] = "failed to decode as " + encoding
+
+		if cache is not None and not cached:
+			status = 'unchanged' if encoding in ('ascii', 'utf-8') else \
+				'converted' if report['converted'] else 'failed'
+			store_encoding(cache, digest, report['num_bytes'], encoding, report['confidence'],
+						   report['method'], status)
+		if cache is not None and report['converted']:
+			# the converted file is utf-8, so the next pass over it needn't decode it at all
+			converted_digest, converted_size = get_file_sha1(os.path.join(output_dir, source_file))
+			store_encoding(cache, converted_digest, converted_size, 'utf-8', 1.0, 'utf-8', 'unchanged')
+	except Exception as error:
+		report['error'] = repr(error)
+	report['seconds'] = time.time() - start
+	return report
+
+def convert_r_files(path, replace=False, output_path='', cache_path=None):
 	"""Convert all R files to utf-8 in the directory pointed to by path
 	Parameters
 	----------
@@ -868,12 +3480,88 @@ def convert_r_files(path, replace=False, output_path=''):
 				  to place converted files
 	replace : bool
 			  whether to replace original files with converted ones
+	cache_path : string
+				 path to the SQLite cache of detected encodings (default: don't use one)
+	Returns
+	-------
+	reports : list of dict
+			  one report per R file, as returned by convert_r_file
 	"""
-	targetFormat = 'utf-8'
 	# calculate correct output 
 	output_path = 'converted' if not output_path else output_path
 	outputDir = path if replace else os.path.join(path, output_path)
 	orig_files = [my_file for my_file in os.listdir(path) if\
 				  my_file.endswith(".R") or my_file.endswith(".r")]
-	for my_file in orig_files:
-		convertFileWithDetection(path, my_file, outputDir, 'utf-8', replace)
+	if not cache_path:
+		return [convert_r_file(path, my_file, outputDir, replace) for my_file in orig_files]
+	cache = open_encoding_cache(cache_path)
+	try:
+		reports = [convert_r_file(path, my_file, outputDir, replace, cache) for my_file in orig_files]
+	finally:
+		cache.close()
+	return reports
+
+def convert_dataset(dataset_path, replace=True, cache_path=None):
+	"""Convert the R files of a dataset to utf-8 (see convert_r_files), for a pool of processes
+	Parameters
+	----------
+	dataset_path : string
+				   path to the dataset directory
+	replace : bool
+			  whether to replace original files with converted ones
+	cache_path : string
+				 path to the SQLite cache of detected encodings (default: don't use one)
+	Returns
+	-------
+	reports : list of dict
+			  one report per R file, as returned by convert_r_file, with the dataset's name
+	"""
+	dataset = os.path.basename(dataset_path)
+	try:
+		reports = convert_r_files(dataset_path, replace=replace, cache_path=cache_path)
+	except Exception as error:
+		reports = [{'file': None, 'error': repr(error)}]
+	for report in reports:
+		report['dataset'] = dataset
+	return reports
+
+def convert_datasets(dataset_dir, processes=None, report_path=None, replace=True, cache_path=None):
+	"""Convert the R files of every dataset in a directory to utf-8 on a pool of processes
+	Parameters
+	----------
+	dataset_dir : string
+				  path to the directory containing the datasets
+	processes : int
+				number of worker processes (default: the cores allocated to this job)
+	report_path : string
+				  path to write a csv report of every file to (default: don't write one)
+	replace : bool
+			  whether to replace original files with converted ones
+	cache_path : string
+				 path to the SQLite cache of detected encodings, shared by the processes
+				 (default: don't use one)
+	Returns
+	-------
+	report_df : pandas.DataFrame
+				one row per R file, as returned by convert_r_file, with its dataset
+	"""
+	dataset_paths = [os.path.join(dataset_dir, dataset) for dataset in sorted(os.listdir(dataset_dir))
+					 if dataset.startswith("doi")]
+	cache_path = os.path.abspath(cache_path) if cache_path else None
+	pool = multiprocessing.Pool(processes or available_cores())
+	try:
+		# hand out one dataset at a time, since their sizes vary a lot
+		reports = [report for dataset_reports in
+				   pool.imap_unordered(functools.partial(convert_dataset, replace=replace,
+														 cache_path=cache_path),
+									   dataset_paths, chunksize=1)
+				   for report in dataset_reports]
+	finally:
+		pool.close()
+		pool.join()
+
+	report_df = pd.DataFrame(reports, columns=ENCODING_REPORT_COLUMNS)
+	report_df = report_df.sort_values(['dataset', 'file']).reset_index(drop=True)
+	if report_path:
+		report_df.to_csv(report_path, index=False)
+	return report_df
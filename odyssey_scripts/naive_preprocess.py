@@ -1,19 +1,26 @@
-import sys
 import os
-from helpers import convert_r_files, all_preproc
+import sys
+import time
+from helpers import preprocess_datasets, ENCODING_CACHE_NAME
 
-# get the directory name as command line argument
-dataset_dir = sys.argv[len(sys.argv) - 1]
-for dataset in os.listdir(dataset_dir):
-    if dataset.startswith("doi"):
-        dataset_path = os.path.join(dataset_dir, dataset)
-        # get filenames to preprocess
-        orig_files = [my_file for my_file in os.listdir(dataset_path) if\
-                      my_file.endswith(".R") or my_file.endswith(".r") and\
-                      "__preproc__" not in my_file]
+if __name__ == "__main__":
+    # usage: python naive_preprocess.py dataset_dir [summary_path] [shared_prelude] [encoding_cache]
+    # (an argument given as "" takes its default)
+    # - summary_path: where to write the per-dataset summary (default: preproc_summary.csv)
+    # - shared_prelude: a path outside of dataset_dir to write one shared copy of the prelude
+    #   to, which the preprocessed scripts source instead of inlining it (default: inline it)
+    # - encoding_cache: where to keep the cache of detected encodings, so that later passes
+    #   don't detect the encodings of unchanged scripts again (default: in dataset_dir)
+    args = sys.argv[1:] + [""] * 3
+    dataset_dir = args[0]
+    summary_path = args[1] or "preproc_summary.csv"
+    shared_prelude = args[2] or None
+    encoding_cache = args[3] or os.path.join(dataset_dir, ENCODING_CACHE_NAME)
 
-        convert_r_files(dataset_path, replace=True)
+    # preprocess the datasets in parallel on the cores allocated to the job
+    start = time.time()
+    summary_df = preprocess_datasets(dataset_dir, summary_path=summary_path,
+                                     shared_prelude=shared_prelude, encoding_cache=encoding_cache)
 
-        # for each file that ran
-        for orig_file in orig_files:
-            all_preproc(orig_file, dataset_path, "error")
\ No newline at end of file
+    print("Preprocessed {} datasets ({} failed) in {:.1f}s".format(
+        len(summary_df), (~summary_df['success']).sum(), time.time() - start))
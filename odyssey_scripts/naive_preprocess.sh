@@ -7,4 +7,4 @@
 #SBATCH -o ./logs/preproc%j.out      # File to which STDERR will be written
 #SBATCH -e ./logs/preproc%j.err      # File to which STDERR will be written
 
-python naive_preprocess.py $1
+python naive_preprocess.py "$@"
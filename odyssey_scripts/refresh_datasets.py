@@ -0,0 +1,31 @@
+import sys
+import time
+
+from helpers import refresh_datasets, restore_datasets
+
+# with "--dry-run", only write the manifest of what would be moved to the archive (to
+# refresh_manifest.csv), changing nothing; with "--restore", move what the last refresh
+# archived back into the datasets
+dry_run = "--dry-run" in sys.argv
+restore = "--restore" in sys.argv
+args = [arg for arg in sys.argv[1:] if arg not in ["--dry-run", "--restore"]]
+
+# accept commandline arguments for the dataset directory and the archive directory
+dataset_direct = args[0]
+archive_direct = args[1]
+
+start = time.time()
+if restore:
+	restored_df = restore_datasets(dataset_direct, archive_direct)
+	num_failed = (restored_df['error'] != '').sum()
+	print("Restored {} files and directories ({} failed) in {:.1f}s".format(
+		len(restored_df) - num_failed, num_failed, time.time() - start))
+else:
+	manifest_df = refresh_datasets(dataset_direct, archive_direct, dry_run=dry_run)
+	if dry_run:
+		manifest_df.to_csv("refresh_manifest.csv", index=False)
+	num_failed = (manifest_df['error'] != '').sum()
+	print("{} {} preprocessed files and {} prov_data directories of {} datasets ({} failed) in {:.1f}s".format(
+		"Would archive" if dry_run else "Archived", (manifest_df['kind'] == 'preproc').sum(),
+		(manifest_df['kind'] == 'prov_data').sum(), manifest_df['dataset'].nunique(), num_failed,
+		time.time() - start))
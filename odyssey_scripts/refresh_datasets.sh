@@ -7,4 +7,4 @@
 #SBATCH -o ./logs/provR%j.out      # File to which STDERR will be written
 #SBATCH -e ./logs/provR%j.err      # File to which STDERR will be written
 
-python refresh_datasets.py $1 $2
\ No newline at end of file
+python refresh_datasets.py $1 $2 $3
\ No newline at end of file
@@ -0,0 +1,35 @@
+from __future__ import print_function
+
+import sys
+import time
+
+from helpers import snapshot_datasets, reset_datasets, SNAPSHOT_LINK_MODES
+
+# with "--snapshot", record a pristine snapshot of every dataset that doesn't have one yet
+# (of every dataset with "--overwrite"); otherwise reset the datasets to their snapshots.
+# "--reflink", "--hardlink" or "--copy" choose how files are created (default: the
+# cheapest that works)
+mode_flags = ['--' + link_mode for link_mode in SNAPSHOT_LINK_MODES]
+link_modes = [arg[2:] for arg in sys.argv[1:] if arg in mode_flags]
+link_mode = link_modes[0] if link_modes else 'auto'
+snapshot = "--snapshot" in sys.argv
+overwrite = "--overwrite" in sys.argv
+args = [arg for arg in sys.argv[1:] if arg not in mode_flags + ["--snapshot", "--overwrite"]]
+
+# accept commandline arguments for the dataset directory and the snapshot directory
+dataset_direct = args[0]
+snapshot_direct = args[1]
+
+start = time.time()
+if snapshot:
+	summary_df = snapshot_datasets(dataset_direct, snapshot_direct, link_mode, overwrite)
+else:
+	summary_df = reset_datasets(snapshot_direct, dataset_direct, link_mode)
+failed_df = summary_df[summary_df['error'] != '']
+for _, row in failed_df.iterrows():
+	print("Failed to {} {}: {}".format("snapshot" if snapshot else "reset", row['dataset'], row['error']),
+		  file=sys.stderr)
+print("{} {} datasets ({} files, {} failed, by {}) in {:.1f}s".format(
+	"Snapshotted" if snapshot else "Reset", len(summary_df) - len(failed_df), summary_df['num_files'].sum(),
+	len(failed_df), ', '.join(sorted(set(' '.join(summary_df['link_modes']).split()))) or 'nothing',
+	time.time() - start))